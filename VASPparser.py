@@ -1,26 +1,178 @@
+import functools
+import mmap
+import re
 import time
 import os
 import numpy as np
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from parser_cache import load_array, load_cache, save_array, save_cache
+
+
+class FrameBuffer:
+    """Preallocated NumPy storage for per-step data of a fixed frame shape.
+
+    Frames are written in place into one contiguous array which grows
+    geometrically only when the reserved capacity is exhausted, so
+    appending never builds intermediate Python lists.
+    """
+
+    def __init__(self, frame_shape=(), dtype=float, capacity=64):
+        self.frame_shape = tuple(frame_shape)
+        self.count = 0
+        self.data = np.empty((max(1, capacity),) + self.frame_shape, dtype=dtype)
+
+    @classmethod
+    def from_array(cls, array):
+        """wrap an existing array without copying it"""
+        buffer = cls(array.shape[1:], array.dtype, capacity=1)
+        buffer.data = array
+        buffer.count = len(array)
+        return buffer
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, capacity):
+        """make room for at least ``capacity`` frames"""
+        if capacity > len(self.data):
+            data = np.empty((capacity,) + self.frame_shape, dtype=self.data.dtype)
+            data[:self.count] = self.data[:self.count]
+            self.data = data
+
+    def append(self, frame):
+        if self.count == len(self.data):
+            self.reserve(max(1, 2 * len(self.data)))
+        self.data[self.count] = frame
+        self.count += 1
+
+    def extend(self, frames):
+        if self.count + len(frames) > len(self.data):
+            self.reserve(max(2 * len(self.data), self.count + len(frames)))
+        self.data[self.count:self.count + len(frames)] = frames
+        self.count += len(frames)
+
+    def pop(self):
+        if self.count > 0:
+            self.count -= 1
+
+    def shrink(self):
+        """release reserved capacity when more than 1/8 of it is unused"""
+        if len(self.data) - self.count > len(self.data) // 8:
+            self.data = self.data[:self.count].copy()
+
+    def array(self):
+        return self.data[:self.count]
+
+
+class ReverseReader:
+    """
+    Searches a file from its end in fixed-size blocks, so finding the last
+    ionic step costs time proportional to its distance from the end of the
+    file, not to the size of the file. Use as a context manager.
+    """
+    block_size = 64 * 1024
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __enter__(self):
+        self.file = open(self.filename, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+    def rfind(self, marker, end=None):
+        """offset of the last ``marker`` which ends before ``end``; -1 if there is none"""
+        end = self.size if end is None else end
+        while end > 0:
+            start = max(0, end - self.block_size)
+            self.file.seek(start)
+            index = self.file.read(end - start).rfind(marker)
+            if index >= 0:
+                return start + index
+            if start == 0:
+                break
+            # keep the overlap so a marker split between two blocks is found
+            end = start + len(marker) - 1
+        return -1
+
+    def find(self, marker, start=0, end=None):
+        """offset of the first ``marker`` between ``start`` and ``end``; -1 if there is none"""
+        end = self.size if end is None else end
+        while start < end:
+            self.file.seek(start)
+            block = self.file.read(min(self.block_size, end - start))
+            index = block.find(marker)
+            if index >= 0:
+                return start + index
+            if start + len(block) >= end:
+                break
+            start += len(block) - len(marker) + 1
+        return -1
+
+    def rfind_line(self, marker, end=None, start=0):
+        """
+        offset of the last line before ``end`` (and after ``start``) which
+        begins with ``marker``, leading blanks allowed; -1 if there is none
+        """
+        end = self.size if end is None else end
+        while True:
+            position = self.rfind(marker, end)
+            if position < start:
+                return -1
+            line_start = self.rfind(b'\n', position) + 1
+            self.file.seek(line_start)
+            if not self.file.read(position - line_start).strip():
+                return line_start
+            end = position + len(marker) - 1
+
+    def read_lines(self, offset, count):
+        """``count`` lines from ``offset``; None if they are not completely written yet"""
+        self.file.seek(offset)
+        lines = [self.file.readline() for _ in range(count)]
+        if not lines or not lines[-1].endswith(b'\n'):
+            return None
+        return lines
 
 
 class OutcarParser:
-    """Class to parse a OUTCAR file"""
-
-    def __init__(self, dir, filename):
-        """parse OUTCAR and find positions of atoms and energy at each geometry"""
+    """Class to parse a OUTCAR file
+
+    The file is streamed line by line and only one ionic block is kept in
+    memory at a time. Positions, forces, energies and magnetizations are
+    written straight into preallocated NumPy arrays, so there is no upper
+    limit on the size of the OUTCAR.
+    """
+    position = "POSITION"
+    free_energy = 'FREE ENERGIE'
+    ml_free_energy = 'ML FREE ENERGIE'
+    magnetization = 'magnetization (x)'
+    total_magnetization = 'number of electron  '
+    voluntary = 'Voluntary context switches:'
+    position_of_ions = 'position of ions in cartesian'
+    magmom = 'MAGMOM'
+    ml = '(ML)'
+    iteration = "Iteration"
+    electronic_energy = "free energy    TOTEN"
+
+    def __init__(self, dir, filename, use_cache=True, frames=None):
+        """
+        parse OUTCAR and find positions of atoms and energy at each geometry.
+        With ``use_cache`` the parsed arrays are stored in a sidecar file in
+        .vaspui_cache and reused as long as the OUTCAR is unchanged.
+        ``frames`` is a slice of the ionic steps to keep, e.g. slice(None, None, 10)
+        for every 10th step, slice(-1000, None) for the last 1000 steps or
+        slice(5000, 8000) for a window. The geometries of the other steps are
+        not decoded; energy_statistics always covers all steps.
+        """
         self.filename = os.path.join(dir, filename)
-        self.data = []
-        self.energies = []
-        self.positions = []
-        self.forces = []
-        self.magnetizations = []
-        self.total_magnetizations = []
-        self.scf_energies = []
-        self.section_scf_energies = []
-        current_geom_step = None
-        current_energy_list = []
-        current_total_mags_list = []
+        self.magmoms = []
+        self.frames = self.check_frames(frames)
 
         if os.path.exists(os.path.join(dir, 'POSCAR')):
             poscar = 'POSCAR'
@@ -28,179 +180,346 @@ class OutcarParser:
             poscar = 'CONTCAR'
         self.poscar = PoscarParser(os.path.join(dir, poscar))
         self.atom_count = self.poscar.number_of_atoms()
-        self.section_position = []
-        self.magmoms = []
-        ml_counter = 0
-        mlff = False
+        self.reset()
+
+        self.file_size = os.path.getsize(self.filename)
+        suffix = self.frames_suffix() + ".npz"
+        cached = load_cache(self.filename, suffix) if use_cache else None
+        if cached is not None and cached["positions"].shape[1:] == (self.atom_count, 3):
+            print("Reading OUTCAR from cache")
+            self.load_arrays(cached)
+            return
+        self.read_from(0)
+        self.finalize()
+        print('\n')
+        if use_cache:
+            save_cache(self.filename, self.cache_arrays(), suffix)
+
+    def reset(self):
+        """forget everything parsed so far"""
+        self.offset = 0  # byte offset just after the last fully parsed line or block
+        self._positions = FrameBuffer((self.atom_count, 3))
+        self._forces = FrameBuffer((self.atom_count, 3))
+        self._magnetizations = FrameBuffer((self.atom_count,))
+        self._energies = FrameBuffer()
+        self._ion_positions = FrameBuffer((self.atom_count, 3), capacity=1)
+        self._position_count = 0  # POSITION blocks seen, decoded or not
+        self._magnetization_count = 0  # magnetization blocks seen, decoded or not
+        self._magnetization_decoded = False
+        self.decode_frames = self.frames  # the selection as absolute step numbers
+        self._total_magnetizations = []
+        self._scf_energies = []
+        self._mlff = False
+        self._current_geom_step = None
+        self._current_energy_list = []
+        self._current_total_mags_list = []
+
+    def read_from(self, offset):
+        """parse the OUTCAR starting at byte ``offset``"""
+        if offset == 0 and not self.streams_selection():
+            self.decode_frames = slice(*self.frames.indices(self.count_steps()))
+        # latin-1 maps every byte to one character, so character counts are byte offsets
+        with open(self.filename, 'r', encoding='latin-1', newline='') as file:
+            file.seek(offset)
+            self.parse_stream(file, offset)
+
+    def update(self):
+        """
+        Parse only the data appended to the OUTCAR since the last read, e.g.
+        by a running job. Returns the number of new ionic steps.
+        """
+        size = os.path.getsize(self.filename)
+        if size == self.offset:
+            return 0
+        steps = self.position_count()
+        if size < self.offset:
+            # the file was rewritten (new job in the same directory)
+            steps = 0
+        if size < self.offset or not self.streams_selection():
+            # a selection counted from the end of the file moves with the new steps
+            self.reset()
+        self.file_size = size
+        self.read_from(self.offset)
+        self.publish()
+        return self.position_count() - steps
+
+    def next_line(self, lines):
+        """next complete line; a line still being written ends the stream"""
+        line = next(lines)
+        if not line.endswith('\n'):
+            raise StopIteration
+        self._consumed += len(line)
+        return line
+
+    def read_block(self, lines, skip, count):
+        """return ``count`` lines following the header after skipping ``skip`` lines"""
+        for _ in range(skip):
+            self.next_line(lines)
+        return [self.next_line(lines) for _ in range(count)]
+
+    def parse_stream(self, lines, offset=0):
+        """
+        Consume OUTCAR lines from an iterator starting at byte ``offset``.
+        Blocks which are cut at the end of the stream (e.g. of a running job)
+        are not consumed, ``self.offset`` stays at their beginning.
+        """
+        lines = iter(lines)
+        self._consumed = offset
+        progress_interval = max(1, self.file_size // 1000)
+        next_progress = 0
         try:
-            with open(self.filename, 'r') as file:
-                lines = file.readlines()
-                text = True
-                binary = False
-        except:
-            with open(self.filename, 'rb') as file:
-                lines = file.readlines()
-                binary = True
-                text = False
-        if text:
-            position = "POSITION"
-            free_energy = 'FREE ENERGIE'
-            ml_free_energy = 'ML FREE ENERGIE'
-            magnetization = 'magnetization (x)'
-            total_magnetization = 'number of electron  '
-            voluntary = 'Voluntary context switches:'
-            position_of_ions = 'position of ions in cartesian'
-            magmom = 'MAGMOM'
-            ml = '(ML)'
-            iteration = "Iteration"
-            electronic_energy = "free energy    TOTEN"
-        if binary:
-            position = b"POSITION"
-            free_energy = b'FREE ENERGIE'
-            ml_free_energy = b'ML FREE ENERGIE'
-            magnetization = b'magnetization (x)'
-            total_magnetization = b'number of electron  '
-            voluntary = b'Voluntary context switches:'
-            position_of_ions = b'position of ions in cartesian'
-            magmom = b'magmom'
-            ml = b"(ML)"
-            iteration = b'Iteration'
-            electronic_energy = b'free energy    TOTEN'
-        lenght = len(lines)
-        for i in range(lenght):
-            progress_interval = max(1, lenght // 1000)
-
-            if i % int(progress_interval) == 0 or i == lenght:
-                print('\r', f"Reading OUTCAR, Progress: {i / lenght * 100:.1f}%", end='')
-            line = lines[i].strip()
-
-            if line.startswith(position) and line.endswith(ml):
-                mlff = True
-                self.section_position = []
-                self.section_forces = []
-                i += 2
-                current_i = i
-                for i in range(current_i, current_i + self.atom_count):
-                    line = lines[i]
-                    position_data = line.split()
-                    atom_data = [float(x) for x in position_data[:3]]
-                    force_data = [float(x) for x in position_data[3:]]
-                    self.section_position.append(atom_data)
-                    self.section_forces.append(force_data)
-                self.positions.append(self.section_position)
-                self.forces.append(self.section_forces)
-
-            elif line.startswith(position) and mlff == False:
-                self.section_position = []
-                self.section_forces = []
-                i += 2
-                current_i = i
-                for i in range(current_i, current_i + self.atom_count):
-                    line = lines[i]
-                    position_data = line.split()
-                    atom_data = [float(x) for x in position_data[:3]]
-                    force_data = [float(x) for x in position_data[3:]]
-                    self.section_position.append(atom_data)
-                    self.section_forces.append(force_data)
-                self.positions.append(self.section_position)
-                self.forces.append(self.section_forces)
-
-            elif line.startswith(ml_free_energy):
-                mlff = True
-                ml_counter += 1
-                i += 2
-                energy_data = float(lines[i].strip().split()[5])
-                self.energies.append(float(energy_data))
-
-            elif line.startswith(free_energy):
-                if mlff == True:
-                    pass
-                else:
-                    i += 2
-                    energy_data = lines[i].strip().split()[4]
-                    self.energies.append(float(energy_data))
-
-            elif line.startswith(magnetization):
-                section_magnetization = []
-                i += 4
-                current_i = i
-                for i in range(current_i, current_i + self.atom_count):
-                    line = lines[i]
-                    magnetization_data = line.split()
-                    atom_mag = float(magnetization_data[-1])
-                    section_magnetization.append(atom_mag)
-                self.magnetizations.append(section_magnetization)
-
-            elif line.startswith(total_magnetization):
-                mag = line.split()[-1]
-                current_total_mags_list.append(mag)
-
-            elif line.startswith(magmom):
-                magmom_splitted = line.split("=")[1].split()
-                magmom_section = []
-                for chunk in magmom_splitted:
-                    if "*" in chunk:
-                        chunk_splitted = chunk.split("*")
-                        magmom_section.extend([float(chunk_splitted[1])]*int(chunk_splitted[0]))
-                    else:
-                        magmom_section.append(float(chunk))
-
-                self.magmoms = magmom_section
-
-            elif iteration in line:
-                geom_step = int(line.strip().split()[2][:-1])
-                electronic_step = int(line.strip().split()[3][:-1])
-
-                if current_geom_step is None:
-                    current_geom_step = geom_step
-                if geom_step != current_geom_step:
-                    # Save the completed geometry step's energies and total magnetization
-                    self.scf_energies.append(current_energy_list)
-                    self.total_magnetizations.append(current_total_mags_list[-1])
-                    current_energy_list = []
-                    current_total_mags_list = []
-                    current_geom_step = geom_step
-
-            elif electronic_energy in line:
-                    # Extract energy value
-                    if binary:
-                        splitter = b"="
-                    elif text:
-                        splitter = "="
-                    energy_str = line.split(splitter)[-1].split()[0]
-                    current_energy_list.append(float(energy_str))
-
-            if line.startswith(voluntary):
-                if len(self.magnetizations) > 0:
-                    self.magnetizations.pop()
-
-        if self.section_position == []:
-            for i in range(lenght):
-                line = lines[i].strip()
-                if line.startswith(position_of_ions):
-                    i += 1
-                    current_i = i
-                    for i in range(current_i, current_i + self.atom_count):
-                        line = lines[i]
-                        position_data = line.split()
-                        atom_data = [float(x) for x in position_data[:3]]
-                        self.section_position.append(atom_data)
-                    self.positions.append(self.section_position)
-            # self.magnetizations = [["N/A" for atom in self.atom_count]]
-
-        if current_energy_list:
-            self.scf_energies.append(current_energy_list)
-
-        if self.energies == []:
+            while True:
+                line = self.next_line(lines)
+                if self._consumed >= next_progress:
+                    print('\r', f"Reading OUTCAR, Progress: {min(self._consumed / max(self.file_size, 1), 1) * 100:.1f}%",
+                          end='')
+                    next_progress = self._consumed + progress_interval
+                line = line.strip()
+
+                if line.startswith(self.position) and (line.endswith(self.ml) or not self._mlff):
+                    block = self.read_block(lines, 1, self.atom_count)
+                    if line.endswith(self.ml):
+                        self._mlff = True
+                    if self._position_count == 0:
+                        self.reserve_steps(self._consumed - offset)
+                    if self.decodes_step(self._position_count):
+                        values = np.array(' '.join(block).split(), dtype=float).reshape(self.atom_count, -1)
+                        self._positions.append(values[:, :3])
+                        self._forces.append(values[:, 3:6])
+                    self._position_count += 1
+
+                elif line.startswith(self.ml_free_energy):
+                    block = self.read_block(lines, 1, 1)
+                    self._mlff = True
+                    self._energies.append(float(block[0].split()[5]))
+
+                elif line.startswith(self.free_energy):
+                    if not self._mlff:
+                        block = self.read_block(lines, 1, 1)
+                        self._energies.append(float(block[0].split()[4]))
+
+                elif line.startswith(self.magnetization):
+                    block = self.read_block(lines, 3, self.atom_count)
+                    self._magnetization_decoded = self.decodes_step(self._magnetization_count)
+                    if self._magnetization_decoded:
+                        self._magnetizations.append([float(l.split()[-1]) for l in block])
+                    self._magnetization_count += 1
+
+                elif line.startswith(self.total_magnetization):
+                    self._current_total_mags_list.append(float(line.split()[-1]))
+
+                elif line.startswith(self.magmom):
+                    self.magmoms = self.parse_magmom(line)
+
+                elif line.startswith(self.position_of_ions):
+                    if self._position_count == 0:
+                        block = self.read_block(lines, 0, self.atom_count)
+                        self._ion_positions.append(np.array(' '.join(block).split(), dtype=float)
+                                                   .reshape(self.atom_count, -1)[:, :3])
+
+                elif self.iteration in line:
+                    self.add_iteration(line)
+
+                elif self.electronic_energy in line:
+                    energy_str = line.split("=")[-1].split()[0]
+                    self._current_energy_list.append(float(energy_str))
+
+                if line.startswith(self.voluntary) and self._magnetization_count > 0:
+                    # the final magnetization block follows the last ionic step
+                    if self._magnetization_decoded:
+                        self._magnetizations.pop()
+                    self._magnetization_count -= 1
+                self.offset = self._consumed
+        except StopIteration:
+            pass
+
+    def reserve_steps(self, consumed):
+        """preallocate arrays from the size of the file and the size of the first ionic step"""
+        expected = int(self.file_size / max(consumed, 1) * 1.05) + 1
+        self._energies.reserve(expected)
+        decoded = expected if self.decode_frames is None else len(range(expected)[self.decode_frames])
+        for buffer in (self._positions, self._forces, self._magnetizations):
+            buffer.reserve(decoded)
+
+    @staticmethod
+    def check_frames(frames):
+        if frames is not None and (frames.step or 1) < 1:
+            raise ValueError("the stride of the selected frames must be positive")
+        return frames
+
+    def frames_suffix(self):
+        """part of the cache file name which depends on the selected frames"""
+        if self.frames is None:
+            return ""
+        return ".frames_" + "_".join(str(value) for value in (self.frames.start, self.frames.stop, self.frames.step))
+
+    def streams_selection(self):
+        """whether the kept steps are known before the end of the file, i.e. the slice does not count from it"""
+        frames = self.frames
+        return frames is None or ((frames.start or 0) >= 0 and (frames.stop is None or frames.stop >= 0))
+
+    def decodes_step(self, step):
+        """whether ionic step number ``step`` has to be decoded while the file is read"""
+        frames = self.decode_frames
+        if frames is None:
+            return True
+        start, stride = frames.start or 0, frames.step or 1
+        return step >= start and (frames.stop is None or step < frames.stop) and (step - start) % stride == 0
+
+    def select(self, values, count=None):
+        """
+        the selected steps of per-step ``values``; values holding fewer than
+        ``count`` steps were already selected while decoding
+        """
+        if self.frames is None or (count is not None and len(values) != count):
+            return values
+        return values[self.frames]
+
+    def position_count(self):
+        """number of ionic steps with a POSITION block"""
+        return self._position_count
+
+    def magnetization_count(self):
+        return self._magnetization_count
+
+    def count_steps(self):
+        """
+        number of ionic steps in the file, found by a search for the POSITION
+        blocks without decoding them; resolves a selection counted from the end
+        of the file before it is read
+        """
+        if os.path.getsize(self.filename) == 0:
+            return 0
+        count = 0
+        mlff = False
+        ml_energy = list(LazyOutcarParser.markers).index("ml_energy")
+        with open(self.filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            limit = mm.rfind(b'\n') + 1
+            positions, kinds = LazyOutcarParser.find_markers(mm, 0, limit, limit, ("position", "ml_energy"))
+            for position, kind in zip(positions.tolist(), kinds.tolist()):
+                line_start = mm.rfind(b'\n', 0, position) + 1
+                if mm[line_start:position].strip():
+                    continue
+                if kind == ml_energy:
+                    mlff = True
+                    continue
+                ml = mm[position:mm.find(b'\n', position, limit)].rstrip().endswith(b'(ML)')
+                if (ml or not mlff) and LazyOutcarParser.block_end(mm, line_start, 2 + self.atom_count, limit):
+                    mlff = mlff or ml
+                    count += 1
+        return count
+
+    @staticmethod
+    def parse_magmom(line):
+        magmom_splitted = line.split("=")[1].split()
+        magmom_section = []
+        for chunk in magmom_splitted:
+            if "*" in chunk:
+                chunk_splitted = chunk.split("*")
+                magmom_section.extend([float(chunk_splitted[1])] * int(chunk_splitted[0]))
+            else:
+                magmom_section.append(float(chunk))
+        return magmom_section
+
+    def add_iteration(self, line):
+        geom_step = int(line.strip().split()[2][:-1])
+
+        if self._current_geom_step is None:
+            self._current_geom_step = geom_step
+        if geom_step != self._current_geom_step:
+            # Save the completed geometry step's energies and total magnetization
+            self._scf_energies.append(self._current_energy_list)
+            if self._current_total_mags_list:
+                self._total_magnetizations.append(self._current_total_mags_list[-1])
+            self._current_energy_list = []
+            self._current_total_mags_list = []
+            self._current_geom_step = geom_step
+
+    def finalize(self):
+        """trim preallocated storage and expose the parsed arrays"""
+        for buffer in (self._positions, self._forces, self._magnetizations, self._energies):
+            buffer.shrink()
+        self.publish()
+
+    def publish(self):
+        """expose the parsed data of the selected steps as public attributes"""
+        if len(self._positions) > 0 or self.position_count() > 0:
+            self.positions = self.select(self._positions.array(), self.position_count())
+        else:
+            self.positions = self._ion_positions.array()
+        self.forces = self.select(self._forces.array(), self.position_count())
+        self.magnetizations = self.select(self._magnetizations.array(), self.magnetization_count())
+        self.total_magnetizations = self.select(self._total_magnetizations)
+        self.scf_energies = self.select(self.all_scf_energies())
+
+        energies = self._energies.array()
+        if len(energies) == 0:
             print(
                 "run didn't calculated energy (eg. PARCHG file generation or other postprocessing. Energy is set to 0.")
-            self.energies = [0]
+            energies = np.zeros(1)
         else:
-            first_non_zero = next((x for x in self.energies if x != 0.0), None)
-            self.energies = [first_non_zero if x == 0.0 else x for x in self.energies]
+            non_zero = energies[energies != 0.0]
+            if len(non_zero) > 0:
+                # a copy, the buffer keeps the parsed values for the steps appended later
+                energies = np.where(energies == 0.0, non_zero[0], energies)
+        self.energy_statistics = {"count": len(energies), "min": float(energies.min()), "max": float(energies.max()),
+                                  "mean": float(energies.mean())}
+        self.energies = self.select(energies)
         if self.magmoms == []:
             self.magmoms = self.atom_count * ["0"]
-        print('\n')
+
+    def all_scf_energies(self):
+        return self._scf_energies + ([self._current_energy_list] if self._current_energy_list else [])
+
+    def cache_arrays(self):
+        """arrays describing the parsed OUTCAR, as stored in the cache sidecar"""
+        positions = self._positions if len(self._positions) > 0 else self._ion_positions
+        arrays = {
+            "positions": positions.array(),
+            "forces": self._forces.array(),
+            "magnetizations": self._magnetizations.array(),
+        }
+        arrays.update(self.step_arrays())
+        return arrays
+
+    def step_arrays(self):
+        """per-step scalars and the resumable parser state"""
+        scf_energies = self.all_scf_energies()
+        scf_lengths = [len(energies) for energies in scf_energies]
+        magmoms_found = not all(isinstance(m, str) for m in self.magmoms)
+        geom_step = -1 if self._current_geom_step is None else self._current_geom_step
+        return {
+            "energies": self._energies.array(),
+            "total_magnetizations": np.array(self._total_magnetizations, dtype=float),
+            "scf_energies": np.array([e for energies in scf_energies for e in energies], dtype=float),
+            "scf_lengths": np.array(scf_lengths, dtype=np.int64),
+            "magmoms": np.array(self.magmoms if magmoms_found else [], dtype=float),
+            "state": np.array([self.offset, self._mlff, geom_step, len(self._current_energy_list) > 0,
+                               self._position_count, self._magnetization_count], dtype=np.int64),
+        }
+
+    def load_arrays(self, arrays):
+        """restore the parser state from arrays created by ``cache_arrays``"""
+        self._positions = FrameBuffer.from_array(arrays["positions"])
+        self._forces = FrameBuffer.from_array(arrays["forces"])
+        self._magnetizations = FrameBuffer.from_array(arrays["magnetizations"])
+        self.load_step_arrays(arrays)
+        self.publish()
+
+    def load_step_arrays(self, arrays):
+        state = arrays["state"].tolist()
+        self.offset, mlff, geom_step, scf_open, self._position_count = state[:5]
+        self._magnetization_count = state[5] if len(state) > 5 else len(arrays["magnetizations"])
+        self._mlff = bool(mlff)
+        self._current_geom_step = None if geom_step < 0 else geom_step
+        self._energies = FrameBuffer.from_array(arrays["energies"])
+        self._total_magnetizations = arrays["total_magnetizations"].tolist()
+        scf_bounds = np.cumsum(arrays["scf_lengths"])[:-1]
+        self._scf_energies = [chunk.tolist() for chunk in np.split(arrays["scf_energies"], scf_bounds)] \
+            if len(arrays["scf_lengths"]) else []
+        if scf_open:
+            self._current_energy_list = self._scf_energies.pop()
+        self.magmoms = arrays["magmoms"].tolist() if len(arrays["magmoms"]) else []
 
     def find_coordinates(self):
         """returns coordinates of each electronically converged calculation step"""
@@ -215,38 +534,488 @@ class OutcarParser:
         return self.forces
 
     def find_magnetization(self):
-        search_string = 'magnetization'
-        with open(self.filename, 'r') as file:
-            file.seek(0, 2)
-            file.seek(file.tell() - 16500, 0)
-            file.readline()
-            lines = file.readlines()
-            file.seek(file.tell() - 16500, 0)
-            file.readline()
-            i = 0
-            while i < len(lines):
-                i += 1
-                line = file.readline()
-                if search_string in line:
-                    j = 0
-                    while j < 10:
-                        j += 1
-                        line = file.readline()
-                        line = line.strip()
-                        if line.startswith('1'):
-                            lines_mag = file.readlines()
-                            lines_mag = [line.strip() for line in lines_mag]
-                            break
-                    break
-        lines_mag.insert(0, line)
-        lines_mag = [el.split() for el in lines_mag]
-        lines_mag = lines_mag[:self.poscar.number_of_atoms()]
-        mag_values = [lst[-1] for lst in lines_mag]
-        return mag_values
+        """magnetic moments of the last complete magnetization block, read from the end of the file"""
+        with ReverseReader(self.filename) as reader:
+            end = None
+            while True:
+                offset = reader.rfind_line(self.magnetization.encode(), end)
+                if offset == -1:
+                    return []
+                lines = reader.read_lines(offset, 4 + self.atom_count)
+                if lines is not None:
+                    return [line.split()[-1].decode('latin-1') for line in lines[4:]]
+                end = offset
 
     def find_scf_energies(self):
         return self.scf_energies
 
+class LazyFrames:
+    """
+    Read-only sequence of per-step arrays which are decoded from the file
+    only when an item is accessed.
+    """
+
+    def __init__(self, offsets, decode):
+        self.offsets = offsets
+        self.decode = decode
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        return self.decode(int(self.offsets.data[index]))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class LazyOutcarParser(OutcarParser):
+    """
+    OUTCAR parser for very long runs which only indexes the file.
+
+    A single scan records the byte offset of every POSITION, FREE ENERGIE and
+    magnetization (x) block. Energies are read during the scan, positions,
+    forces and magnetizations of a step are decoded when the step is first
+    accessed and kept in an LRU cache of ``frame_cache_size`` blocks, so memory
+    use depends on the number of viewed frames, not on the length of the run.
+    Values edited in a decoded frame are lost once it drops out of the cache.
+    """
+    # one literal search per marker is much faster than a single alternation
+    # pattern, which cannot skip over the numeric blocks
+    markers = {kind: re.compile(re.escape(marker)) for kind, marker in (
+        ("position", b"POSITION"),
+        ("ml_energy", b"ML FREE ENERGIE"),
+        ("energy", b"FREE ENERGIE"),
+        ("magnetization", b"magnetization (x)"),
+        ("total_magnetization", b"number of electron  "),
+        ("magmom", b"MAGMOM"),
+        ("ion_positions", b"position of ions in cartesian"),
+        ("voluntary", b"Voluntary context switches:"),
+        ("iteration", b"Iteration"),
+        ("scf_energy", b"free energy    TOTEN"),
+    )}
+
+    def __init__(self, dir, filename, use_cache=True, frame_cache_size=64, frames=None):
+        self.filename = os.path.join(dir, filename)
+        self.magmoms = []
+        self.frame_cache_size = frame_cache_size
+        # the whole file is indexed, the selection only picks offsets from the index
+        self.frames = self.check_frames(frames)
+
+        if os.path.exists(os.path.join(dir, 'POSCAR')):
+            poscar = 'POSCAR'
+        else:
+            poscar = 'CONTCAR'
+        self.poscar = PoscarParser(os.path.join(dir, poscar))
+        self.atom_count = self.poscar.number_of_atoms()
+        self.reset()
+
+        self.file_size = os.path.getsize(self.filename)
+        cached = load_cache(self.filename, ".index.npz") if use_cache else None
+        if cached is not None:
+            print("Reading OUTCAR index from cache")
+            self._position_offsets = FrameBuffer.from_array(cached["position_offsets"])
+            self._magnetization_offsets = FrameBuffer.from_array(cached["magnetization_offsets"])
+            self._ion_position_offsets = FrameBuffer.from_array(cached["ion_position_offsets"])
+            self.load_step_arrays(cached)
+            self.publish()
+        else:
+            self.read_from(0)
+            self.publish()
+            if use_cache:
+                save_cache(self.filename, self.index_arrays(), ".index.npz")
+
+    def reset(self):
+        super().reset()
+        self._position_offsets = FrameBuffer(dtype=np.int64)
+        self._magnetization_offsets = FrameBuffer(dtype=np.int64)
+        self._ion_position_offsets = FrameBuffer(dtype=np.int64)
+        self.read_block_at = functools.lru_cache(maxsize=self.frame_cache_size)(self._read_block_at)
+
+    def index_arrays(self):
+        arrays = {
+            "position_offsets": self._position_offsets.array(),
+            "magnetization_offsets": self._magnetization_offsets.array(),
+            "ion_position_offsets": self._ion_position_offsets.array(),
+        }
+        arrays.update(self.step_arrays())
+        return arrays
+
+    def read_from(self, offset):
+        """index the OUTCAR starting at byte ``offset``"""
+        if os.path.getsize(self.filename) <= offset:
+            return
+        with open(self.filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            self.scan(mm, offset)
+
+    @staticmethod
+    def block_end(mm, offset, lines, limit):
+        """offset after ``lines`` complete lines starting at ``offset``; None if they are not written yet"""
+        for _ in range(lines):
+            offset = mm.find(b'\n', offset, limit)
+            if offset == -1:
+                return None
+            offset += 1
+        return offset
+
+    @classmethod
+    def find_markers(cls, mm, start, stop, limit, names=None):
+        """
+        offsets of the markers starting in [start, stop) and the index of each
+        marker in ``markers``, ordered by offset; a marker may end past
+        ``stop``, not past ``limit``. ``names`` restricts the search to some markers
+        """
+        positions = []
+        kinds = []
+        for index, (name, pattern) in enumerate(cls.markers.items()):
+            if names is not None and name not in names:
+                continue
+            end = min(stop + len(pattern.pattern), limit)
+            found = np.array([match.start() for match in pattern.finditer(mm, start, end)], dtype=np.int64)
+            found = found[found < stop]
+            positions.append(found)
+            kinds.append(np.full(len(found), index, dtype=np.int8))
+        positions = np.concatenate(positions)
+        kinds = np.concatenate(kinds)
+        order = np.lexsort((kinds, positions))
+        return positions[order], kinds[order]
+
+    def marker_matches(self, mm, start, limit):
+        """offsets and marker indices of every marker between ``start`` and ``limit``"""
+        return self.find_markers(mm, start, limit, limit)
+
+    def scan(self, mm, start):
+        # only complete lines are indexed, the rest is left for the next update
+        limit = mm.rfind(b'\n', start) + 1
+        pending = None
+        kinds = list(self.markers)
+        positions, indices = self.marker_matches(mm, start, limit)
+        for position, index in zip(positions.tolist(), indices.tolist()):
+            kind = kinds[index]
+            line_start = mm.rfind(b'\n', 0, position) + 1
+            if kind not in ("iteration", "scf_energy") and mm[line_start:position].strip():
+                continue
+            line = mm[position:mm.find(b'\n', position, limit)]
+
+            if kind == "position":
+                ml = line.rstrip().endswith(b'(ML)')
+                if ml or not self._mlff:
+                    if ml:
+                        self._mlff = True
+                    self._position_offsets.append(line_start)
+
+            elif kind in ("ml_energy", "energy"):
+                if kind == "ml_energy":
+                    self._mlff = True
+                elif self._mlff:
+                    continue
+                energy_start = self.block_end(mm, line_start, 2, limit)
+                energy_end = self.block_end(mm, energy_start, 1, limit) if energy_start is not None else None
+                if energy_end is None:
+                    pending = line_start
+                    break
+                column = 5 if kind == "ml_energy" else 4
+                self._energies.append(float(mm[energy_start:energy_end].split()[column]))
+
+            elif kind == "magnetization":
+                self._magnetization_offsets.append(line_start)
+
+            elif kind == "total_magnetization":
+                self._current_total_mags_list.append(float(line.split()[-1]))
+
+            elif kind == "magmom":
+                self.magmoms = self.parse_magmom(line.decode('latin-1'))
+
+            elif kind == "ion_positions":
+                if len(self._position_offsets) == 0:
+                    self._ion_position_offsets.append(line_start)
+
+            elif kind == "voluntary":
+                self._magnetization_offsets.pop()
+
+            elif kind == "iteration":
+                self.add_iteration(mm[line_start:position].decode('latin-1') + line.decode('latin-1'))
+
+            elif kind == "scf_energy":
+                self._current_energy_list.append(float(line.split(b"=")[-1].split()[0]))
+
+        # blocks at the very end may still be written by a running job
+        for offsets, skip in ((self._position_offsets, 2), (self._magnetization_offsets, 4),
+                              (self._ion_position_offsets, 1)):
+            if len(offsets) > 0 and offsets.data[offsets.count - 1] >= start:
+                last = int(offsets.data[offsets.count - 1])
+                if self.block_end(mm, last, skip + self.atom_count, limit) is None:
+                    offsets.pop()
+                    pending = last if pending is None else min(pending, last)
+        self.offset = limit if pending is None else pending
+
+    def update(self):
+        size = os.path.getsize(self.filename)
+        if size == self.offset:
+            return 0
+        steps = self.position_count()
+        if size < self.offset:
+            self.reset()
+            steps = 0
+        self.file_size = size
+        self.read_from(self.offset)
+        self.publish()
+        return self.position_count() - steps
+
+    def _read_block_at(self, offset, skip):
+        """decode the ``atom_count`` lines following ``skip`` lines from ``offset``"""
+        with open(self.filename, 'rb') as file:
+            file.seek(offset)
+            for _ in range(skip):
+                file.readline()
+            block = [file.readline() for _ in range(self.atom_count)]
+        return np.array(b' '.join(block).split(), dtype=float).reshape(self.atom_count, -1)
+
+    def position_count(self):
+        return len(self._position_offsets)
+
+    def magnetization_count(self):
+        return len(self._magnetization_offsets)
+
+    def kept_offsets(self, offsets):
+        """offsets of the selected steps"""
+        if self.frames is None:
+            return offsets
+        return FrameBuffer.from_array(offsets.array()[self.frames])
+
+    def publish(self):
+        super().publish()
+        position_offsets = self.kept_offsets(self._position_offsets)
+        # positions and forces of a step share one cached block
+        if len(self._position_offsets) > 0:
+            self.positions = LazyFrames(position_offsets, lambda offset: self.read_block_at(offset, 2)[:, :3])
+        else:
+            self.positions = LazyFrames(self._ion_position_offsets, lambda offset: self.read_block_at(offset, 1)[:, :3])
+        self.forces = LazyFrames(position_offsets, lambda offset: self.read_block_at(offset, 2)[:, 3:6])
+        self.magnetizations = LazyFrames(self.kept_offsets(self._magnetization_offsets),
+                                         lambda offset: self.read_block_at(offset, 4)[:, -1])
+
+
+def _decode_outcar_blocks(filename, out, first, offsets, skip, columns):
+    """decode the blocks starting at ``offsets`` into ``out[first:]``"""
+    atom_count = out.shape[1]
+    with open(filename, 'rb') as file:
+        for index, offset in enumerate(offsets, first):
+            file.seek(offset)
+            for _ in range(skip):
+                file.readline()
+            block = [file.readline() for _ in range(atom_count)]
+            values = np.array(b' '.join(block).split(), dtype=float).reshape(atom_count, -1)
+            out[index] = values[:, columns[0]:columns[1]]
+
+
+def _find_outcar_markers(filename, start, stop, limit):
+    """process pool worker: the markers of LazyOutcarParser starting in one chunk of the file"""
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return LazyOutcarParser.find_markers(mm, start, stop, limit)
+
+
+def _decode_outcar_chunk(filename, shm_name, shape, first, offsets, skip, columns):
+    """process pool worker: decode one chunk of ionic steps into a shared-memory array"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=float, buffer=shm.buf)
+        _decode_outcar_blocks(filename, out, first, offsets, skip, columns)
+        del out
+    finally:
+        shm.close()
+
+
+class ParallelOutcarParser(LazyOutcarParser):
+    """
+    OUTCAR parser for very long runs (e.g. 100k-step MLFF) which decodes the
+    ionic steps in a process pool.
+
+    The file is indexed as in LazyOutcarParser, but the search for the
+    markers, most of the time of the index, is split into ``4 * workers``
+    byte ranges searched by the pool; only the bookkeeping of the matches
+    (a few per ionic step) is left to this process. The steps are then split
+    at ionic step boundaries into ``4 * workers`` chunks and every worker
+    writes its chunk straight into one shared-memory array. The decoded
+    arrays are exposed with the same API as OutcarParser. Both stages have
+    no shared state, so a parse scales with the number of workers until disk
+    bandwidth becomes the limit; runs shorter than ``min_parallel_steps``
+    are decoded and files smaller than ``min_parallel_bytes`` searched
+    in-process.
+    """
+    min_parallel_steps = 500
+    min_parallel_bytes = 64 * 1024 ** 2
+
+    def __init__(self, dir, filename, use_cache=True, workers=None, frames=None):
+        self.workers = workers or os.cpu_count() or 1
+        super().__init__(dir, filename, use_cache=use_cache, frame_cache_size=1, frames=frames)
+
+    def marker_matches(self, mm, start, limit):
+        if limit - start < self.min_parallel_bytes or self.workers < 2:
+            return super().marker_matches(mm, start, limit)
+        bounds = np.linspace(start, limit, 4 * self.workers + 1).astype(np.int64)
+        with ProcessPoolExecutor(self.workers) as pool:
+            futures = [pool.submit(_find_outcar_markers, self.filename, int(first), int(stop), limit)
+                       for first, stop in zip(bounds[:-1], bounds[1:]) if stop > first]
+            parts = [future.result() for future in futures]
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+    def decode_blocks(self, offsets, skip, columns):
+        """decode blocks at ``offsets``, returns array of shape (steps, atoms, columns)"""
+        shape = (len(offsets), self.atom_count, columns[1] - columns[0] if columns[1] else 1)
+        if len(offsets) < self.min_parallel_steps or self.workers < 2:
+            out = np.empty(shape)
+            _decode_outcar_blocks(self.filename, out, 0, offsets, skip, columns)
+            return out
+
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+        try:
+            chunks = [chunk for chunk in np.array_split(np.arange(len(offsets)), 4 * self.workers) if len(chunk)]
+            with ProcessPoolExecutor(self.workers) as pool:
+                futures = [pool.submit(_decode_outcar_chunk, self.filename, shm.name, shape, int(chunk[0]),
+                                       offsets[chunk[0]:chunk[-1] + 1].tolist(), skip, columns)
+                           for chunk in chunks]
+                for future in futures:
+                    future.result()
+            return np.ndarray(shape, dtype=float, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def publish(self):
+        """decode the selected steps indexed since the last call and expose all arrays"""
+        if not self.streams_selection():
+            # a selection counted from the end of the file moves when steps are appended
+            self._positions = FrameBuffer((self.atom_count, 3))
+            self._forces = FrameBuffer((self.atom_count, 3))
+            self._magnetizations = FrameBuffer((self.atom_count,))
+        done = len(self._positions)
+        offsets = self.kept_offsets(self._position_offsets).array()
+        if len(offsets) > done:
+            blocks = self.decode_blocks(offsets[done:], 2, (0, 6))
+            self._positions.extend(blocks[:, :, :3])
+            self._forces.extend(blocks[:, :, 3:6])
+        offsets = self._ion_position_offsets.array()
+        if len(self._position_offsets) == 0 and len(offsets) > len(self._ion_positions):
+            self._ion_positions.extend(self.decode_blocks(offsets[len(self._ion_positions):], 1, (0, 3)))
+
+        offsets = self.kept_offsets(self._magnetization_offsets).array()
+        # the magnetization repeated at the end of a finished run is dropped from the index
+        while len(self._magnetizations) > len(offsets):
+            self._magnetizations.pop()
+        if len(offsets) > len(self._magnetizations):
+            blocks = self.decode_blocks(offsets[len(self._magnetizations):], 4, (-1, None))
+            self._magnetizations.extend(blocks[:, :, 0])
+        OutcarParser.publish(self)
+
+
+class FinalStateOutcarParser(OutcarParser):
+    """
+    Reads only the last complete ionic step of an OUTCAR by searching the file
+    backwards from its end: its geometry, forces, energy, magnetization and
+    electronic energies. The rest of the file is never read, which is enough
+    e.g. for the end points of a NEB.
+    """
+
+    def __init__(self, dir, filename):
+        self.filename = os.path.join(dir, filename)
+        self.magmoms = []
+
+        if os.path.exists(os.path.join(dir, 'POSCAR')):
+            poscar = 'POSCAR'
+        else:
+            poscar = 'CONTCAR'
+        self.poscar = PoscarParser(os.path.join(dir, poscar))
+        self.atom_count = self.poscar.number_of_atoms()
+        self.frames = None
+        self.reset()
+
+        self.file_size = os.path.getsize(self.filename)
+        with ReverseReader(self.filename) as reader:
+            self.read_final_step(reader)
+        self.publish()
+
+    def frames_suffix(self):
+        """the final step is a selection of its own"""
+        return ".final"
+
+    def read_final_step(self, reader):
+        atom_count = self.atom_count
+        last_position = reader.rfind_line(self.position.encode())
+        header = reader.read_lines(last_position, 1) if last_position != -1 else None
+        self._mlff = header is not None and header[0].rstrip().endswith(self.ml.encode())
+
+        # energy of the last step which is completely written
+        marker, column = (self.ml_free_energy, 5) if self._mlff else (self.free_energy, 4)
+        end = None
+        while True:
+            energy_offset = reader.rfind_line(marker.encode(), end)
+            if energy_offset == -1:
+                break
+            lines = reader.read_lines(energy_offset, 3)
+            if lines is not None:
+                self._energies.append(float(lines[2].split()[column]))
+                break
+            end = energy_offset
+
+        # geometry and forces printed before that energy
+        end = energy_offset if energy_offset != -1 else None
+        while True:
+            position = reader.rfind_line(self.position.encode(), end)
+            if position == -1:
+                break
+            lines = reader.read_lines(position, 2 + atom_count)
+            if lines is not None and (not self._mlff or lines[0].rstrip().endswith(self.ml.encode())):
+                values = np.array(b' '.join(lines[2:]).split(), dtype=float).reshape(atom_count, -1)
+                self._positions.append(values[:, :3])
+                self._forces.append(values[:, 3:6])
+                break
+            end = position
+        if position == -1:
+            position = reader.rfind_line(self.position_of_ions.encode(), end)
+            lines = reader.read_lines(position, 1 + atom_count) if position != -1 else None
+            if lines is not None:
+                self._ion_positions.append(np.array(b' '.join(lines[1:]).split(), dtype=float)
+                                           .reshape(atom_count, -1)[:, :3])
+        if position == -1:
+            return
+
+        # the rest of the step lies between the previous POSITION block and this one
+        step_start = max(reader.rfind_line(self.position.encode(), position), 0)
+        magnetization = reader.rfind_line(self.magnetization.encode(), position, step_start)
+        lines = reader.read_lines(magnetization, 4 + atom_count) if magnetization != -1 else None
+        if lines is not None:
+            self._magnetizations.append([float(line.split()[-1]) for line in lines[4:]])
+        total_magnetization = reader.rfind_line(self.total_magnetization.encode(), position, step_start)
+        if total_magnetization != -1:
+            self._total_magnetizations.append(float(reader.read_lines(total_magnetization, 1)[0].split()[-1]))
+
+        end = position
+        while True:
+            end = reader.rfind(self.electronic_energy.encode(), end)
+            if end < step_start:
+                break
+            line = reader.read_lines(end, 1)[0].decode('latin-1')
+            self._current_energy_list.insert(0, float(line.split("=")[-1].split()[0]))
+
+        # MAGMOM is echoed from the INCAR before the first electronic iteration
+        head = reader.find(self.iteration.encode(), 0, position)
+        magmom = reader.rfind_line(self.magmom.encode(), head if head != -1 else position)
+        if magmom != -1:
+            self.magmoms = self.parse_magmom(reader.read_lines(magmom, 1)[0].decode('latin-1').strip())
+
+    def update(self):
+        """only the final state is read, appended steps are not followed"""
+        return 0
+
+
 class PoscarParser:
     """class to parse POSCAR / CONTCAR files"""
 
@@ -461,121 +1230,174 @@ class PoscarParser:
         return self.parse_coordinates()[2]
 
 class DOSCARparser:
-
-    def __init__(self, file):
-        self.dataset_up = []
-        self.small_dataset_up = []
-        self.dataset_down = []
-        self.small_dataset_down = []
+    """
+    Projected DOS of a DOSCAR file. All projections are read into one array
+
+    dos  (atoms, orbitals, spin, NEDOS) float64, spin 0 is up and 1 is down
+
+    and dataset_up/dataset_down are (atoms, orbitals, NEDOS) views of it, so
+    ``dataset_up[atom][orbital]`` is one contiguous curve. The spin-down
+    curves of a DOSCAR without spin polarization are zero.
+    """
+    # number of projection columns (up and down interleaved) and the orbitals they hold,
+    # a DOSCAR without spin polarization has half of the columns
+    ORBITAL_SETS = {
+        2: ('s', [["s"]]),
+        8: ('p', [["s"], ["py", "pz", "px"]]),
+        18: ('d', [["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"]]),
+        32: ('f', [["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"],
+                   ["fy(3x2-y2)", "fxyz", "fyz2", "fz3", "fxz2", "fz(x2-y2)", "fx(x2-3y2)"]]),
+    }
+
+    def __init__(self, file, use_cache=True):
+        """
+        With ``use_cache`` the parsed data is stored in .vaspui_cache, the
+        projections as a .npy file which is memory-mapped when the unchanged
+        DOSCAR is opened again.
+        """
+        self.make_empty_DOS_data()
         if os.path.exists(file):
             if os.path.getsize(file) != 0:
-                with open(file, 'r') as file:
-                    lines = file.readlines()
-                    self.number_of_atoms = int(lines[0].strip().split()[0])
-
-                    try:
-                        info_line_full = lines[5]
-                        info_line = info_line_full.strip().split()
-                        stop_nrg, start_nrg, self.nedos, self.efermi = [info_line[i] for i in range(4)]
-                        self.nedos = int(self.nedos)
-                        dos_parts = list(self.splitter(lines[6:], self.nedos + 1))
-
-                        total_dos = [line.strip().split() for line in dos_parts[0]]
-                        self.total_dos_energy = [float(x) for x in list(map(lambda sublist: sublist[0], total_dos))]
-                        self.total_dos_alfa = [float(x) for x in list(map(lambda sublist: sublist[1], total_dos))]
-                        self.total_dos_beta = [float(x) for x in list(map(lambda sublist: sublist[2], total_dos))]
-                        dos_parts = [list for list in dos_parts[1:]]
-                        dos_parts = [[line.strip().split() for line in sublist] for sublist in dos_parts]
-                        self.dos_parts = [[[float(x) for x in list[1:]] for list in sublist] for sublist in dos_parts]
-                        del lines
-                        if len(self.dos_parts[0][0]) == 18:
-                            self.element_block = 'd'
-                            self.orbitals = ["s", "py", "pz", "px", "dxy", "dyz", "dz", "dxz", "dx2y2"]
-                            self.orbital_types = [["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"]]
-                        elif len(self.dos_parts[0][0]) == 8:
-                            self.element_block = 'p'
-                            self.orbitals = ["s", "py", "pz", "px"]
-                            self.orbital_types = [["s"], ["py", "pz", "px"]]
-                        elif len(self.dos_parts[0][0]) == 32:
-                            self.element_block = 'f'
-                            self.orbitals = ["s", "py", "pz", "px", "dxy", "dyz", "dz", "dxz", "dx2y2", "fy(3x2-y2)",
-                                             "fxyz", "fyz2",
-                                             "fz3", "fxz2", "fz(x2-y2)", "fx(x2-3y2)"]
-                            self.orbital_types = [["s"], ["py", "pz", "px"], ["dxy", "dyz", "dz", "dxz", "dx2y2"],
-                                                  ["fy(3x2-y2)", "fxyz", "fyz2",
-                                                   "fz3", "fxz2", "fz(x2-y2)", "fx(x2-3y2)"]]
-                        elif len(self.dos_parts[0][0]) == 2:
-                            self.element_block = 's'
-                            self.orbitals = ["s"]
-                            self.orbital_types = [["s"]]
-                        else:
-                            '''raise error'''
-                            pass
-
-                        for i in range(self.number_of_atoms):
-                            for j in range(0, 2 * len(self.orbitals), 2):
-                                self.small_dataset_up.append(list(map(lambda sublist: sublist[j], self.dos_parts[i])))
-                            self.dataset_up.append(self.small_dataset_up)
-                            self.small_dataset_up = []
-                        for i in range(self.number_of_atoms):
-                            for j in range(1, 2 * len(self.orbitals) + 1, 2):
-                                self.small_dataset_down.append(list(map(lambda sublist: sublist[j], self.dos_parts[i])))
-                            self.dataset_down.append(self.small_dataset_down)
-                            self.small_dataset_down = []
-                    except:
-                        print("DOSCAR file is invalid. It will not be proccesed")
-                        for i in range(self.number_of_atoms):
-                            self.small_dataset_up.append([0])
-                            self.small_dataset_down.append([0])
-                            self.total_dos_alfa = [0]
-                            self.total_dos_beta = [0]
-                            self.total_dos_energy = [0]
-                        self.orbitals = ["none"]
-                        self.orbital_types = ["none"]
-                        self.nedos = 0
-                        self.efermi = 0
+                if use_cache and self.load_cached(file):
+                    print("Reading DOSCAR from cache")
+                    return
+                with open(file, 'r') as f:
+                    lines = f.readlines()
+                self.number_of_atoms = int(lines[0].strip().split()[0])
+
+                try:
+                    self.read_blocks(lines)
+                except Exception:
+                    print("DOSCAR file is invalid. It will not be proccesed")
+                    self.make_empty_DOS_data()
+                    return
+                del lines
+                if use_cache:
+                    self.save_cached(file)
             else:
                 print('DOSCAR file is empty')
-                self.make_empty_DOS_data()
         else:
             print('no DOSCAR found!')
-            self.make_empty_DOS_data()
+
+    def read_blocks(self, lines):
+        """read the total DOS and the projection of every atom, one bulk conversion per block"""
+        info_line = lines[5].strip().split()
+        stop_nrg, start_nrg, nedos, efermi = info_line[:4]
+        nedos = int(nedos)
+
+        total_dos = self.read_block(lines, 6, nedos)
+        columns = len(lines[6 + nedos + 1].split()) - 1
+        spins = 2 if columns in self.ORBITAL_SETS else 1
+        self.element_block, self.orbital_types = self.ORBITAL_SETS[columns if spins == 2 else 2 * columns]
+        self.orbitals = [orbital for group in self.orbital_types for orbital in group]
+
+        dos = np.zeros((self.number_of_atoms, len(self.orbitals), 2, nedos))
+        for atom in range(self.number_of_atoms):
+            # every atom block starts with a repeated info line
+            block = self.read_block(lines, 6 + (atom + 1) * (nedos + 1), nedos)
+            dos[atom, :, :spins] = block[:, 1:].reshape(nedos, -1, spins).transpose(1, 2, 0)
+
+        self.nedos = nedos
+        self.efermi = efermi
+        self.total_dos_energy = total_dos[:, 0]
+        self.total_dos_alfa = total_dos[:, 1]
+        # without spin polarization the third column is the integrated DOS
+        self.total_dos_beta = total_dos[:, 2] if spins == 2 else np.zeros(nedos)
+        self.set_dos(dos)
+
+    @staticmethod
+    def read_block(lines, start, nedos):
+        """the ``nedos`` lines after ``start`` as a (nedos, columns) array"""
+        block = np.loadtxt(lines[start:start + nedos], ndmin=2)
+        if len(block) != nedos:
+            raise ValueError("incomplete DOSCAR block")
+        return block
+
+    def save_cached(self, file):
+        # the projections first, they are only used when the sidecar written after them is valid
+        if not save_array(file, self.dos, ".dos.npy"):
+            return
+        save_cache(file, {
+            "number_of_atoms": np.array(self.number_of_atoms),
+            "nedos": np.array(self.nedos),
+            "efermi": np.array(self.efermi),
+            "total_dos": np.array([self.total_dos_energy, self.total_dos_alfa, self.total_dos_beta]),
+            "orbitals": np.array(self.orbitals),
+            "channel_sizes": np.array([len(group) for group in self.orbital_types]),
+            "element_block": np.array(self.element_block),
+        }, ".doscar.npz")
+
+    def load_cached(self, file):
+        cached = load_cache(file, ".doscar.npz")
+        if cached is None:
+            return False
+        orbitals = [str(orbital) for orbital in cached["orbitals"]]
+        nedos = int(cached["nedos"])
+        number_of_atoms = int(cached["number_of_atoms"])
+        dos = load_array(file, ".dos.npy", (number_of_atoms, len(orbitals), 2, nedos))
+        if dos is None:
+            return False
+        self.number_of_atoms = number_of_atoms
+        self.nedos = nedos
+        self.efermi = str(cached["efermi"])
+        self.total_dos_energy, self.total_dos_alfa, self.total_dos_beta = cached["total_dos"]
+        self.orbitals = orbitals
+        bounds = np.cumsum(cached["channel_sizes"])
+        self.orbital_types = [orbitals[start:stop] for start, stop in zip(np.concatenate([[0], bounds[:-1]]), bounds)]
+        self.element_block = str(cached["element_block"])
+        self.set_dos(dos)
+        return True
+
+    def set_dos(self, dos):
+        self.dos = dos
+        self.dataset_up = dos[:, :, 0]
+        self.dataset_down = dos[:, :, 1]
 
     def make_empty_DOS_data(self):
-        for i in range(1):
-            self.small_dataset_up.append([0])
-            self.small_dataset_down.append([0])
-            self.total_dos_alfa = [0]
-            self.total_dos_beta = [0]
-            self.total_dos_energy = [0]
+        self.total_dos_alfa = np.zeros(1)
+        self.total_dos_beta = np.zeros(1)
+        self.total_dos_energy = np.zeros(1)
         self.orbitals = ["none"]
         self.orbital_types = ["none"]
         self.nedos = 0
         self.efermi = 0
-
-    def splitter(self, list, size):
-        for i in range(0, len(list), size):
-            yield list[i:i + size - 1]
+        self.set_dos(np.zeros((0, 1, 2, 0)))
 
 class BaderParser:
     def __init__(self, file):
         pass
 
 class XDATCARParser:
-    def __init__(self, file):
+    configuration_markers = (b"Direct", b"Cartesian")
 
+    def __init__(self, file, read_frames=True):
+        """
+        read_frames=False leaves ``coordinates`` as None for a plain XDATCAR,
+        its frames are then read one at a time with iter_frames().
+        read_frames="final" reads only the last configuration.
+        """
         print("reading XDATCAR file")
         self.file = file
         self.xdatcar_file_exists = False
         self.xdatcar_diff_exists = False
         self.length = self.find_steps(file)
+        # end of the last configuration read by read_appended() and the number read so far
+        self.offset = 0
+        self.read_count = 0
+        self.header = None
 
-        self.read_xdatcar(file)
+        self.read_xdatcar(file, read_frames)
 
-    def read_xdatcar(self, file):
-        from ase.io.vasp import read_vasp_xdatcar
+    def read_xdatcar(self, file, read_frames=True):
         f = os.path.split(file)
-        if f[-1] == "XDATCAR":
+        if f[-1] == "XDATCAR" and read_frames == "final":
+            self.coordinates = [self.final_frame()]
+            self.xdatcar_file_exists = True
+        elif f[-1] == "XDATCAR" and not read_frames:
+            self.coordinates = None
+            self.xdatcar_file_exists = True
+        elif f[-1] == "XDATCAR":
+            from ase.io.vasp import read_vasp_xdatcar
             self.atoms = read_vasp_xdatcar(file, index=slice(None))
             self.coordinates = [at.positions for at in self.atoms]
             self.xdatcar_file_exists = True
@@ -588,27 +1410,123 @@ class XDATCARParser:
                 print("could not read XDATCAR diff file or file does not exist")
 
     def find_steps(self, file):
-        search_strings = ["Step", "Direct"]
-
-        with open(self.file, 'r') as file:
-            file.seek(0, 2)
-            file.seek(file.tell() - 16500, 0)
-            lines = file.readlines()
-            file.seek(file.tell() - 16500, 0)
-            file.readline()
-            i = 0
-            while i < len(lines):
-                i += 1
-                line = file.readline()
-                if any(item in line for item in search_strings):
-                    if len(line.strip().split()) == 2:
-                        step = int(line.strip().split()[1])
-                    elif len(line.strip().split()) == 3:
-                        step = int(line.strip().split()[2])
-                    else:
-                        raise ValueError("Error! XDATCAR file is corrupted!")
-            return int(step)
+        """number of the last configuration, read from the end of the file"""
+        with ReverseReader(self.file) as reader:
+            offset = max(reader.rfind_line(marker) for marker in self.configuration_markers + (b"Step",))
+            if offset == -1:
+                raise ValueError("Error! XDATCAR file is corrupted!")
+            reader.file.seek(offset)
+            words = reader.file.readline().split()
+        if len(words) not in (2, 3):
+            raise ValueError("Error! XDATCAR file is corrupted!")
+        return int(words[-1].split(b"=")[-1])
+
+    @staticmethod
+    def parse_header(header):
+        """scale, cell and number of atoms from the split lines of a header"""
+        # VASP 4 files have no line with element symbols
+        vectors = -5 if header[-2][0].isalpha() else -4
+        scale = float(header[vectors - 1][0])
+        cell = np.array(header[vectors:vectors + 3], dtype=float) * scale
+        atom_count = sum(int(n) for n in header[-1])
+        return scale, cell, atom_count
+
+    @staticmethod
+    def to_cartesian(kind, block, scale, cell):
+        if kind.lower().startswith("direct"):
+            return block @ cell
+        return block * scale
+
+    def final_frame(self):
+        """cartesian coordinates of the last complete configuration, searched from the end of the file"""
+        with open(self.file, 'r') as fd:
+            header = []
+            for line in fd:
+                if line.split() and line.split()[0].lower().startswith(("direct", "cartesian")):
+                    break
+                if line.split():
+                    header.append(line.split())
+        scale, cell, atom_count = self.parse_header(header)
+
+        with ReverseReader(self.file) as reader:
+            end = None
+            while True:
+                offset = max(reader.rfind_line(marker, end) for marker in self.configuration_markers)
+                if offset == -1:
+                    return None
+                lines = reader.read_lines(offset, 1 + atom_count)
+                if lines is not None:
+                    break
+                end = offset
+            # variable-cell files repeat the header before each configuration
+            previous = max(reader.rfind_line(marker, offset) for marker in self.configuration_markers)
+            if previous != -1:
+                previous_lines = reader.read_lines(previous, 1 + atom_count)
+                previous += sum(len(line) for line in previous_lines)
+                reader.file.seek(previous)
+                header = [line.split() for line in reader.file.read(offset - previous).splitlines() if line.split()]
+                if len(header) >= 6:
+                    scale, cell, atom_count = self.parse_header([[word.decode() for word in words] for words in header])
+
+        block = np.array([line.split()[:3] for line in lines[1:]], dtype=float)
+        return self.to_cartesian(lines[0].split()[0].decode(), block, scale, cell)
+
+    def iter_frames(self):
+        """
+        yields cartesian coordinates of each configuration, reading the file
+        one configuration at a time. Variable-cell files repeat the header
+        before each configuration, so the cell is updated whenever one is found.
+        """
+        with open(self.file, 'r') as fd:
+            header = []
+            for line in fd:
+                words = line.split()
+                if not words:
+                    continue
+                if not words[0].lower().startswith(("direct", "cartesian")):
+                    header.append(words)
+                    continue
+                if len(header) >= 6:
+                    scale, cell, atom_count = self.parse_header(header)
+                header = []
+                block = np.array([fd.readline().split()[:3] for _ in range(atom_count)], dtype=float)
+                yield self.to_cartesian(words[0], block, scale, cell)
 
+    def read_appended(self, known=0):
+        """
+        cartesian coordinates of the configurations completed after ``self.offset``,
+        e.g. by a running job; the first ``known`` configurations of the file are
+        skipped without decoding them. Advances the offset
+        """
+        frames = []
+        with open(self.file, 'r', encoding='latin-1', newline='') as fd:
+            fd.seek(self.offset)
+            consumed = self.offset
+            header = []
+            for line in fd:
+                if not line.endswith('\n'):
+                    break
+                consumed += len(line)
+                words = line.split()
+                if not words:
+                    continue
+                if not words[0].lower().startswith(("direct", "cartesian")):
+                    header.append(words)
+                    continue
+                if len(header) >= 6:
+                    self.header = self.parse_header(header)
+                header = []
+                scale, cell, atom_count = self.header
+                block = [fd.readline() for _ in range(atom_count)]
+                if not all(line.endswith('\n') for line in block):
+                    break
+                consumed += sum(len(line) for line in block)
+                if self.read_count >= known:
+                    block = np.array([line.split()[:3] for line in block], dtype=float)
+                    frames.append(self.to_cartesian(words[0], block, scale, cell))
+                self.read_count += 1
+                self.offset = consumed
+        return frames
 
     def read_diff_xdatcar(self, file):
         """
@@ -658,12 +1576,17 @@ class XDATCARParser:
 
 
 class OSZICARParser:
-    def __init__(self, file):
+    def __init__(self, file, final_only=False):
+        """final_only reads just the energy of the last ionic step from the end of the file"""
         self.file = file
+        self.offset = 0
         self.oszicar_file_exists = False
         print("reading OSZICAR file")
         try:
-            self.nrgs = self.read_oszicar(self.file)
+            if final_only:
+                self.nrgs = np.array([self.read_final_energy(self.file)])
+            else:
+                self.nrgs = self.read_oszicar(self.file)
             self.oszicar_file_exists = True
         except Exception as e:
             self.oszicar_file_exists = False
@@ -671,13 +1594,43 @@ class OSZICARParser:
             print(e)
 
     def read_oszicar(self, file):
-        with open(file, 'r') as f:
-            lines = f.readlines()
+        return np.array(self.read_appended(file))
+
+    @staticmethod
+    def read_final_energy(file):
+        with ReverseReader(file) as reader:
+            end = None
+            while True:
+                position = reader.rfind(b"F=", end)
+                if position == -1:
+                    raise ValueError(f"no ionic step in {file}")
+                line = reader.read_lines(reader.rfind(b'\n', position) + 1, 1)
+                if line is not None:
+                    return float(line[0].split()[2])
+                end = position
+
+    def read_appended(self, file):
+        """energies from the complete lines after ``self.offset``; advances the offset"""
         nrgs = []
-        for line in lines:
-            if "F=" in line:
-                nrgs.append(float(line.split()[2]))
-        return np.array(nrgs)
+        with open(file, 'r', encoding='latin-1', newline='') as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                self.offset += len(line)
+                if "F=" in line:
+                    nrgs.append(float(line.split()[2]))
+        return nrgs
+
+    def update(self):
+        """read energies appended by a running job; returns the number of new ionic steps"""
+        if os.path.getsize(self.file) < self.offset:
+            self.offset = 0
+            self.nrgs = np.zeros(0)
+        nrgs = self.read_appended(self.file)
+        if nrgs:
+            self.nrgs = np.concatenate([self.nrgs, nrgs])
+        return len(nrgs)
 
 if __name__ == "__main__":
     doscar = DOSCARparser("D:\\syncme-from-c120\\modelowanie DFT\\czasteczki\\O2\\DOSCAR")
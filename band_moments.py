@@ -0,0 +1,117 @@
+"""
+Band moments of every atom and s/p/d/f channel of all DOSCARs below a
+directory, e.g. d-band centres for catalyst screening. Runs without a GUI:
+
+    python band_moments.py calculations -o moments.csv --window -10 2 --workers 8
+
+Each directory with a DOSCAR gives one row per atom, channel and spin
+(up, down and their sum). Energies are relative to the Fermi energy.
+A file name ending with .parquet is written with pandas.
+"""
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from VASPparser import DOSCARparser, PoscarParser
+from parser_cache import CACHE_DIR_NAME
+from dos_engine import BandMoments, DosAggregator, DosBroadening
+
+HEADER = ("directory", "atom", "element", "channel", "spin") + BandMoments.COLUMNS
+
+
+def find_runs(root):
+    """directories below ``root`` which hold a non-empty DOSCAR"""
+    runs = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        if CACHE_DIR_NAME in subdirectories:
+            subdirectories.remove(CACHE_DIR_NAME)
+        if "DOSCAR" in files and os.path.getsize(os.path.join(directory, "DOSCAR")) > 0:
+            runs.append(directory)
+    return runs
+
+
+def atom_elements(directory, atom_count):
+    """element of every atom from CONTCAR or POSCAR, "X" when they are missing"""
+    for name in ("CONTCAR", "POSCAR"):
+        path = os.path.join(directory, name)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            try:
+                symbols = PoscarParser(path).list_atomic_symbols()
+            except Exception as e:
+                print(f"could not read {path}: {e}")
+                continue
+            if len(symbols) == atom_count:
+                return symbols
+    return ["X"] * atom_count
+
+
+def run_moments(directory, window=None, smearing=0.0, kind="gaussian"):
+    """table rows of one calculation"""
+    doscar = DOSCARparser(os.path.join(directory, "DOSCAR"))
+    if doscar.nedos == 0:
+        return []
+    elements = atom_elements(directory, len(doscar.dos))
+    sums = DosAggregator(doscar.dos, elements, doscar.orbital_types, doscar.orbitals)
+    curves = sums.channel_curves()
+    # up, down and both spins of every atom and channel
+    curves = np.concatenate([curves, curves.sum(axis=2, keepdims=True)], axis=2)
+    if smearing > 0:
+        curves = DosBroadening(doscar.total_dos_energy).smooth(curves, smearing, kind=kind)[1]
+    moments = BandMoments(doscar.total_dos_energy, float(doscar.efermi), window).compute(curves)
+
+    rows = []
+    for atom, element in enumerate(elements):
+        for channel, channel_name in enumerate(sums.channel_names):
+            for spin, spin_name in enumerate(("up", "down", "total")):
+                rows.append((directory, atom + 1, element, channel_name, spin_name)
+                            + tuple(float(value) for value in moments[atom, channel, spin]))
+    return rows
+
+
+def write_table(rows, output):
+    if output.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError:
+            print("no pandas module, cannot write parquet")
+            return False
+        pd.DataFrame(rows, columns=HEADER).to_parquet(output, index=False)
+        return True
+    with open(output, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="band centre, width, skewness, kurtosis and filling of DOSCARs")
+    parser.add_argument("root", help="directory searched recursively for DOSCAR files")
+    parser.add_argument("-o", "--output", default="band_moments.csv", help="CSV or .parquet file")
+    parser.add_argument("--window", nargs=2, type=float, metavar=("EMIN", "EMAX"),
+                        help="energy window relative to the Fermi energy, eV")
+    parser.add_argument("--smearing", type=float, default=0.0, help="FWHM of the smearing, eV")
+    parser.add_argument("--kind", choices=("gaussian", "lorentzian"), default="gaussian")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all CPUs by default")
+    args = parser.parse_args(argv)
+
+    runs = find_runs(args.root)
+    print(f"found {len(runs)} DOSCAR files")
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_moments, run, args.window, args.smearing, args.kind) for run in runs]
+        for run, future in zip(runs, futures):
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                print(f"could not process {run}: {e}")
+    if write_table(rows, args.output):
+        print(f"wrote {len(rows)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ from PyQt5.QtWidgets import (
     QLabel, QComboBox, QPushButton, QSlider
 )
 
+from volumetric_slabs import axis_average, plane_average
+
 
 # =========================================================
 # PHYSICAL AVERAGING FUNCTIONS
@@ -22,8 +24,8 @@ def axis_average_real(data, lattice_vectors, axis):
         2 = along c
     """
 
-    # average over the other two axes
-    avg = np.mean(data, axis=tuple(i for i in range(3) if i != axis))
+    # average over the other two axes, slab by slab
+    avg = axis_average(data, axis)
 
     # length of lattice vector
     vec = lattice_vectors[axis]
@@ -43,7 +45,7 @@ def plane_average_real(data, lattice_vectors, axis):
     axis = axis perpendicular to plane
     """
 
-    plane = np.mean(data, axis=axis)
+    plane = plane_average(data, axis)
 
     axes = [0, 1, 2]
     axes.remove(axis)
@@ -67,7 +69,8 @@ def plane_slice_real(data, lattice_vectors, axis, index):
 
     max_index = data.shape[axis] - 1
     index = int(np.clip(index, 0, max_index))
-    plane = np.take(data, index, axis=axis)
+    # indexed, so an alfa or beta density is computed for the plane only
+    plane = data[(slice(None),) * axis + (index,)]
 
     axes = [0, 1, 2]
     axes.remove(axis)
@@ -185,13 +188,9 @@ class ChargeAveragingDialog(QDialog):
             return data_obj.chop(data_obj.all_numbers[1], 1)
 
         elif channel == "alfa":
-            if data_obj.alfa is None:
-                data_obj.calc_alfa_beta()
             return data_obj.alfa
 
         elif channel == "beta":
-            if data_obj.beta is None:
-                data_obj.calc_alfa_beta()
             return data_obj.beta
 
         return None
@@ -8,7 +8,10 @@ from PyQt5.QtWidgets import QWidget, QVBoxLayout, QApplication, QLabel, \
 from PyQt5 import QtCore
 import numpy as np
 import subprocess, tempfile
-from process_CHGCAR import CHGCARParser
+from process_CHGCAR import CHGCARParser, CHGCARPoolLoader, VaspChargeDensity
+from parser_cache import load_cache, scratch_array
+from volumetric_slabs import ContourCache, apply_operation as apply_grid_operation, contour_slabs, tile_grid
+from config import AppConfig
 try:
     from memory_profiler import profile
 except ImportError:
@@ -26,15 +29,23 @@ class DialogWIndow(QDialog):
     are done, e.g. reading CHGCAR file
     """
     def __init__(self, file_path):
-        """ Initialize """
+        """ Initialize; ``file_path`` may be a list of files read in parallel """
         super().__init__()
         self.setModal(True)
         layout = QVBoxLayout()
         #self.setMinimumSize(300,300)
-        self.header = QLabel("processing CHGCAR file...")
-        self.file_size = os.path.getsize(file_path) / 1024 / 1024
+        file_paths = file_path if isinstance(file_path, (list, tuple)) else [file_path]
+        self.header = QLabel("processing CHGCAR file..." if len(file_paths) == 1
+                             else f"processing {len(file_paths)} CHGCAR files...")
+        sizes = [os.path.getsize(path) / 1024 / 1024 for path in file_paths]
+        self.file_size = sum(sizes)
         self.size_label = QLabel(f"The size of a file is {self.file_size: .2f}  MB")
-        self.timing_label = QLabel(f"Reading will take approx. {self.estimate_timing(self.file_size):.1f} seconds")
+        suffix = VaspChargeDensity.cache_suffix(VaspChargeDensity.CACHE_SUFFIX, AppConfig.chgcar_dtype)
+        if all(load_cache(path, suffix) is not None for path in file_paths):
+            self.timing_label = QLabel("Reading parsed data from cache")
+        else:
+            # files are read at the same time, the largest one takes longest
+            self.timing_label = QLabel(f"Reading will take approx. {self.estimate_timing(max(sizes)):.1f} seconds")
         self.label1 = QLabel('processing CHGCAR file...')
         layout.addWidget(self.header)
         layout.addWidget(self.size_label)
@@ -58,6 +69,57 @@ class DialogWIndow(QDialog):
     def change_label(self, text):
         self.label1.setText(text)
 
+class ContourWorker(QtCore.QThread):
+    """ contours one level of a grid pyramid in the background: the value
+    range, the block-averaged level and the mesh are all computed in the
+    worker. A cancelled worker stops after the slab it is at and its mesh
+    is thrown away
+
+    Parameters
+    ----------------------
+    pyramid : GridPyramid
+        levels of the density to contour
+    key : tuple
+        (file, channel, eps, level) under which the mesh is cached
+    """
+
+    def __init__(self, pyramid, level, eps, contour_type, basis, key):
+        super().__init__()
+        self.pyramid = pyramid
+        self.level = level
+        self.eps = eps
+        self.contour_type = contour_type
+        self.basis = basis
+        self.key = key
+        self.scalar_range = None
+        self.contours = None
+        self.cancelled = False
+
+    def run(self):
+        # the same thresholds at every level
+        min_val, max_val = self.pyramid.value_range()
+        largest_value = np.max([np.abs(max_val), np.abs(min_val)])
+        self.scalar_range = self.eps * largest_value
+
+        # Set isosurface values
+        if self.contour_type == "spin" :
+            if largest_value> 0.5:
+                values = [-self.eps * largest_value, self.eps * largest_value]
+            else:
+                print("there is no spin polarization. Your structure is non-magnetic")
+                values = [largest_value]
+        else:
+            values = [-self.eps * largest_value, self.eps * largest_value]
+
+        grid = self.pyramid.level(self.level, lambda: self.cancelled)
+        if grid is None:
+            return
+        self.contours = contour_slabs(grid, values, self.basis, lambda: self.cancelled)
+
+    def cancel(self):
+        self.cancelled = True
+
+
 class ChgcarVis(QWidget):
     """ this class provides functionality for reading, displaying and
     controlling the electron charge density plots.
@@ -69,6 +131,8 @@ class ChgcarVis(QWidget):
 
     """
     load_data = QtCore.pyqtSignal(str)
+    # grid points of the coarse grid contoured while the eps slider is dragged
+    PREVIEW_POINTS = 64 ** 3
     def __init__(self,structure_variable_control):
         """ Initialize """
         super().__init__()
@@ -83,6 +147,8 @@ class ChgcarVis(QWidget):
         self.chg_threads = []
         self.chg_file_paths = []
         self.chgcar_data = {}
+        self.contour_cache = ContourCache()
+        self.contour_workers = []
         self.structure_variable_control.atom_deleted.connect(self.delete_atom)
         self.structure_variable_control.all_atoms_deleted.connect(self.create_header_when_deleted)
 
@@ -154,6 +220,7 @@ class ChgcarVis(QWidget):
         self.chg_eps_slider.sliderReleased.connect(self.update_eps)
         self.chg_eps_slider.sliderReleased.connect(self.add_contours)
         self.chg_eps_slider.valueChanged.connect(self.change_eps_label)
+        self.chg_eps_slider.valueChanged.connect(self.preview_contours)
 
         self.eps_layout.addWidget(self.chg_eps_text)
         self.eps_layout.addWidget(self.chg_eps_value_label)
@@ -480,7 +547,7 @@ class ChgcarVis(QWidget):
 
         self.chg_file_paths.append(file_path)
         # read CHGCAR using ASE VaspChargeDensity class in CHGCARParser
-        thread = CHGCARParser(file_path, 1)
+        thread = CHGCARParser(file_path, 1, AppConfig.chgcar_dtype)
         thread.file_path = file_path
 
         self.chg_threads.append(thread)
@@ -493,7 +560,7 @@ class ChgcarVis(QWidget):
         thread.finished.connect(lambda: self._on_chgcar_finished(thread, init))
 
     def _on_chgcar_finished(self, thread, init):
-        self.chgcar_data[thread.file_path] = thread
+        self.set_chgcar_data(thread.file_path, thread)
 
         if init:
             self.add_contours()
@@ -503,13 +570,54 @@ class ChgcarVis(QWidget):
         thread.deleteLater()
         self.chg_threads.remove(thread)
 
+    def set_chgcar_data(self, path, parser):
+        """ store a (re)loaded file; meshes of an earlier load of the path are stale """
+        if path == self.chg_file_path:
+            self.cancel_contours()
+        self.contour_cache.discard(path)
+        self.chgcar_data[path] = parser
+
+    def load_chgcar_files(self, file_paths):
+        """
+        read several files at once, each in a worker process, e.g. the
+        operands of File Math
+        """
+        self.progress_window = DialogWIndow(file_paths)
+        self.progress_window.setWindowFlags(QtCore.Qt.WindowStaysOnTopHint)
+        self.progress_window.show()
+        self.chg_plotter.setup_render_thread(0)
+
+        loader = CHGCARPoolLoader(file_paths, dtype=AppConfig.chgcar_dtype)
+        self.chg_threads.append(loader)
+        loader.progress.connect(self.progress_window.update_progress)
+        loader.change_label.connect(self.progress_window.change_label)
+        loader.start()
+        loader.finished.connect(lambda: self._on_chgcar_files_finished(loader))
+
+    def _on_chgcar_files_finished(self, loader):
+        for path, parser in loader.parsers.items():
+            self.set_chgcar_data(path, parser)
+        self.close_progress_window()
+        self._after_reading()
+
+        loader.deleteLater()
+        self.chg_threads.remove(loader)
+
         if hasattr(self, "volume_editing_window"):
-            self.volume_editing_window.notify_chgcar_loaded(thread.file_path)
+            self.volume_editing_window.notify_chgcar_loaded(list(loader.parsers))
 
     def update_eps(self):
         """ update isosurface value with slider """
         self.eps = self.chg_eps_slider.value() / 100
 
+    def preview_contours(self, value):
+        """ contours of a coarse grid while the eps slider is dragged, the
+        full grid is contoured when it is released """
+        if not self.chg_eps_slider.isSliderDown() or self.chg_file_path not in self.chgcar_data:
+            return
+        self.eps = value / 100
+        self.add_contours(preview=True)
+
     def change_eps_label(self, value):
         """ updates the isosurface value label
 
@@ -522,144 +630,81 @@ class ChgcarVis(QWidget):
 
         self.chg_eps_value_label.setText(str(value/100))
 
-    def get_chopping_factor(self):
-        voxel_size = self.chgcar_data[self.chg_file_path].voxel_size()
-        optimal_size = 0.25
-        grid = self.chgcar_data[self.chg_file_path].chgcar._grid
-        common_divisors = self.chgcar_data[self.chg_file_path].common_divisors(*grid)
-        if voxel_size[0] < optimal_size:
-            chop = optimal_size / voxel_size[0]
-            if int(chop) not in common_divisors:
-                chop = int(chop) - 1
-            else:
-                chop = int(chop)
-            return chop
-        else:
-            return 1
-
-    def get_volumetric_data(self, chopping_factor):
-        if self.contour_type == "total":
-            volumetric_data = self.chgcar_data[self.chg_file_path].chop(
-                self.chgcar_data[self.chg_file_path].all_numbers[0],
-                chopping_factor
-            )
-        elif self.contour_type == "spin":
-            volumetric_data = self.chgcar_data[self.chg_file_path].chop(
-                self.chgcar_data[self.chg_file_path].all_numbers[1],
-                chopping_factor
-            )
-        elif self.contour_type == "alfa":
-            if self.chgcar_data[self.chg_file_path].alfa is None:
-                self.chgcar_data[self.chg_file_path].calc_alfa_beta()
-                volumetric_data = self.chgcar_data[self.chg_file_path].chop(
-                    self.chgcar_data[self.chg_file_path].alfa,
-                    chopping_factor
-                )
-            else:
-                volumetric_data = self.chgcar_data[self.chg_file_path].alfa
-
-        elif self.contour_type == "beta":
-            if self.chgcar_data[self.chg_file_path].beta is None:
-                self.chgcar_data[self.chg_file_path].calc_alfa_beta()
-                volumetric_data = self.chgcar_data[self.chg_file_path].chop(
-                    self.chgcar_data[self.chg_file_path].beta,
-                    chopping_factor
-                )
-            else:
-                volumetric_data = self.chgcar_data[self.chg_file_path].beta
-
-        if volumetric_data is None:
+    def get_volumetric_data(self, level=0):
+        """ grid of the current contour type, ``level`` times block-averaged (0 is the full grid) """
+        data = self.chgcar_data[self.chg_file_path]
+        if data.density(self.contour_type) is None:
             print("Invalid contour type")
             return
-        else:
-            return volumetric_data
+        return data.pyramid(self.contour_type).level(level)
 
     #@profile
-    def add_contours(self):
-        """ creates the isosurface contours from charge density data """
+    def add_contours(self, preview=False):
+        """ creates the isosurface contours from charge density data. They are
+        meshed in a background thread and shown when ready. With ``preview``
+        a coarse level of the grid is contoured, fast enough to follow the
+        eps slider while it is dragged """
 
         if self.chgcar_data[self.chg_file_path] == None:
             # if no charge data was loaded, print message
             print("no data was found")
             return
-        chopping_factor = self.get_chopping_factor()
-
-        if self.current_contour_actor is not None:
-            self.chg_plotter.remove_actor(self.current_contour_actor)
-
-        volumetric_data = self.get_volumetric_data(chopping_factor)
-
-        max_val = np.max(volumetric_data)
-        min_val = np.min(volumetric_data)
-        largest_value = np.max([np.abs(max_val), np.abs(min_val)])
-
+        if self.get_volumetric_data() is None:
+            return
+        pyramid = self.chgcar_data[self.chg_file_path].pyramid(self.contour_type)
+        level = pyramid.preview_level(self.PREVIEW_POINTS) if preview else 0
         basis = self.chgcar_data[self.chg_file_path].atoms.cell[:]
 
-        nx, ny, nz = volumetric_data.shape
-
-        from vtk.util import numpy_support
-        vtk_data = numpy_support.numpy_to_vtk(num_array=volumetric_data.ravel(order='F'), deep=False, array_type=vtk.VTK_DOUBLE)
-        vtk_data.SetName("values")
-
-        # Create vtkImageData
-        image_data = vtk.vtkImageData()
-        image_data.SetDimensions(nx, ny, nz)
-        image_data.SetSpacing(1 / (nx - 1), 1 / (ny - 1), 1 / (nz - 1))
-        image_data.SetOrigin(0.0, 0.0, 0.0)
-        image_data.GetPointData().SetScalars(vtk_data)
-
-        # Cast to vtkUnstructuredGrid (vtkTransformFilter needs PointSet)
-        geometry_filter = vtk.vtkImageDataToPointSet()
-        geometry_filter.SetInputData(image_data)
-        geometry_filter.Update()
-
-        # Now warp the ImageData using vtkTransformFilter
-        transform = vtk.vtkTransform()
-        basis = basis.T
-        transform.SetMatrix([
-            basis[0, 0], basis[0, 1], basis[0, 2], 0,
-            basis[1, 0], basis[1, 1], basis[1, 2], 0,
-            basis[2, 0], basis[2, 1], basis[2, 2], 0,
-            0, 0, 0, 1
-        ])
-
-        # Apply transform using a transform filter
-        transform_filter = vtk.vtkTransformFilter()
-        transform_filter.SetTransform(transform)
-        transform_filter.SetInputConnection(geometry_filter.GetOutputPort())  # ImageData → UnstructuredGrid
-        transform_filter.Update()
-
-        # === Replace PyVista contour with vtkContourFilter ===
-        contour_filter = vtk.vtkContourFilter()
-        contour_filter.SetInputConnection(transform_filter.GetOutputPort())
-
-        # Set isosurface values
-        if self.contour_type == "spin" :
-            if largest_value> 0.5:
-                contour_filter.SetValue(0, -self.eps * largest_value)
-                contour_filter.SetValue(1, self.eps * largest_value)
-            else:
-                print("there is no spin polarization. Your structure is non-magnetic")
-                contour_filter.SetValue(0, largest_value)
-        else:
-            contour_filter.SetValue(0, -self.eps * largest_value)
-            contour_filter.SetValue(1, self.eps * largest_value)
+        # a newer request makes the one still being meshed useless
+        self.cancel_contours()
+        key = (self.chg_file_path, self.contour_type, round(self.eps, 6), level)
+        contours = self.contour_cache.get(key)
+        if contours is not None and pyramid.extremes is not None:
+            min_val, max_val = pyramid.extremes
+            self.show_contours(contours, self.eps * max(abs(min_val), abs(max_val)))
+            return
 
-        contour_filter.Update()
+        # the value range, the level and the mesh are computed in another
+        # thread, so the window stays responsive even for a large grid
+        worker = ContourWorker(pyramid, level, self.eps, self.contour_type, basis, key)
+        self.contour_workers.append(worker)
+        worker.finished.connect(lambda: self._on_contours_finished(worker))
+        worker.start()
+
+    def _on_contours_finished(self, worker):
+        self.contour_workers.remove(worker)
+        worker.deleteLater()
+        if worker.cancelled or worker.contours is None:
+            return
+        self.contour_cache.put(worker.key, worker.contours)
+        self.show_contours(worker.contours, worker.scalar_range)
+
+    def cancel_contours(self, wait=False):
+        """ stop meshing contours which are no longer wanted; with ``wait``
+        until the workers no longer read the grids, e.g. before they are edited """
+        for worker in self.contour_workers:
+            worker.cancel()
+            if wait:
+                worker.wait()
+
+    def show_contours(self, contours, scalar_range):
+        """ replaces the contours on the plotter with the mesh ``contours`` """
+        if self.current_contour_actor is not None:
+            self.chg_plotter.remove_actor(self.current_contour_actor)
 
         # === Create lookup table with your colors ===
         lut = vtk.vtkLookupTable()
         lut.SetNumberOfTableValues(2)
-        lut.SetRange(-self.eps * largest_value, self.eps * largest_value)
+        lut.SetRange(-scalar_range, scalar_range)
         lut.SetTableValue(0, 0.0, 1.0, 1.0, 1.0)  # Light blue
         lut.SetTableValue(1, 1.0, 1.0, 0.0, 1.0)  # Yellow
         lut.Build()
 
         # === Create a mapper ===
         mapper = vtk.vtkPolyDataMapper()
-        mapper.SetInputConnection(contour_filter.GetOutputPort())  # Use your vtkContourFilter output
+        mapper.SetInputData(contours)
         mapper.SetLookupTable(lut)
-        mapper.SetScalarRange(-self.eps * largest_value, self.eps * largest_value)
+        mapper.SetScalarRange(-scalar_range, scalar_range)
         mapper.SetColorModeToMapScalars()
         mapper.ScalarVisibilityOn()
 
@@ -679,6 +724,7 @@ class ChgcarVis(QWidget):
     def clear_contours(self):
         """ removes the contours from plotter """
 
+        self.cancel_contours()
         actor = self.current_contour_actor
         self.chg_plotter.remove_actor(actor)
         print('cleared')
@@ -742,7 +788,7 @@ class ChgcarVis(QWidget):
         """
         if density_type not in ['total', 'spin', 'alfa', 'beta']:
             return
-        data = self.get_volumetric_data(1)
+        data = self.get_volumetric_data()
 
         x_start, x_stop, y_start, y_stop, z_start, z_stop = [x if x >= 0 else 0 for x in self.box_bounds]
         box_min = np.array([x_start, y_start, z_start])
@@ -753,10 +799,19 @@ class ChgcarVis(QWidget):
         grid_max = list(self.chgcar_data[self.chg_file_path].chgcar._grid)
         x_max, y_max, z_max = [min(v, l) for v, l in zip(grid_max, [x_max, y_max, z_max])]
 
+        # no worker may read the grid while it is edited
+        self.cancel_contours(wait=True)
         data[x_min: x_max, y_min: y_max, z_min: z_max] *= factor
+        self.grids_changed()
         if add_contours:
             self.add_contours()
 
+    def grids_changed(self):
+        """ forget the pyramids and meshes of the current file after its grids were edited """
+        self.cancel_contours()
+        self.chgcar_data[self.chg_file_path].reset_pyramids()
+        self.contour_cache.discard(self.chg_file_path)
+
     def flip_spin_density(self):
         """ flip spin density in a box defined by a box bounds."""
         self.change_charge_density('spin', -1)
@@ -781,9 +836,10 @@ class ChgcarVis(QWidget):
         z = matrix[0]
         y = matrix[1]
         x = matrix[2]
-        total_supercell = np.tile(self.chgcar_data[self.chg_file_path].all_numbers[0], (z, y, x))
-        spin_supercell = np.tile(self.chgcar_data[self.chg_file_path].all_numbers[1], (z, y, x))
+        total_supercell = self.tile_density(self.chgcar_data[self.chg_file_path].all_numbers[0], (z, y, x), "total")
+        spin_supercell = self.tile_density(self.chgcar_data[self.chg_file_path].all_numbers[1], (z, y, x), "spin")
         self.chgcar_data[self.chg_file_path].all_numbers = [total_supercell, spin_supercell]
+        self.grids_changed()
 
         multiplication = x * y * z
         aug_dict, aug_leftovers = self.chgcar_data[self.chg_file_path].read_augmentation(self.chgcar_data[self.chg_file_path].aug)
@@ -798,6 +854,15 @@ class ChgcarVis(QWidget):
         self.chgcar_data[self.chg_file_path].aug_diff = new_aug_diff
         print("done")
 
+    def tile_density(self, grid, reps, channel):
+        """ ``grid`` repeated ``reps`` times, written straight into one array;
+        the supercell of a grid mapped from the cache goes to a scratch file there """
+        out = None
+        if isinstance(grid, np.memmap) and grid.mode == "c":
+            shape = tuple(n * r for n, r in zip(grid.shape, reps))
+            out = scratch_array(self.chg_file_path, f".{channel}-supercell.npy.part", shape, grid.dtype)
+        return tile_grid(grid, reps, out)
+
     def make_atoms_supercell(self, matrix, write_buffer=True):
         """ make a supercell from atoms. If CONTCAR or POSCAR exists, constraints will be added
         Args:
@@ -1195,35 +1260,44 @@ class VolumetricDataEditingWindow(QWidget):
             return
 
         self.operations_queue = []  # store (operation, filepath)
-        self.pending_loads = 0
 
         for row in self.rows:
             op, path = row.get_data()
             if path:
                 self.operations_queue.append((op, path))
-                self.pending_loads += 1
-                self.parent.create_chgcar_data(path, init=False)
 
-        if self.pending_loads == 0:
+        if len(self.operations_queue) == 0:
             print("Nothing to load")
             return
 
-        print("Loading files asynchronously...")
+        # every file not loaded yet is read at the same time in its own process
+        paths = []
+        for op, path in self.operations_queue:
+            if path not in self.parent.chgcar_data and path not in paths:
+                paths.append(path)
+        if len(paths) == 0:
+            self.perform_math()
+            return
 
-    def notify_chgcar_loaded(self, path):
-        self.pending_loads -= 1
+        print("Loading files in parallel...")
+        self.parent.load_chgcar_files(paths)
 
-        if self.pending_loads == 0:
-            print("All files loaded — performing math")
-            self.perform_math()
+    def notify_chgcar_loaded(self, paths):
+        print("All files loaded — performing math")
+        self.perform_math()
 
     def perform_math(self):
         main_chg = self.parent.chgcar_data[self.parent.chg_file_path]
+        # the main grids may be changed in place, no worker may be reading them
+        self.parent.cancel_contours(wait=True)
 
         main_total = main_chg.all_numbers[0]
         main_spin = main_chg.all_numbers[1]
 
         for op, path in self.operations_queue:
+            if path not in self.parent.chgcar_data:
+                print("Could not load:", path)
+                continue
             thread = self.parent.chgcar_data[path]
 
             grid_total = thread.all_numbers[0]
@@ -1234,28 +1308,26 @@ class VolumetricDataEditingWindow(QWidget):
                 continue
 
             # ---- TOTAL CHANNEL ----
-            self.apply_operation(main_total, grid_total, op)
+            main_total = self.apply_operation(main_total, grid_total, op, "total")
 
             # ---- SPIN CHANNEL ----
-            self.apply_operation(main_spin, grid_spin, op)
+            main_spin = self.apply_operation(main_spin, grid_spin, op, "spin")
+
+        main_chg.all_numbers = [main_total, main_spin]
+        self.parent.grids_changed()
 
         # add contours
         self.parent.add_contours()
         print("Math completed.")
 
-    def apply_operation(self, target, other, op):
-        if op == "add":
-            target += other
-
-        elif op == "subtract":
-            target -= other
-
-        elif op == "multiply":
-            target *= other
-
-        elif op == "divide":
-            with np.errstate(divide='ignore', invalid='ignore'):
-                np.divide(target, other, out=target, where=other != 0)
-
-
-
+    def apply_operation(self, target, other, op, channel="total"):
+        """
+        Apply ``op`` slab by slab and return the result. A grid mapped from the
+        cache is not changed in place, that would keep every changed page in
+        memory; its result goes to a scratch file in the cache directory
+        instead, removed again with the result.
+        """
+        out = None
+        if isinstance(target, np.memmap) and target.mode == "c":
+            out = scratch_array(self.parent.chg_file_path, f".{channel}-math.npy.part", target.shape, target.dtype)
+        return apply_grid_operation(target, other, op, out)
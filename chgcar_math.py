@@ -0,0 +1,191 @@
+"""
+Arithmetic on CHGCAR/PARCHG files which never holds a whole grid in memory,
+e.g. the charge density difference of an adsorbate and a surface:
+
+    python chgcar_math.py "a - b - c" AB/CHGCAR A/CHGCAR B/CHGCAR -o CHGCAR_diff
+
+The files are named a, b, c, ... in the order given. The expression may
+use + - * / ** numbers and brackets, e.g. "0.5 * (a + b)". All files are read
+in lockstep, a block of values at a time, and the result is written as
+it is computed, so memory use does not depend on the size of the grid.
+The total density and, if every file has one, the magnetization density
+are combined; augmentation charges are not written. The structure is
+taken from the first file and the input files are never changed.
+"""
+import argparse
+import ast
+import string
+
+import numpy as np
+
+from grid_writer import LINE_VALUES, format_lines
+
+# values of every file combined at once
+BLOCK_VALUES = 5 * 2 ** 16
+ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow,
+                 ast.USub, ast.UAdd, ast.Constant, ast.Name, ast.Load)
+
+
+class DensityStream:
+    """
+    The density blocks of a CHG file read a given number of values at a time.
+    Values are divided by the cell volume, as in VaspChargeDensity.
+    """
+    READ_CHUNK = 4 * 1024 ** 2
+
+    def __init__(self, filename):
+        import ase.io.vasp as aiv
+        self.filename = filename
+        with open(filename) as fd:
+            atoms = aiv.read_vasp_configuration(fd)
+            fd.readline()
+            self.grid_line = fd.readline()
+            self.data_start = fd.tell()
+        self.volume = atoms.get_volume()
+        self.grid = tuple(int(n) for n in self.grid_line.split()[:3])
+        self.count = int(np.prod(self.grid))
+        self.raw = open(filename, 'rb')
+        self.raw.seek(self.data_start)
+        self.start_block()
+
+    def close(self):
+        self.raw.close()
+
+    def header(self):
+        """the text of the file up to the first density block, grid line included"""
+        with open(self.filename, 'rb') as raw:
+            return raw.read(self.data_start).decode()
+
+    def start_block(self):
+        self.left = self.count
+        self.per_line = None
+        self.tail = b''
+        self.pending = np.empty(0)
+
+    def parse_chunk(self):
+        """values of the next whole lines of the block, never past its last line"""
+        chunk = self.raw.read(self.READ_CHUNK)
+        data = self.tail + chunk
+        if not data:
+            raise ValueError(f"{self.filename}: density block ends {self.left} values early")
+        if self.per_line is None:
+            first_line = data.split(b'\n', 1)[0]
+            self.per_line = max(1, len(first_line.split()))
+        lines_left = -(-self.left // self.per_line)
+        line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+        if len(line_ends) >= lines_left:
+            cut = line_ends[lines_left - 1] + 1
+        elif len(line_ends) > 0:
+            cut = line_ends[-1] + 1
+        elif not chunk:
+            cut = len(data)
+        else:
+            # a line longer than a chunk
+            self.tail = data
+            return np.empty(0)
+        values = np.fromstring(data[:cut], sep=' ')[:self.left]
+        if len(values) == 0 and not chunk:
+            raise ValueError(f"{self.filename}: density block ends {self.left} values early")
+        self.left -= len(values)
+        self.tail = data[cut:]
+        return values
+
+    def read(self, count):
+        """the next ``count`` values of the current block"""
+        parts = []
+        missing = count
+        while missing > 0:
+            if len(self.pending) == 0:
+                self.pending = self.parse_chunk()
+            part = self.pending[:missing]
+            self.pending = self.pending[len(part):]
+            parts.append(part)
+            missing -= len(part)
+        return np.concatenate(parts) / self.volume
+
+    def next_block(self):
+        """
+        Skip the augmentation charges to the magnetization block. Returns
+        False if the file has none.
+        """
+        self.raw.seek(self.raw.tell() - len(self.tail))
+        tokens = self.grid_line.split()
+        while True:
+            line = self.raw.readline()
+            if not line:
+                return False
+            if line.decode(errors='replace').split() == tokens:
+                self.start_block()
+                return True
+
+
+def operand_names(count):
+    if count > len(string.ascii_lowercase):
+        raise ValueError(f"at most {len(string.ascii_lowercase)} files can be combined")
+    return list(string.ascii_lowercase[:count])
+
+
+def compile_expression(expression, names):
+    """code of an arithmetic ``expression`` of the operands ``names``, ValueError if it is anything else"""
+    tree = ast.parse(expression, mode='eval')
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError(f"{type(node).__name__} is not allowed in {expression!r}")
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise ValueError(f"unknown operand {node.id!r}, the files are {', '.join(names)}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError(f"{node.value!r} is not a number")
+    return compile(tree, '<expression>', 'eval')
+
+
+def stream_math(expression, filenames, output, format='chgcar'):
+    """write ``expression`` of the densities in ``filenames`` to the CHGCAR ``output``"""
+    streams = [DensityStream(filename) for filename in filenames]
+    try:
+        names = operand_names(len(streams))
+        code = compile_expression(expression, names)
+        first = streams[0]
+        for stream in streams[1:]:
+            if stream.grid != first.grid:
+                raise ValueError(f"grid of {stream.filename} {stream.grid} differs from {first.grid}")
+        # whole lines per block, so blocks continue each other's lines
+        block = BLOCK_VALUES // LINE_VALUES[format] * LINE_VALUES[format]
+        with open(output, 'w') as out:
+            out.write(first.header())
+            for spin in (False, True):
+                if spin:
+                    has_spin = [stream.next_block() for stream in streams]
+                    if not all(has_spin):
+                        if any(has_spin):
+                            print("not every file has a magnetization density, only the total density is written")
+                        break
+                    out.write(first.grid_line)
+                for start in range(0, first.count, block):
+                    size = min(block, first.count - start)
+                    operands = {name: stream.read(size) for name, stream in zip(names, streams)}
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        result = eval(code, {"__builtins__": {}}, operands)
+                    result = np.broadcast_to(np.asarray(result, dtype=float), (size,)) * first.volume
+                    out.write(format_lines(result, format))
+                    done = (start + size) / first.count * 100
+                    print(f"{'magnetization' if spin else 'total'} density: {done:.0f}%", end='\r')
+                print()
+    finally:
+        for stream in streams:
+            stream.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="arithmetic on CHGCAR files, streamed block by block")
+    parser.add_argument("expression", help='e.g. "a - b - c", files are a, b, c, ... in the order given')
+    parser.add_argument("files", nargs='+', help="CHGCAR, CHG or PARCHG files")
+    parser.add_argument("-o", "--output", default="CHGCAR_math", help="file written")
+    parser.add_argument("--format", choices=("chgcar", "vasp"), default="chgcar",
+                        help="values as %%17.10E (as written by this program) or as VASP writes them")
+    args = parser.parse_args(argv)
+    stream_math(args.expression, args.files, args.output, args.format)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
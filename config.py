@@ -9,6 +9,12 @@ class AppConfig:
     potcar_dir = None
     last_open_file = None
     theme = "light"
+    # "memory" or "mmap" (float32 frames mapped from the .vaspui_cache directory)
+    trajectory_storage = "memory"
+    # [start, stop, stride] of the OUTCAR ionic steps to load, e.g. [null, null, 10]; null loads all
+    outcar_frames = None
+    # "float64" or "float32", the type charge density grids are stored in; float32 halves their memory
+    chgcar_dtype = "float64"
 
     @classmethod
     def load(cls):
@@ -1,4 +1,5 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QLabel, QScrollArea, QFrame, QPushButton, QGridLayout, QPlainTextEdit
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QLabel, QScrollArea, QFrame, QPushButton, QGridLayout, QPlainTextEdit, \
+    QSlider, QComboBox, QDoubleSpinBox, QSpinBox
 from PyQt5 import QtCore, Qt
 import pyqtgraph as pg
 import numpy as np
@@ -19,6 +20,9 @@ class DosControlWidget(QWidget):
         list of saved plot colors
     """
 
+    # separate curves are drawn in batches, a few items per plot however many are selected
+    MAX_SEPARATE_CURVES = 4000
+
     statusMessage = Qt.pyqtSignal(str)
     request_selected = Qt.pyqtSignal()
 
@@ -55,6 +59,7 @@ class DosControlWidget(QWidget):
 
         self.add_orbital_buttons()
         self.add_atom_buttons()
+        self.set_grid_range()
 
     def init_dos_orbitals_atoms_tab(self, layout):
         """
@@ -250,8 +255,64 @@ class DosControlWidget(QWidget):
         self.additional_button_layout.addWidget(self.clear_merged_plot_btn,2,1)
         self.clear_merged_plot_btn.clicked.connect(self.clear_merged_plot)
 
+        self.broadening_label = QLabel("smearing: 0.00 eV")
+        self.additional_button_layout.addWidget(self.broadening_label, 3, 0)
+        self.broadening_kind_combo = QComboBox()
+        self.broadening_kind_combo.addItems(["gaussian", "lorentzian"])
+        self.broadening_kind_combo.currentTextChanged.connect(self.broadening_changed)
+        self.additional_button_layout.addWidget(self.broadening_kind_combo, 3, 1)
+        # FWHM in steps of 0.01 eV
+        self.broadening_slider = QSlider(QtCore.Qt.Horizontal)
+        self.broadening_slider.setRange(0, 100)
+        self.broadening_slider.valueChanged.connect(self.broadening_changed)
+        self.additional_button_layout.addWidget(self.broadening_slider, 4, 0, 1, 2)
+
+        # common energy grid (emin, emax, points) the smeared curves are resampled onto
+        self.grid_checkbox = QCheckBox("common grid")
+        self.grid_checkbox.stateChanged.connect(self.broadening_changed)
+        self.additional_button_layout.addWidget(self.grid_checkbox, 5, 0)
+        self.grid_points_spinbox = QSpinBox()
+        self.grid_points_spinbox.setRange(2, 100000)
+        self.grid_points_spinbox.setSuffix(" points")
+        self.grid_points_spinbox.valueChanged.connect(self.broadening_changed)
+        self.additional_button_layout.addWidget(self.grid_points_spinbox, 5, 1)
+        self.grid_emin_spinbox = QDoubleSpinBox()
+        self.grid_emax_spinbox = QDoubleSpinBox()
+        for column, spinbox in enumerate([self.grid_emin_spinbox, self.grid_emax_spinbox]):
+            spinbox.setRange(-1000, 1000)
+            spinbox.setDecimals(2)
+            spinbox.setSuffix(" eV")
+            spinbox.valueChanged.connect(self.broadening_changed)
+            self.additional_button_layout.addWidget(spinbox, 6, column)
+        self.set_grid_range()
+
         self.all_btns_layout.addLayout(self.additional_button_layout)
 
+    def set_grid_range(self):
+        """set the grid spin boxes to the energies and NEDOS of the opened DOSCAR"""
+        energies = self.data.doscar.total_dos_energy
+        spinboxes = [self.grid_emin_spinbox, self.grid_emax_spinbox, self.grid_points_spinbox]
+        for spinbox in spinboxes:
+            spinbox.blockSignals(True)
+        self.grid_emin_spinbox.setValue(float(energies[0]))
+        self.grid_emax_spinbox.setValue(float(energies[-1]))
+        self.grid_points_spinbox.setValue(len(energies))
+        for spinbox in spinboxes:
+            spinbox.blockSignals(False)
+
+    def broadening_changed(self):
+        """smear the plotted DOS with the width chosen on the slider, on the common grid if it is checked"""
+        width = self.broadening_slider.value() / 100
+        self.broadening_label.setText(f"smearing: {width:.2f} eV")
+        grid = None
+        if self.grid_checkbox.isChecked():
+            emin, emax = self.grid_emin_spinbox.value(), self.grid_emax_spinbox.value()
+            if emax <= emin:
+                print("grid maximum energy must be larger than the minimum")
+                return
+            grid = (emin, emax, self.grid_points_spinbox.value())
+        self.plot_widget.set_broadening(width, self.broadening_kind_combo.currentText(), grid)
+
     def clearLayout(self, layout):
         if layout is not None:
             while layout.count():
@@ -378,7 +439,7 @@ class DosControlWidget(QWidget):
     def update_plot(self):
         """update the DOS plot"""
         counter = len(self.selected_atoms) * len(self.selected_orbitals)
-        if counter < 10:
+        if counter <= self.MAX_SEPARATE_CURVES:
             self.plot_widget.plot_separate(self.data, self.selected_atoms, self.selected_orbitals)
         else:
             self.statusMessage.emit("Too many plots. Click \" Plot merged \" button to plot")
@@ -416,17 +477,17 @@ class DosControlWidget(QWidget):
 
     def save_merged_plot(self):
         """save merged plot to a save list"""
-        data_up = self.plot_widget.bounded_plot.plotItem.curves[-2].getData()[0]
+        data_up, nrg = self.plot_widget.bounded_plot.plotItem.curves[-2].getData()
         data_down = self.plot_widget.bounded_plot.plotItem.curves[-1].getData()[0]
         lbl = self.saved_labels[-1]
         color = self.saved_colors[-1]
         mean_values = self.plot_widget.calculate_spin_weighted_means(
             data_up,
             data_down,
-            self.data.doscar.total_dos_energy,
+            nrg,
             self.plot_widget.region.getRegion(),
         )
-        self.saved_plots.append((data_up, data_down, lbl, color, mean_values))
+        self.saved_plots.append((data_up, data_down, lbl, color, mean_values, nrg))
 
     def show_saved_plot(self):
         """show saved plots"""
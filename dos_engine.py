@@ -0,0 +1,279 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class DosAggregator:
+    """
+    Sums of projected DOS curves over selections of atoms and orbitals.
+
+    The dense (atoms, orbitals, spin, NEDOS) array is summed once per element
+    and per angular momentum channel (s, p, d, f). A selection is then
+    answered from the smallest tables which describe it exactly: whole
+    elements and channels come from the precomputed sums, single atoms and
+    orbitals from the projections, each table with one matrix product.
+    An element (or channel) with most of its members selected is taken as a
+    whole minus the unselected members, so the work never grows beyond half
+    of the atoms of an element.
+    """
+
+    def __init__(self, dos, elements, orbital_types, orbitals):
+        self.dos = dos
+        atom_count, orbital_count, spins, nedos = dos.shape
+        self.atom_count = atom_count
+        self.curve_shape = (spins, nedos)
+        if len(elements) != atom_count:
+            elements = ["all"] * atom_count
+        self.element_names, self.element_of_atom = np.unique(np.asarray(elements, dtype=str), return_inverse=True)
+        self.element_of_atom = self.element_of_atom.reshape(-1)
+        self.channel_of_orbital = np.array([self.channel_index(orbital, orbital_types, i)
+                                            for i, orbital in enumerate(orbitals)], dtype=int)
+        if len(self.channel_of_orbital) != orbital_count:
+            self.channel_of_orbital = np.arange(orbital_count)
+        # "s", "p", "d", "f" from the first orbital of each group
+        self.channel_names = [str(group[0])[0] for group in orbital_types][:orbital_count]
+        self.element_count = len(self.element_names)
+        self.channel_count = int(self.channel_of_orbital.max()) + 1 if orbital_count else 0
+
+        atom_elements = self.membership(self.element_of_atom, self.element_count)
+        orbital_channels = self.membership(self.channel_of_orbital, self.channel_count)
+        # explicit shapes, an empty DOS (no DOSCAR) has no size to infer them from
+        points = spins * nedos
+        projections = dos.reshape(atom_count, orbital_count, points)
+        element_orbital = (atom_elements @ projections.reshape(atom_count, orbital_count * points)).reshape(
+            self.element_count, orbital_count, points)
+        atom_channel = orbital_channels @ projections
+        element_channel = orbital_channels @ element_orbital
+
+        # keyed by what the rows and the columns of each table run over
+        self.tables = {
+            ("element", "channel"): element_channel,
+            ("element", "orbital"): element_orbital,
+            ("atom", "channel"): atom_channel,
+            ("atom", "orbital"): projections,
+        }
+
+    def channel_curves(self):
+        """(atoms, channels, spin, NEDOS) sums over the orbitals of each s/p/d/f channel"""
+        return self.tables[("atom", "channel")].reshape((self.atom_count, self.channel_count) + self.curve_shape)
+
+    @staticmethod
+    def channel_index(orbital, orbital_types, default):
+        for i, group in enumerate(orbital_types):
+            if orbital in group:
+                return i
+        return default
+
+    @staticmethod
+    def membership(group_of, group_count):
+        """(groups, members) matrix with 1 where the member belongs to the group"""
+        matrix = np.zeros((group_count, len(group_of)))
+        matrix[group_of, np.arange(len(group_of))] = 1.0
+        return matrix
+
+    @staticmethod
+    def split(selected, group_of, group_count):
+        """
+        Signed weights of the members and of whole groups. A group with more
+        than half of its members selected gets weight 1 and its unselected
+        members -1, otherwise the selected members get weight 1.
+        """
+        mask = np.zeros(len(group_of), dtype=bool)
+        mask[np.asarray(selected, dtype=int)] = True
+        selected_count = np.bincount(group_of[mask], minlength=group_count)
+        whole = 2 * selected_count > np.bincount(group_of, minlength=group_count)
+        member_weights = mask.astype(float)
+        in_whole = whole[group_of]
+        member_weights[in_whole] -= 1.0
+        return member_weights, whole.astype(float)
+
+    def sum(self, atoms, orbitals):
+        """summed spin-up and spin-down curves of ``orbitals`` of ``atoms``"""
+        total = np.zeros(self.curve_shape[0] * self.curve_shape[1])
+        if len(atoms) == 0 or len(orbitals) == 0 or self.atom_count == 0:
+            return total.reshape(self.curve_shape)
+        weights = {}
+        weights["atom"], weights["element"] = self.split(atoms, self.element_of_atom, self.element_count)
+        weights["orbital"], weights["channel"] = self.split(orbitals, self.channel_of_orbital, self.channel_count)
+        for (rows, columns), table in self.tables.items():
+            row_index = np.flatnonzero(weights[rows])
+            column_index = np.flatnonzero(weights[columns])
+            if len(row_index) == 0 or len(column_index) == 0:
+                continue
+            block = table[np.ix_(row_index, column_index)].reshape(-1, table.shape[-1])
+            total += np.outer(weights[rows][row_index], weights[columns][column_index]).reshape(-1) @ block
+        return total.reshape(self.curve_shape)
+
+
+class DosBroadening:
+    """
+    Gaussian or Lorentzian smearing of DOS curves by FFT convolution, with
+    optional resampling onto a common energy grid.
+
+    ``grid`` is None (the DOSCAR energies) or (emin, emax, points) and
+    ``width`` is the full width at half maximum in eV. Kernels and
+    resampling weights are kept per (width, grid, kind), the smeared curves
+    of smooth_cached() per (curves, width, grid, kind) too, so moving a width
+    slider back and forth does not convolve the same curves twice.
+    """
+    CACHE_SIZE = 4
+    # bytes of smeared curves kept by smooth_cached
+    RESULT_BYTES = 128 * 1024 ** 2
+    # convolved values per FFT batch, bounds the temporary complex arrays
+    BATCH_VALUES = 2 ** 22
+
+    def __init__(self, energies):
+        self.energies = np.asarray(energies, dtype=float)
+        self.operators = OrderedDict()
+        self.results = OrderedDict()
+        self.result_bytes = 0
+
+    def grid_energies(self, grid=None):
+        if grid is None:
+            return self.energies
+        emin, emax, points = grid
+        return np.linspace(emin, emax, int(points))
+
+    def operator(self, width, grid, kind):
+        """resampling indices and weights and the kernel spectrum of one setting"""
+        grid = None if grid is None else tuple(grid)
+        key = (float(width), grid, kind)
+        if key in self.operators:
+            self.operators.move_to_end(key)
+            return self.operators[key]
+        energies = self.grid_energies(grid)
+        points = len(energies)
+        if grid is None:
+            resample = None
+        else:
+            upper = np.clip(np.searchsorted(self.energies, energies), 1, len(self.energies) - 1)
+            lower = upper - 1
+            fraction = (energies - self.energies[lower]) / (self.energies[upper] - self.energies[lower])
+            outside = (energies < self.energies[0]) | (energies > self.energies[-1])
+            resample = (lower, upper, np.where(outside, 0.0, 1.0 - fraction), np.where(outside, 0.0, fraction))
+        spectrum = None
+        size = 0
+        if width > 0 and points > 1:
+            step = (energies[-1] - energies[0]) / (points - 1)
+            offsets = np.arange(-(points - 1), points) * step
+            if kind == "lorentzian":
+                kernel = (width / 2) / (offsets ** 2 + (width / 2) ** 2)
+            else:
+                sigma = width / (2 * np.sqrt(2 * np.log(2)))
+                kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+            kernel /= kernel.sum()
+            # long enough for a linear (not circular) convolution
+            size = 1 << (3 * points - 3).bit_length()
+            spectrum = np.fft.rfft(kernel, size)
+        self.operators[key] = (energies, resample, spectrum, size)
+        if len(self.operators) > self.CACHE_SIZE:
+            self.operators.popitem(last=False)
+        return self.operators[key]
+
+    def smooth(self, curves, width, grid=None, kind="gaussian"):
+        """
+        Smear a stack of curves of any leading shape, (..., NEDOS), in one
+        call. Returns the energies of the grid and the (..., points) curves.
+        """
+        energies, resample, spectrum, size = self.operator(width, grid, kind)
+        curves = np.asarray(curves, dtype=float)
+        if resample is not None:
+            lower, upper, lower_weight, upper_weight = resample
+            curves = curves[..., lower] * lower_weight + curves[..., upper] * upper_weight
+        if spectrum is None:
+            return energies, curves
+        points = len(energies)
+        shape = curves.shape
+        flat = curves.reshape(-1, points)
+        result = np.empty_like(flat)
+        batch = max(1, self.BATCH_VALUES // size)
+        for start in range(0, len(flat), batch):
+            convolved = np.fft.irfft(np.fft.rfft(flat[start:start + batch], size) * spectrum, size)
+            result[start:start + batch] = convolved[:, points - 1:2 * points - 1]
+        return energies, result.reshape(shape)
+
+    def smooth_cached(self, key, curves, width, grid=None, kind="gaussian"):
+        """
+        smooth() of the curves identified by ``key``, e.g. the selected atoms and
+        orbitals. ``curves`` may be a function returning them, it is called only
+        when the result is not cached. The least recently used results are
+        dropped above RESULT_BYTES.
+        """
+        grid = None if grid is None else tuple(grid)
+        result_key = (key, float(width), grid, kind)
+        if result_key in self.results:
+            self.results.move_to_end(result_key)
+            return self.results[result_key]
+        result = self.smooth(curves() if callable(curves) else curves, width, grid, kind)
+        self.results[result_key] = result
+        self.result_bytes += result[1].nbytes
+        while self.result_bytes > self.RESULT_BYTES and len(self.results) > 1:
+            self.result_bytes -= self.results.popitem(last=False)[1][1].nbytes
+        return result
+
+
+class BandMoments:
+    """
+    Band centre, width, skewness, kurtosis and filling of many DOS curves at
+    once. Energies are taken relative to the Fermi energy, so are the
+    centre and the optional (emin, emax) window. ``states`` is the integral of
+    the curve in the window, ``kurtosis`` is not reduced by 3 and ``filling``
+    is the fraction of ``states`` below the Fermi energy.
+    """
+    COLUMNS = ("states", "center", "width", "skewness", "kurtosis", "filling")
+
+    def __init__(self, energies, efermi=0.0, window=None):
+        energies = np.asarray(energies, dtype=float) - float(efermi)
+        inside = np.ones(len(energies), dtype=bool) if window is None else \
+            (energies >= min(window)) & (energies <= max(window))
+        # trapezoid weights of the points inside the window
+        weights = np.zeros(len(energies))
+        index = np.flatnonzero(inside)
+        if len(index) > 1:
+            spacing = np.diff(energies[index])
+            weights[index[:-1]] += spacing / 2
+            weights[index[1:]] += spacing / 2
+        powers = energies[:, None] ** np.arange(5)
+        # one column per raw moment plus the states below the Fermi energy
+        self.basis = np.column_stack([weights[:, None] * powers, weights * (energies <= 0)])
+
+    def compute(self, curves):
+        """moments of (..., NEDOS) curves as a (..., 6) array ordered like COLUMNS, NaN where a curve is empty"""
+        curves = np.asarray(curves, dtype=float)
+        raw = curves.reshape(-1, curves.shape[-1]) @ self.basis
+        with np.errstate(divide="ignore", invalid="ignore"):
+            states = raw[:, 0]
+            normalized = raw[:, 1:] / states[:, None]
+            e1, e2, e3, e4, below = normalized.T
+            variance = np.maximum(e2 - e1 ** 2, 0.0)
+            third = e3 - 3 * e1 * e2 + 2 * e1 ** 3
+            fourth = e4 - 4 * e1 * e3 + 6 * e1 ** 2 * e2 - 3 * e1 ** 4
+            moments = np.column_stack([states, e1, np.sqrt(variance), third / variance ** 1.5,
+                                       fourth / variance ** 2, below])
+        moments[np.abs(states) < 1e-12, 1:] = np.nan
+        return moments.reshape(curves.shape[:-1] + (len(self.COLUMNS),))
+
+
+def decimate_curves(energies, curves, emin, emax, rows):
+    """
+    Points of (k, NEDOS) ``curves`` worth drawing when the energies between
+    ``emin`` and ``emax`` span ``rows`` pixels: points outside the range are
+    dropped (one is kept on each side) and when several points fall on one
+    pixel row only the smallest and largest value of each curve are kept.
+    Returns the (points,) energies and the (k, points) values.
+    """
+    energies = np.asarray(energies)
+    start = max(int(np.searchsorted(energies, emin)) - 1, 0)
+    stop = min(int(np.searchsorted(energies, emax, side="right")) + 1, len(energies))
+    energies = energies[start:stop]
+    curves = curves[:, start:stop]
+    step = len(energies) // max(int(rows), 1)
+    if step < 3:
+        return energies, curves
+    whole = len(energies) // step * step
+    blocks = curves[:, :whole].reshape(len(curves), -1, step)
+    block_energies = energies[:whole].reshape(-1, step)
+    values = np.stack([blocks.min(axis=2), blocks.max(axis=2)], axis=2).reshape(len(curves), -1)
+    reduced_energies = np.stack([block_energies[:, 0], block_energies[:, -1]], axis=1).reshape(-1)
+    return (np.concatenate([reduced_energies, energies[whole:]]),
+            np.concatenate([values, curves[:, whole:]], axis=1))
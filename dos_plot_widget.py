@@ -8,7 +8,7 @@ if True:
     from pyqtgraph.graphicsItems.PlotDataItem import PlotDataItem
     import re
     import numpy as np
-    from itertools import cycle
+    from dos_engine import decimate_curves
     from pyqtgraph.exporters.Exporter import Exporter
 
 
@@ -34,6 +34,14 @@ class DosPlotWidget(QWidget):
         self.data = data
         self.mean_dos_lines = []
         self.mean_dos_entries = []
+        # FWHM in eV of the smearing applied to plotted curves, 0 plots raw DOSCAR points
+        self.broadening = 0.0
+        self.broadening_kind = "gaussian"
+        # (emin, emax, points) of a common energy grid the curves are resampled onto, None plots DOSCAR energies
+        self.grid = None
+        self.last_plot = None
+        # merged curves with their plot items, smeared again when the broadening changes
+        self.merged_plots = []
         self.initUI()
         self.legend = []
 
@@ -137,8 +145,39 @@ class DosPlotWidget(QWidget):
 
     def update_data(self, data):
         self.data = data
+        self.last_plot = None
+        self.merged_plots = []
         self.clear_mean_dos_entries()
 
+    def smeared(self, key, curves):
+        """
+        Energies and curves (..., NEDOS) smeared with the current broadening
+        and resampled onto the current grid, all of them in one FFT call.
+        Smearing is linear, so sums of smeared curves equal smeared sums and
+        only the plotted curves are convolved. ``curves`` may be a function
+        returning them; ``key`` identifies them in the result cache.
+        """
+        if self.broadening <= 0 and self.grid is None:
+            curves = curves() if callable(curves) else curves
+            return self.data.dos_broadening.energies, np.asarray(curves, dtype=float)
+        return self.data.dos_broadening.smooth_cached(key, curves, self.broadening, self.grid, self.broadening_kind)
+
+    def set_broadening(self, width, kind="gaussian", grid=None):
+        """change the smearing and the energy grid, redraw the separate or total DOS plot and the merged curves"""
+        self.broadening = width
+        self.broadening_kind = kind
+        self.grid = grid
+        if self.last_plot is not None:
+            method, args = self.last_plot
+            method(*args)
+        for merged in self.merged_plots:
+            nrg, merged_data_up, merged_data_down = self.sum_data_to_merge(merged["atoms"], merged["orbitals"])
+            for item, values in zip(merged["items"], (merged_data_up, merged_data_up,
+                                                      -merged_data_down, -merged_data_down)):
+                item.setData(values, nrg)
+            merged["entry"].update(data_up=merged_data_up, data_down=merged_data_down, nrg=nrg)
+        self.refresh_mean_dos_lines()
+
     def update_bounded_plot_y_range(self):
         """
          Updates the y-axis range of the bounded plot based on the selected region
@@ -162,7 +201,8 @@ class DosPlotWidget(QWidget):
         Args:
             plot_widget: The plot widget from which to remove data items (full_range_plot or bounded_plot)
         """
-        items = [item for item in plot_widget.listDataItems() if isinstance(item, pg.PlotDataItem) and not isinstance(item, MergedPlotDataItem)]
+        items = [item for item in plot_widget.listDataItems() if isinstance(item, (pg.PlotDataItem, DosCurveBatchItem))
+                 and not isinstance(item, MergedPlotDataItem)]
         for item in items:
             plot_widget.removeItem(item)
 
@@ -199,18 +239,19 @@ class DosPlotWidget(QWidget):
     def add_mean_dos_entry(self, data_up, data_down, nrg, label, color=None, kind="merged"):
         """
         Remember a DOS dataset and draw its weighted mean energy line.
-        """
-        self.mean_dos_entries.append(
-            {
-                "data_up": np.asarray(data_up, dtype=float),
-                "data_down": None if data_down is None else np.asarray(data_down, dtype=float),
-                "nrg": np.asarray(nrg, dtype=float),
-                "label": label,
-                "color": color,
-                "kind": kind,
-            }
-        )
+        Returns the entry, so its data can be replaced later.
+        """
+        entry = {
+            "data_up": np.asarray(data_up, dtype=float),
+            "data_down": None if data_down is None else np.asarray(data_down, dtype=float),
+            "nrg": np.asarray(nrg, dtype=float),
+            "label": label,
+            "color": color,
+            "kind": kind,
+        }
+        self.mean_dos_entries.append(entry)
         self.refresh_mean_dos_lines()
+        return entry
 
     def refresh_mean_dos_lines(self):
         """
@@ -372,6 +413,7 @@ class DosPlotWidget(QWidget):
             for item in [item for item in plot.listDataItems() if isinstance(item, MergedPlotDataItem) or isinstance(item, pg.graphicsItems.PlotDataItem.PlotDataItem)]:
                 plot.removeItem(item)
         self.legend.clear()
+        self.merged_plots = []
         self.clear_mean_dos_entries()
 
     def plot_separate(self, data, selected_atoms, selected_orbitals):
@@ -391,6 +433,7 @@ class DosPlotWidget(QWidget):
         self.clear_plot_data(self.full_range_plot)
         self.clear_plot_data(self.bounded_plot)
         self.clear_mean_dos_entries(kind="separate")
+        self.last_plot = (self.plot_separate, (data, selected_atoms, selected_orbitals))
         colors = [
             "#FF6B6B",  # Soft red
             "#FFD93D",  # Vivid yellow
@@ -403,58 +446,35 @@ class DosPlotWidget(QWidget):
             "#E4572E",  # Coral
             "#9D4EDD",  # Electric violet
         ]
-        color_gen_up = cycle(colors)
-        color_gen_down = cycle(colors)
-        dataset_up = data.data_up
-        dataset_down = data.data_down
-        nrg = data.doscar.total_dos_energy
-        selected_data_up = []
-        selected_data_down = []
-        counter = 0
-        self.full_range_plot.addLegend()
-
-        for atom_index in selected_atoms:
-            for orbital_index in selected_orbitals:
+        nrg = np.asarray(data.doscar.total_dos_energy, dtype=float)
+        pairs = [(atom_index, orbital_index) for atom_index in selected_atoms for orbital_index in selected_orbitals]
+        if pairs:
+            nrg, curves = self.smeared(("separate", tuple(pairs)),
+                                       lambda: data.dos[[pair[0] for pair in pairs], [pair[1] for pair in pairs]])
+        else:
+            curves = np.zeros((0, 2, len(nrg)))
+        legend = self.full_range_plot.addLegend()
+
+        # curves cycle through the colors; all curves of one color, spin up and
+        # mirrored spin down, are drawn as one item sharing one buffer in both plots
+        for color_index, plot_color in enumerate(colors[:len(pairs)]):
+            group = curves[color_index::len(colors)]
+            values = np.concatenate([group[:, 0], -group[:, 1]])
+            pen = pg.mkPen(plot_color, width=self.PLOT_LINEWIDTH)
+            pen.setCapStyle(QtCore.Qt.PenCapStyle.RoundCap)
+            pen.setJoinStyle(QtCore.Qt.PenJoinStyle.RoundJoin)
+            full_range_item = DosCurveBatchItem(nrg, values, pen)
+            self.full_range_plot.addItem(full_range_item)
+            self.bounded_plot.addItem(DosCurveBatchItem(nrg, values, pen))
+            if len(pairs) <= len(colors):
+                atom_index, orbital_index = pairs[color_index]
                 atom_name = self.data.atoms_symb_and_num[atom_index]
                 orbital_name = self.data.orbitals[orbital_index]
-                plot_color = next(color_gen_up)  # Cycle through colors
-                plot_data = dataset_up[atom_index][orbital_index]
-                selected_data_up.append(plot_data)
-                pen = pg.mkPen(plot_color, width=self.PLOT_LINEWIDTH)
-                pen.setCapStyle(QtCore.Qt.PenCapStyle.RoundCap)
-                pen.setJoinStyle(QtCore.Qt.PenJoinStyle.RoundJoin)
-                self.full_range_plot.plot(plot_data,
-                                          nrg,
-                                          pen=pen,
-                                          name=f'{atom_name}_{orbital_name}'
-                                          )
-                self.bounded_plot.plot(plot_data,
-                                       nrg,
-                                       pen=pen,
-                                       name=f'{atom_name}_{orbital_name}'
-                                       )
-
-        # plot dataset down
-        for atom_index in selected_atoms:
-            for orbital_index in selected_orbitals:
-                plot_color = next(color_gen_down)
-                pen = pg.mkPen(plot_color, width=self.PLOT_LINEWIDTH)
-                pen.setCapStyle(QtCore.Qt.PenCapStyle.RoundCap)
-                pen.setJoinStyle(QtCore.Qt.PenJoinStyle.RoundJoin)
-                plot_data = dataset_down[atom_index][orbital_index]
-                selected_data_down.append(plot_data)
-                self.full_range_plot.plot([-x for x in plot_data],
-                                          nrg,
-                                          pen=pen,
-                                          )
-                self.bounded_plot.plot([-x for x in plot_data],
-                                       nrg,
-                                       pen=pen,
-                                       )
-
-        if selected_data_up or selected_data_down:
-            sum_up = np.sum(np.asarray(selected_data_up, dtype=float), axis=0) if selected_data_up else np.zeros_like(nrg, dtype=float)
-            sum_down = np.sum(np.asarray(selected_data_down, dtype=float), axis=0) if selected_data_down else None
+                legend.addItem(full_range_item, f'{atom_name}_{orbital_name}')
+
+        if pairs:
+            nrg, (sum_up, sum_down) = self.smeared(("sum", tuple(selected_atoms), tuple(selected_orbitals)),
+                                                   lambda: data.dos_sums.sum(selected_atoms, selected_orbitals))
             self.add_mean_dos_entry(
                 sum_up,
                 sum_down,
@@ -482,11 +502,13 @@ class DosPlotWidget(QWidget):
         self.clear_plot_data(self.full_range_plot)
         self.clear_plot_data(self.bounded_plot)
         self.clear_mean_dos_entries(kind="separate")
+        self.last_plot = (self.update_total_dos_plot, (datasetup, datasetdown, nrg))
+        nrg, (datasetup, datasetdown) = self.smeared(("total",), lambda: [datasetup, datasetdown])
         self.full_range_plot.plot(datasetup, nrg, pen=pg.mkPen('b'))
         self.bounded_plot.plot(datasetup, nrg, pen=pg.mkPen('b'))
 
-        self.full_range_plot.plot([-x for x in datasetdown], nrg, pen=pg.mkPen('b'))
-        self.bounded_plot.plot([-x for x in datasetdown], nrg, pen=pg.mkPen('b'))
+        self.full_range_plot.plot(-datasetdown, nrg, pen=pg.mkPen('b'))
+        self.bounded_plot.plot(-datasetdown, nrg, pen=pg.mkPen('b'))
 
     def create_label(self, orbital_up, orbital_down, atom_no_up, atom_no_down):
         """
@@ -582,15 +604,12 @@ class DosPlotWidget(QWidget):
                 List of Indices of selected orbitals.
 
         Returns:
-            tuple: Merged DOS data for spin-up and spin-down.
+            tuple: energies and merged DOS data for spin-up and spin-down.
         """
-        dataset_up = np.array(self.data.data_up)
-        dataset_down = np.array(self.data.data_down)
-        dataset_up =  dataset_up[np.ix_(selected_atoms,selected_orbitals,range(self.data.nedos))]
-        dataset_down =  dataset_down[np.ix_(selected_atoms,selected_orbitals,range(self.data.nedos))]
-        merged_data_up = np.sum(dataset_up, axis=(1,0))
-        merged_data_down = np.sum(dataset_down, axis=(1,0))
-        return merged_data_up, merged_data_down
+        nrg, (merged_data_up, merged_data_down) = self.smeared(
+            ("sum", tuple(selected_atoms), tuple(selected_orbitals)),
+            lambda: self.data.dos_sums.sum(selected_atoms, selected_orbitals))
+        return nrg, merged_data_up, merged_data_down
 
     def plot_merged(self, selected_atoms, selected_orbitals, nrg, label, color):
         """
@@ -602,14 +621,13 @@ class DosPlotWidget(QWidget):
             selected_orbitals:
                 List of orbital indices for merging.
             nrg:
-                Array of energy values for DOS.
+                Array of energy values for DOS, replaced by the grid when one is set.
             label:
                 Label for the legend.
             color:
                 Color for the merged plot line.
         """
-        merged_data_up, merged_data_down = self.sum_data_to_merge(selected_atoms,
-                                                                              selected_orbitals)
+        nrg, merged_data_up, merged_data_down = self.sum_data_to_merge(selected_atoms, selected_orbitals)
 
         self.clear_plot_data(self.full_range_plot)
         self.clear_plot_data(self.bounded_plot)
@@ -621,11 +639,11 @@ class DosPlotWidget(QWidget):
         self.full_range_plot.addItem(merged_item_up_full)
         self.bounded_plot.addItem(merged_item_up_bound)
 
-        merged_item_down_full = MergedPlotDataItem([-x for x in merged_data_down], nrg, pen=pg.mkPen(color))
-        merged_item_down_bound = MergedPlotDataItem([-x for x in merged_data_down], nrg, pen=pg.mkPen(color))
+        merged_item_down_full = MergedPlotDataItem(-merged_data_down, nrg, pen=pg.mkPen(color))
+        merged_item_down_bound = MergedPlotDataItem(-merged_data_down, nrg, pen=pg.mkPen(color))
         self.full_range_plot.addItem(merged_item_down_full)
         self.bounded_plot.addItem(merged_item_down_bound)
-        self.add_mean_dos_entry(
+        entry = self.add_mean_dos_entry(
             merged_data_up,
             merged_data_down,
             nrg,
@@ -633,6 +651,12 @@ class DosPlotWidget(QWidget):
             color=color,
             kind="merged",
         )
+        self.merged_plots.append({
+            "atoms": list(selected_atoms),
+            "orbitals": list(selected_orbitals),
+            "items": [merged_item_up_full, merged_item_up_bound, merged_item_down_full, merged_item_down_bound],
+            "entry": entry,
+        })
 
         if self.legend == []:
             self.legend = pg.LegendItem((80,60), offset=(-20,-50))
@@ -688,10 +712,13 @@ class MergedPlotWindow(QWidget):
         for data in saved_plots:
             picked_plot = pg.PlotWidget()
             picked_plot.setBackground('w')
-            up = picked_plot.plot(data[0], nrg, pen=pg.mkPen(data[3]), name=data[2])
-            picked_plot.plot(data[1], nrg,pen=pg.mkPen(data[3]), name=data[2])
+            # curves saved on a resampling grid carry their energies
+            energies = data[5] if len(data) > 5 else nrg
+            up = picked_plot.plot(data[0], energies, pen=pg.mkPen(data[3]), name=data[2])
+            picked_plot.plot(data[1], energies, pen=pg.mkPen(data[3]), name=data[2])
             picked_plot.getViewBox().autoRange()
-            mean_values = data[4] if len(data) > 4 else DosPlotWidget.calculate_spin_weighted_means(data[0], data[1], nrg)
+            mean_values = data[4] if len(data) > 4 else DosPlotWidget.calculate_spin_weighted_means(data[0], data[1],
+                                                                                                   energies)
             DosPlotWidget.draw_mean_dos_lines(
                 mean_values,
                 color=data[3],
@@ -712,6 +739,44 @@ class MergedPlotDataItem(PlotDataItem):
         super().__init__(*args, **kwargs)
 
 
+class DosCurveBatchItem(pg.PlotCurveItem):
+    """
+    Many DOS curves on one energy grid drawn as a single path, energies on
+    the vertical axis. The (curves, NEDOS) values are shared by the items of
+    the full range and the bounded plot; on every change of the view each
+    item draws only the visible energies and the extremes of each pixel row.
+    """
+    def __init__(self, energies, curves, pen):
+        super().__init__(pen=pen)
+        self.energies = energies
+        self.curves = curves
+        self.bounds = (float(curves.min()), float(curves.max())) if curves.size else (0.0, 0.0)
+        self.update_level_of_detail()
+
+    def viewRangeChanged(self):
+        super().viewRangeChanged()
+        self.update_level_of_detail()
+
+    def update_level_of_detail(self):
+        view = self.getViewBox()
+        if view is None:
+            emin, emax, rows = self.energies[0], self.energies[-1], len(self.energies)
+        else:
+            emin, emax = view.viewRange()[1]
+            rows = view.height()
+        energies, values = decimate_curves(self.energies, self.curves, emin, emax, rows)
+        # break the path between consecutive curves
+        connect = np.ones(values.shape, dtype=bool)
+        connect[:, -1] = False
+        self.setData(x=values.reshape(-1), y=np.tile(energies, len(values)), connect=connect.reshape(-1))
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        """bounds of all points, auto range must not follow the clipping to the view"""
+        if ax == 0:
+            return self.bounds
+        return float(self.energies[0]), float(self.energies[-1])
+
+
 class PDFExporter(Exporter):
     """A pdf exporter for pyqtgraph graphs. Based on pyqtgraph's ImageExporter.
      There is a bug in Qt<5.12 that makes Qt wrongly use a cosmetic pen
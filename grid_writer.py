@@ -0,0 +1,173 @@
+"""
+Text output of volumetric grids in the layout of VASP CHG and CHGCAR files.
+
+Values are written x fastest, a space before each value and a fixed number
+of values per line, every line ended by a newline. Formats:
+
+    'chgcar'  %17.10E, 5 per line, as ASE writes CHGCAR
+    'chg'     %#11.5G, 10 per line, as ASE writes CHG
+    'vasp'    Fortran E17.11 (0.12345678901E+01), 5 per line, as VASP writes CHGCAR
+
+The fixed width scientific formats are encoded for a whole block of values
+at once: the significand and exponent of every value are computed with
+NumPy and their digits written into a byte array. Values whose rounding
+is too close to call in floating point are formatted by Python instead,
+so the result is the same as printf gives. Blocks with values that are
+not finite or need a three digit exponent, and the 'chg' format, are
+formatted with one % operation per block.
+"""
+import numpy as np
+
+from volumetric_slabs import slabs
+
+LINE_VALUES = {'chgcar': 5, 'chg': 10, 'vasp': 5}
+# lines formatted at once, bounds the temporary arrays
+BLOCK_LINES = 2 ** 15
+PRINTF_FORMATS = {'chgcar': '%17.10E', 'chg': '%#11.5G'}
+# significant digits of the scientific formats
+DIGITS = 11
+FIELD_WIDTH = 17
+
+
+def packed(texts):
+    """equally long ASCII strings as 4 byte words, written into a field with one store"""
+    return np.frombuffer(b"".join(texts), dtype=np.uint32)
+
+
+# a field is the separator and the sign (2 bytes), the digits in groups of
+# 3 (with the point), 4 and 4 and the exponent (4 bytes each), so it is
+# written with five stores of words looked up in these tables
+LEADING = {'chgcar': packed(b"%d.%02d" % divmod(i, 100) for i in range(1000)),
+           'vasp': packed(b".%03d" % i for i in range(1000))}
+SIGNS = {'chgcar': np.frombuffer(b"   -", dtype=np.uint16), 'vasp': np.frombuffer(b" 0 -", dtype=np.uint16)}
+DIGIT_WORDS = packed(b"%04d" % i for i in range(10000))
+EXPONENTS = packed(b"E%+03d" % i for i in range(-99, 100))
+POWERS_OF_TEN = 10.0 ** np.arange(-128, 129)
+
+
+def vasp_field(x):
+    """one value in the Fortran E17.11 format of VASP, e.g. -.12345678901E+01"""
+    if x == 0.0:
+        return "0.00000000000E+00"
+    if not np.isfinite(x):
+        return str(x)
+    mantissa, exponent = ("%.*E" % (DIGITS - 1, abs(x))).split("E")
+    digits = mantissa.replace(".", "")
+    return f"{'-' if x < 0 else '0'}.{digits}E{int(exponent) + 1:+03d}"
+
+
+def significands(values):
+    """
+    Sign, (DIGITS)-digit significand and decimal exponent of every value,
+    rounded like printf, or None if a value is not finite or has an
+    exponent of three digits.
+    """
+    magnitude = np.abs(values)
+    zero = magnitude == 0
+    if not np.all(np.isfinite(magnitude)):
+        return None
+    magnitude = np.where(zero, 1.0, magnitude)
+    exponent = np.floor(np.log10(magnitude)).astype(np.int64)
+    if len(exponent) and (exponent.min() < -99 or exponent.max() > 98):
+        return None
+    scaled = magnitude * POWERS_OF_TEN[128 + DIGITS - 1 - exponent]
+    # log10 may be off by one next to a power of ten
+    for i in np.flatnonzero((scaled < 10.0 ** (DIGITS - 1)) | (scaled >= 10.0 ** DIGITS)):
+        exponent[i] += 1 if scaled[i] >= 10.0 ** DIGITS else -1
+        scaled[i] = magnitude[i] * POWERS_OF_TEN[128 + DIGITS - 1 - exponent[i]]
+    significand = np.rint(scaled).astype(np.int64)
+    # scaled is within 3e-5 of the exact value, so a fraction close to one
+    # half may round either way
+    fraction = scaled - np.floor(scaled)
+    for i in np.flatnonzero(np.abs(fraction - 0.5) < 1e-4):
+        mantissa, power = ("%.*E" % (DIGITS - 1, magnitude[i])).split("E")
+        significand[i] = int(mantissa.replace(".", ""))
+        exponent[i] = int(power)
+    carry = significand >= 10 ** DIGITS
+    significand[carry] //= 10
+    exponent[carry] += 1
+    significand[zero] = 0
+    exponent[zero] = 0
+    if len(exponent) and exponent.max() > 98:
+        return None
+    return np.signbit(values), significand, exponent
+
+
+def field_words(fields, offset, dtype=np.uint32):
+    """one (possibly unaligned) word at ``offset`` of every row of ``fields``"""
+    return np.ndarray((len(fields),), dtype=dtype, buffer=fields, offset=offset, strides=(fields.shape[1],))
+
+
+def format_fields(values, format):
+    """
+    (n, FIELD_WIDTH + 1) byte array of ``values`` in the 'chgcar' or 'vasp'
+    format, each with its separating space, None if they cannot be encoded
+    at once
+    """
+    values = np.asarray(values, dtype=float)
+    encoded = significands(values)
+    if encoded is None:
+        return None
+    negative, significand, exponent = encoded
+    if format == 'vasp':
+        zero = significand == 0
+        negative = negative & ~zero
+        exponent = np.where(zero, 0, exponent + 1)
+    # three groups of 3, 4 and 4 digits, exact in floating point
+    rest = significand.astype(float)
+    first = np.floor(rest / 1e8)
+    rest -= first * 1e8
+    second = np.floor(rest / 1e4)
+    rest -= second * 1e4
+    fields = np.empty((len(values), FIELD_WIDTH + 1), dtype=np.uint8)
+    field_words(fields, 0, np.uint16)[...] = SIGNS[format][negative.astype(np.intp)]
+    field_words(fields, 2)[...] = LEADING[format][first.astype(np.intp)]
+    field_words(fields, 6)[...] = DIGIT_WORDS[second.astype(np.intp)]
+    field_words(fields, 10)[...] = DIGIT_WORDS[rest.astype(np.intp)]
+    field_words(fields, 14)[...] = EXPONENTS[exponent + 99]
+    return fields
+
+
+def format_lines(values, format='chgcar'):
+    """``values`` as lines of the VASP layout; the last line may be shorter"""
+    per_line = LINE_VALUES[format]
+    full_lines, rest = divmod(len(values), per_line)
+    fields = None if format == 'chg' else format_fields(values, format)
+    if fields is None:
+        if format == 'vasp':
+            items = [" " + vasp_field(x) for x in values]
+            lines = ["".join(items[i:i + per_line]) for i in range(0, len(items), per_line)]
+            return "".join(line + "\n" for line in lines)
+        value_format = " " + PRINTF_FORMATS[format]
+        line_format = value_format * per_line + "\n"
+        text = line_format * full_lines + (value_format * rest + "\n" if rest else "")
+        return text % tuple(np.asarray(values).tolist())
+
+    line_width = per_line * (FIELD_WIDTH + 1) + 1
+    text = np.empty(full_lines * line_width + (rest * (FIELD_WIDTH + 1) + 1 if rest else 0), dtype=np.uint8)
+    whole = text[:full_lines * line_width].reshape(full_lines, line_width)
+    whole[:, :-1] = fields[:full_lines * per_line].reshape(full_lines, line_width - 1)
+    whole[:, -1] = ord('\n')
+    if rest:
+        text[full_lines * line_width:-1] = fields[full_lines * per_line:].reshape(-1)
+        text[-1] = ord('\n')
+    return text.tobytes().decode('ascii')
+
+
+def write_grid(fobj, grid, scale=1.0, format='chgcar'):
+    """
+    Write the Fortran-ordered ``grid`` times ``scale`` to the text file
+    ``fobj`` in the VASP layout, one slab of z-planes at a time, so neither
+    the scaled grid nor its text is ever held in memory as a whole.
+    """
+    per_line = LINE_VALUES[format]
+    block = per_line * BLOCK_LINES
+    tail = np.empty(0)
+    for start, stop in slabs(grid.shape, grid.itemsize):
+        values = np.concatenate([tail, np.multiply(grid[:, :, start:stop].ravel(order='F'), scale, dtype=float)])
+        whole = len(values) // per_line * per_line
+        for first in range(0, whole, block):
+            fobj.write(format_lines(values[first:min(first + block, whole)], format))
+        tail = values[whole:]
+    if len(tail):
+        fobj.write(format_lines(tail, format))
@@ -481,7 +481,16 @@ class MainWindow(QMainWindow):
         self.splash.showMessage("loading data...",Qt.AlignBottom | Qt.AlignCenter, Qt.black)
         from vasp_data import VaspData
         dir = self.set_working_dir()
-        self.data = VaspData(dir, parse_doscar=parse_doscar, parse_outcar=parse_outcar)
+        self.data = VaspData(dir, parse_doscar=parse_doscar, parse_outcar=parse_outcar,
+                              trajectory_storage=AppConfig.trajectory_storage,
+                              frames=self.outcar_frames())
+
+    @staticmethod
+    def outcar_frames():
+        """the OUTCAR steps selected in the config as a slice, None for all steps"""
+        if not AppConfig.outcar_frames:
+            return None
+        return slice(*AppConfig.outcar_frames)
 
     def load_full_data_after_startup(self):
         """
@@ -517,7 +526,9 @@ class MainWindow(QMainWindow):
         #try:
         if True:
             # Load new data
-            self.data = VaspData(selected_dir, parse_doscar=parse_doscar, parse_outcar=parse_outcar)
+            self.data = VaspData(selected_dir, parse_doscar=parse_doscar, parse_outcar=parse_outcar,
+                                 trajectory_storage=AppConfig.trajectory_storage,
+                                 frames=self.outcar_frames())
 
             # Update widgets
             self.dos_plot_widget.update_data(self.data)
@@ -73,7 +73,7 @@ class ReadNebData:
         for item in dirs:
             neb_dir = os.path.join(self.dir, item)
             if os.path.isdir(neb_dir) and item in self.max_min_dirs:
-                self.data = VaspData(neb_dir, parse_doscar=False)
+                self.data = VaspData(neb_dir, parse_doscar=False, outcar_mode="final")
                 self.start_stop_positions.append(self.data.outcar_coordinates[-1])
                 self.start_stop_energies.append(self.data.outcar_energies[-1])
                 self.start_stop_magnetizations.append(self.data.outcar_data.magnetizations[-1])
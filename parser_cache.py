@@ -0,0 +1,143 @@
+import atexit
+import hashlib
+import os
+
+import numpy as np
+
+CACHE_DIR_NAME = ".vaspui_cache"
+CACHE_VERSION = 2
+HEADER_BYTES = 64 * 1024
+
+
+def cache_dir(source):
+    """directory holding the parsed-data sidecars of the run containing ``source``"""
+    return os.path.join(os.path.dirname(os.path.abspath(source)), CACHE_DIR_NAME)
+
+
+def cache_path(source, suffix=".npz"):
+    return os.path.join(cache_dir(source), os.path.basename(source) + suffix)
+
+
+def file_signature(source):
+    """
+    Cheap fingerprint of a file: its size, modification time and a hash of
+    the first 64 KiB. It changes whenever VASP rewrites or appends to the file.
+    """
+    stat = os.stat(source)
+    with open(source, "rb") as file:
+        header_hash = hashlib.sha1(file.read(HEADER_BYTES)).hexdigest()
+    return np.array([str(CACHE_VERSION), str(stat.st_size), str(stat.st_mtime_ns), header_hash])
+
+
+def load_cache(source, suffix=".npz"):
+    """
+    Return the arrays stored for ``source`` or None if there is no cache or
+    it does not match the current file.
+    """
+    path = cache_path(source, suffix)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as cached:
+            if not np.array_equal(cached["signature"], file_signature(source)):
+                return None
+            return {key: cached[key] for key in cached.files if key != "signature"}
+    except Exception as e:
+        print(f"could not read cache {path}: {e}")
+        return None
+
+
+def save_cache(source, arrays, suffix=".npz"):
+    """
+    store ``arrays`` for ``source``; failures (e.g. read-only directory) are
+    not fatal, they are printed and False is returned
+    """
+    path = cache_path(source, suffix)
+    tmp_path = path + ".tmp.npz"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(tmp_path, signature=file_signature(source), **arrays)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"could not write cache {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def save_array(source, array, suffix):
+    """
+    Store one large array of ``source`` as a .npy file, which, unlike the
+    arrays of a .npz, can be memory-mapped. It is validated through a .npz
+    sidecar written after it.
+    """
+    path = cache_path(source, suffix)
+    tmp_path = path + ".tmp.npy"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"could not write cache {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def load_array(source, suffix, shape, mode="r"):
+    """
+    memory-map an array stored with save_array, None if it is missing or has
+    another shape; with ``mode`` "c" the array can be changed in memory
+    """
+    path = cache_path(source, suffix)
+    if not os.path.exists(path):
+        return None
+    try:
+        array = np.load(path, mmap_mode=mode, allow_pickle=False)
+    except Exception as e:
+        print(f"could not read cache {path}: {e}")
+        return None
+    if array.shape != tuple(shape):
+        return None
+    return array
+
+
+def open_array(source, suffix, shape, dtype=np.float64):
+    """
+    Create a Fortran-ordered .npy file of ``source`` mapped with np.memmap,
+    so a large array can be filled in place without ever being held in
+    memory. None if the file cannot be created.
+    """
+    path = cache_path(source, suffix)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape), fortran_order=True)
+    except Exception as e:
+        print(f"could not write cache {path}: {e}")
+        return None
+
+
+def scratch_array(source, suffix, shape, dtype=np.float64):
+    """
+    Like open_array, for results which are never read back from the cache.
+    The file is removed at once where a mapped file can be removed (POSIX),
+    its space is freed with the array, otherwise when the program exits, so
+    scratch files do not pile up in the cache directory.
+    """
+    array = open_array(source, suffix, shape, dtype)
+    if array is not None:
+        path = cache_path(source, suffix)
+        try:
+            os.remove(path)
+        except OSError:
+            atexit.register(remove_file, path)
+    return array
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -31,6 +31,9 @@ try:
 except ImportError:
     pass
 from VASPparser import PoscarParser as _PoscarParser
+from parser_cache import cache_path, load_array, load_cache, open_array, save_array, save_cache
+from volumetric_slabs import GridPyramid, SpinDensity
+from grid_writer import BLOCK_LINES, format_fields, vasp_field, write_grid
 
 total_tic = time.time()
 import numpy as np
@@ -58,24 +61,26 @@ class CHGCARParser(QThread):
         CHGCAR filename
     chop_number: int
         how many times CHGCAR grid should be shrinked (helps to save memory)
+    dtype: numpy dtype
+        type the grids are stored in, np.float32 halves their memory
     """
     progress = pyqtSignal(int)
     change_label = pyqtSignal(str)
 
-    def __init__(self, filename, chop_number):
+    def __init__(self, filename, chop_number, dtype=np.float64):
         super().__init__()
         self.filename = filename
         self.chop_number = int(chop_number)
+        self.dtype = dtype
         self._unit_cell_vectors = None
         self._grid = None
-        self.alfa = None
-        self.beta = None
+        self.pyramids = {}
 
     #@profile
     def run(self):
         """ runs new thread (if class object is run with start() method) and
         reads the CHGCAR file content"""
-        self.chgcar = VaspChargeDensity(self.filename, initialize=False)
+        self.chgcar = VaspChargeDensity(self.filename, initialize=False, dtype=self.dtype)
         self.chgcar.progress.connect(self.update_progress)
         self.chgcar.change_label.connect(self.update_label)
         self.chgcar.run()
@@ -84,6 +89,10 @@ class CHGCARParser(QThread):
             self.all_numbers = [self.chop(self.chgcar.chg[0], self.chop_number), self.chop(self.chgcar.chgdiff[0], self.chop_number)]
         else:
             self.all_numbers = [self.chop(self.chgcar.chg[0], self.chop_number)]
+        # all_numbers is the only store of the grids, math and supercells
+        # replace them there without an old copy staying alive
+        self.chgcar.chg = []
+        self.chgcar.chgdiff = []
         self.atoms = self.chgcar.atoms[0]
         self.aug = self.chgcar.aug
         self.aug_diff = self.chgcar.augdiff
@@ -96,23 +105,47 @@ class CHGCARParser(QThread):
     def update_label(self, text):
         self.change_label.emit(text)
 
+    @property
+    def alfa(self):
+        """spin-up density (total + spin) / 2, computed when it is read; None without spin"""
+        if len(self.all_numbers) < 2:
+            return None
+        return SpinDensity(self.all_numbers[0], self.all_numbers[1], 1)
+
+    @property
+    def beta(self):
+        """spin-down density (total - spin) / 2, computed when it is read; None without spin"""
+        if len(self.all_numbers) < 2:
+            return None
+        return SpinDensity(self.all_numbers[0], self.all_numbers[1], -1)
+
     def calc_alfa_beta(self):
-        """calculate alfa and beta density
+        """alfa and beta density
         Returns:
-            np.array
+            SpinDensity
                 with alfa charge density
-            np.array
+            SpinDensity
                 with beta density
         """
-        if self.alfa is None:
-            [total_density, spin_density] = self.all_numbers
-            sum_total = 2 * total_density
-            sum_spin = 2 * spin_density
-            alfa_density = (sum_total + sum_spin) / 4
-            beta_density = (sum_total - sum_spin) / 4
-            self.alfa = alfa_density
-            self.beta = beta_density
-            return alfa_density, beta_density
+        return self.alfa, self.beta
+
+    def density(self, channel):
+        """grid of the total, spin, alfa or beta density, None for anything else"""
+        grids = {"total": self.all_numbers[0],
+                 "spin": self.all_numbers[1] if len(self.all_numbers) > 1 else None,
+                 "alfa": self.alfa,
+                 "beta": self.beta}
+        return grids.get(channel)
+
+    def pyramid(self, channel):
+        """block-averaged levels of a density, built on first use"""
+        if channel not in self.pyramids:
+            self.pyramids[channel] = GridPyramid(self.density(channel))
+        return self.pyramids[channel]
+
+    def reset_pyramids(self):
+        """forget the levels built so far, after the grids were changed"""
+        self.pyramids = {}
 
     def voxel_size(self):
         vecs = self.atoms.cell.cellpar()[:3]
@@ -230,24 +263,26 @@ class CHGCARParser(QThread):
         if format == 'small':
             formatted_item = format(item, ".3f")
         elif format == 'vasp':
-            x = item
-            if x == 0.0:
-                return " 0.00000000000E+00"  # special case
-            exp = 0
-            norm_x = abs(x)
-            while norm_x >= 1.0:
-                norm_x /= 10.0
-                exp += 1
-            while norm_x < 0.1:
-                norm_x *= 10.0
-                exp -= 1
-            sign = "-" if x < 0 else ""
-            formatted_item = f"{sign}{norm_x:.11f}E{exp:+03d}"
-            if formatted_item[0] == '-':
-                formatted_item = formatted_item[2:]
-                formatted_item = "-" + formatted_item
+            formatted_item = vasp_field(item)
         return formatted_item
 
+    def format_items(self, values, format='small'):
+        """values followed by a tab, every tenth by a newline, as in save_total_file"""
+        if format == 'small':
+            full_lines, rest = divmod(len(values), 10)
+            text = ("%.3f\t" * 9 + "%.3f\n") * full_lines + "%.3f\t" * rest
+            return text % tuple(np.asarray(values).tolist())
+        if format == 'vasp':
+            fields = format_fields(values, 'vasp')
+            if fields is not None:
+                # the separator of each field moves behind it
+                fields[:, :-1] = fields[:, 1:].copy()
+                fields[:, -1] = ord('\t')
+                fields[9::10, -1] = ord('\n')
+                return fields.tobytes().decode('ascii')
+        items = [self.get_formatted_item(item, format) for item in np.asarray(values).tolist()]
+        return "".join(item + ("\n" if i % 10 == 9 else "\t") for i, item in enumerate(items))
+
     def save_total_file(self, output_file_path, chop_number, format='small'):
         """" save chopped file as CHGCAR-total-choppedx{chop_num}.vasp with total charge density """
         with open(output_file_path, 'w') as output_file:
@@ -255,61 +290,19 @@ class CHGCARParser(QThread):
                 output_file.write(list)
             #output_file.write(" ".join([str(x // chop_number) for x in self.grid_result]) + "\n")
 
-            for i, item in enumerate(self.all_numbers[0].flatten(), 1):
-                formatted_item = self.get_formatted_item(item, format)
-                output_file.write(str(formatted_item))
-                if i % 10 == 0:
-                    output_file.write("\n")
-                else:
-                    output_file.write("\t")
+            values = self.all_numbers[0].ravel()
+            block = 10 * BLOCK_LINES
+            for start in range(0, len(values), block):
+                output_file.write(self.format_items(values[start:start + block], format))
 
     def _write_chg(self, fobj, chg, volume, format='chg'):
         """Write charge density
 
-        Utility function similar to _read_chg but for writing.
+        Utility function similar to _read_chg but for writing. The values
+        are formatted a block at a time and streamed by write_grid.
 
         """
-        # Make a 1D copy of chg, must take transpose to get ordering right
-        chgtmp = chg.T.ravel()
-        # Multiply by volume
-        chgtmp = chgtmp * volume
-        # Must be a tuple to pass to string conversion
-        chgtmp = tuple(chgtmp)
-        # CHG format - 10 columns
-        if format.lower() == 'chg':
-            # Write all but the last row
-            for ii in range((len(chgtmp) - 1) // 10):
-                fobj.write(' %#11.5G %#11.5G %#11.5G %#11.5G %#11.5G\
-    %#11.5G %#11.5G %#11.5G %#11.5G %#11.5G\n' % chgtmp[ii * 10:(ii + 1) * 10])
-            # If the last row contains 10 values then write them without a
-            # newline
-            if len(chgtmp) % 10 == 0:
-                fobj.write(' %#11.5G %#11.5G %#11.5G %#11.5G %#11.5G'
-                           ' %#11.5G %#11.5G %#11.5G %#11.5G %#11.5G' %
-                           chgtmp[len(chgtmp) - 10:len(chgtmp)])
-            # Otherwise write fewer columns without a newline
-            else:
-                for ii in range(len(chgtmp) % 10):
-                    fobj.write((' %#11.5G') %
-                               chgtmp[len(chgtmp) - len(chgtmp) % 10 + ii])
-        # Other formats - 5 columns
-        else:
-            # Write all but the last row
-            for ii in range((len(chgtmp) - 1) // 5):
-                fobj.write(' %17.10E %17.10E %17.10E %17.10E %17.10E\n' %
-                           chgtmp[ii * 5:(ii + 1) * 5])
-            # If the last row contains 5 values then write them without a
-            # newline
-            if len(chgtmp) % 5 == 0:
-                fobj.write(' %17.10E %17.10E %17.10E %17.10E %17.10E' %
-                           chgtmp[len(chgtmp) - 5:len(chgtmp)])
-            # Otherwise write fewer columns without a newline
-            else:
-                for ii in range(len(chgtmp) % 5):
-                    fobj.write((' %17.10E') %
-                               chgtmp[len(chgtmp) - len(chgtmp) % 5 + ii])
-        # Write a newline whatever format it is
-        fobj.write('\n')
+        write_grid(fobj, chg, volume, 'chg' if format.lower() == 'chg' else 'chgcar')
 
     def save_all_file(self, filename, spin_up, spin_down, aug, augdiff):
         """Write VASP charge density in CHG format.
@@ -351,22 +344,30 @@ class CHGCARParser(QThread):
 class VaspChargeDensity(QObject):
     """Class for representing VASP charge density.
 
-    Filename is normally CHG."""
+    Filename is normally CHG.
+
+    The parsed grids are stored as .npy files in the cache directory next to
+    the file, with the POSCAR headers and augmentation charges in a .npz
+    sidecar; a file which did not change since is memory-mapped from there
+    instead of being parsed again. Grids of each dtype have their own cache
+    files, so switching the dtype does not overwrite the other one."""
     # Can the filename be CHGCAR?  There's a povray tutorial
     # in doc/tutorials where it's CHGCAR as of January 2021.  --askhl
     progress = pyqtSignal(int)
     change_label = pyqtSignal(str)
 
-    def __init__(self, filename, initialize=True):
+    def __init__(self, filename, initialize=True, dtype=np.float64):
         super().__init__()
         self.change_label.emit("initializing...")
         # Instance variables
         self.filename = filename
+        self.dtype = np.dtype(dtype)  # float32 halves the memory of the grids
         self.atoms = []  # List of Atoms objects
         self.chg = []  # Charge density
         self.chgdiff = []  # Charge density difference, if spin polarized
         self.aug = ''  # Augmentation charges, not parsed just a big string
         self.augdiff = ''  # Augmentation charge differece, is spin polarized
+        self.header_spans = []  # Byte ranges of the POSCAR headers in the file
 
         # Note that the augmentation charge is not a list, since they
         # are needed only for CHGCAR files which store only a single
@@ -374,17 +375,128 @@ class VaspChargeDensity(QObject):
         if initialize:
             self.run()
 
+    CACHE_SUFFIX = ".chgcar.npz"
+
+    @staticmethod
+    def cache_suffix(suffix, dtype):
+        """``suffix`` of a cache file of ``dtype`` grids; float64 files keep the plain names"""
+        dtype = np.dtype(dtype)
+        return suffix if dtype == np.float64 else f".{dtype.name}{suffix}"
+
     def run(self):
         if self.filename is not None:
             tic = time.time()
-            self.read(self.filename)
+            if self.load_cached(self.filename):
+                print("Reading CHGCAR from cache")
+            else:
+                self.read(self.filename)
+                # map the stored grids back copy-on-write, so edits never reach the cache
+                if self.save_cached(self.filename):
+                    self.load_cached(self.filename)
             toc = time.time()
             print(f'read CHGCAR file took {toc - tic} seconds')
+
+    def new_grid(self, filename, name, index, ng):
+        """
+        Fortran-ordered array of one density block. It is mapped from a file in
+        the cache directory, which save_cached moves into place, so the
+        density is streamed to disk instead of being held in memory; if the
+        file cannot be created it is an ordinary array.
+        """
+        grid = open_array(filename, self.cache_suffix(f".{name}{index}.npy.part", self.dtype), ng, self.dtype)
+        if grid is None:
+            return np.empty(ng, dtype=self.dtype, order='F')
+        return grid
+
+    def save_cached(self, filename):
+        """
+        Store the parsed grids, headers and augmentation charges of
+        ``filename``. Returns True if load_cached can map them back. The
+        grids stay available whether or not the cache could be written.
+        """
+        if len(self.chg) == 0:
+            return False
+        parts = []
+        for name, grids in (("chg", self.chg), ("chgdiff", self.chgdiff)):
+            for i, grid in enumerate(grids):
+                suffix = self.cache_suffix(f".{name}{i}.npy", self.dtype)
+                part = cache_path(filename, suffix + ".part")
+                if isinstance(grid, np.memmap) and grid.filename == part:
+                    grid.flush()
+                    parts.append((name, i, suffix))
+                elif not save_array(filename, grid, suffix):
+                    return False
+        with open(filename, 'rb') as raw:
+            headers = []
+            for start, stop in self.header_spans:
+                raw.seek(start)
+                headers.append(raw.read(stop - start).decode())
+        counts = np.array(len(self.chg)), np.array(len(self.chgdiff))
+        # the mapped files are closed before they are renamed
+        grids = grid = None
+        for name, i, suffix in parts:
+            getattr(self, name)[i] = None
+        moved = []
+        try:
+            for name, i, suffix in parts:
+                os.replace(cache_path(filename, suffix + ".part"), cache_path(filename, suffix))
+                moved.append(suffix)
+        except OSError as e:
+            print(f"could not write cache {cache_path(filename, suffix)}: {e}")
+        # mapped again from wherever they are now, copy-on-write
+        for name, i, suffix in parts:
+            getattr(self, name)[i] = load_array(filename, suffix if suffix in moved else suffix + ".part",
+                                                self._grid, mode="c")
+        if len(moved) < len(parts):
+            return False
+        # augmentation charges as bytes, a unicode array would take four times the size
+        return save_cache(filename, {"grid": np.array(self._grid),
+                                     "images": counts[0],
+                                     "spin_images": counts[1],
+                                     "headers": np.array(headers),
+                                     "aug": np.frombuffer(self.aug.encode(), dtype=np.uint8),
+                                     "augdiff": np.frombuffer(self.augdiff.encode(), dtype=np.uint8)},
+                          self.cache_suffix(self.CACHE_SUFFIX, self.dtype))
+
+    def load_cached(self, filename):
+        """
+        Memory-map the grids stored by save_cached, copy-on-write, so editing
+        the density never reaches the cache. Returns False if there is no
+        valid cache.
+        """
+        cached = load_cache(filename, self.cache_suffix(self.CACHE_SUFFIX, self.dtype))
+        if cached is None:
+            return False
+        self.change_label.emit("reading cached CHGCAR...")
+        grid = tuple(int(n) for n in cached["grid"])
+        chg = [load_array(filename, self.cache_suffix(f".chg{i}.npy", self.dtype), grid, mode="c")
+               for i in range(int(cached["images"]))]
+        chgdiff = [load_array(filename, self.cache_suffix(f".chgdiff{i}.npy", self.dtype), grid, mode="c")
+                   for i in range(int(cached["spin_images"]))]
+        if len(chg) == 0 or any(array is None for array in chg + chgdiff):
+            return False
+        if chg[0].dtype != self.dtype:
+            print(f"cached grids are {chg[0].dtype}, {self.dtype} grids are read from {filename}")
+            return False
+        import io
+        import ase.io.vasp as aiv
+        self.atoms = [aiv.read_vasp_configuration(io.StringIO(str(header))) for header in cached["headers"]]
+        self.chg = chg
+        self.chgdiff = chgdiff
+        self.aug = cached["aug"].tobytes().decode()
+        self.augdiff = cached["augdiff"].tobytes().decode()
+        self._grid = grid
+        self.voxel_size = self.atoms[0].cell.cellpar()[:3] / self._grid
+        self.progress.emit(100)
+        return True
     def is_spin_polarized(self):
         if len(self.chgdiff) > 0:
             return True
         return False
 
+    # bytes of text decoded at once by _read_chg
+    READ_CHUNK = 16 * 1024 ** 2
+
     def _read_chg(self, fobj, chg, volume, spin=False, debug=False):
         """Read charge from file object
 
@@ -394,25 +506,56 @@ class VaspChargeDensity(QObject):
         output the file position will be left at the end of the
         block. The chg array must be of the correct dimensions.
 
+        The block is read as bytes in chunks of READ_CHUNK, each cut at a
+        line end and converted with one np.fromstring call; progress is
+        reported by the bytes consumed. The block ends after as many lines
+        as needed with the number of values per line of its first line.
         """
         # VASP writes charge density as
         # WRITE(IU,FORM) (((C(NX,NY,NZ),NX=1,NGXC),NY=1,NGYZ),NZ=1,NGZC)
-        # Fortran nested implied do loops; innermost index fastest
-        # First, just read it in
-        max_z = chg.shape[2]
-        sig_interval = max(1, max_z // 100)  # avoid division by zero
-
-        for i, zz in enumerate(range(max_z)):
-            if i % sig_interval == 0:
-                # Calculate percentage for this half (0 to 50 or 50 to 100)
-                progress_half = int((i / max_z) * 50)
+        # Fortran nested implied do loops; innermost index fastest,
+        # which is the memory order of a Fortran-ordered chg
+        count = chg.size
+        flat = chg.reshape(-1, order='F')
+        start = fobj.tell()
+        with open(fobj.name, 'rb') as raw:
+            raw.seek(start)
+            first_line = raw.readline()
+            per_line = max(1, len(first_line.split()))
+            expected_bytes = max(1, len(first_line) * -(-count // per_line))
+            raw.seek(start)
+
+            filled = 0
+            consumed = 0
+            tail = b''
+            while filled < count:
+                chunk = raw.read(self.READ_CHUNK)
+                if not chunk and not tail:
+                    raise ValueError(f"{fobj.name}: density block ends after {filled} of {count} values")
+                data = tail + chunk
+                cut = data.rfind(b'\n') + 1 if chunk else len(data)
+                if cut == 0:
+                    tail = data
+                    continue
+                # never read past the last line of the block
+                lines_left = -(-(count - filled) // per_line)
+                line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8, count=cut) == 10)
+                if len(line_ends) >= lines_left:
+                    cut = line_ends[lines_left - 1] + 1
+                values = np.fromstring(data[:cut], sep=' ')
+                values = values[:count - filled]
+                np.divide(values, volume, out=flat[filled:filled + len(values)])
+                filled += len(values)
+                consumed += cut
+                tail = data[cut:]
+                progress_half = min(int(consumed / expected_bytes * 50), 49)
                 if not spin:
                     self.progress.emit(progress_half + 1)  # from 1 to 50
                 else:
                     self.progress.emit(progress_half + 51)  # from 51 to 100
-            for j, yy in enumerate(range(chg.shape[1])):
-                chg[:, yy, zz] = np.fromfile(fobj, count=chg.shape[0], sep=' ')
-        chg /= volume
+        if not np.shares_memory(flat, chg):
+            chg[...] = flat.reshape(chg.shape, order='F')
+        fobj.seek(start + consumed)
 
     def read(self, filename, debug=False):
         """Read CHG or CHGCAR file.
@@ -438,14 +581,18 @@ class VaspChargeDensity(QObject):
             self.chgdiff = []
             self.aug = ''
             self.augdiff = ''
+            # byte ranges of the POSCAR headers, kept in the cache
+            self.header_spans = []
             while True:
                 try:
                     self.change_label.emit("reading positions...")
+                    header_start = fd.tell()
                     atoms = aiv.read_vasp_configuration(fd)
                 except (KeyError, RuntimeError, ValueError):
                     # Probably an empty line, or we tried to read the
                     # augmentation occupancies in CHGCAR
                     break
+                self.header_spans.append((header_start, fd.tell()))
 
                 # Note: We continue reading from the same file, and
                 # this relies on read_vasp() to read no more lines
@@ -457,7 +604,7 @@ class VaspChargeDensity(QObject):
                 self._grid = ng
                 self.voxel_size = atoms.cell.cellpar()[:3] / self._grid
                 self.change_label.emit("Initializing matrices...")
-                chg = np.empty(ng)
+                chg = self.new_grid(filename, 'chg', len(self.chg), ng)
                 self.change_label.emit("reading total density...")
                 tic = time.time()
                 self._read_chg(fd, chg, atoms.get_volume(), spin=False, debug=DEBUG)
@@ -481,7 +628,7 @@ class VaspChargeDensity(QObject):
                             self.aug = ''.join(augs)
                             augs = []
                             self.change_label.emit("Initializing matrices...")
-                            chgdiff = np.empty(ng)
+                            chgdiff = self.new_grid(filename, 'chgdiff', len(self.chgdiff), ng)
                             self.change_label.emit("reading spin density...")
                             self._read_chg(fd, chgdiff, atoms.get_volume(), spin=True, debug=DEBUG)
                             self.chgdiff.append(chgdiff)
@@ -497,7 +644,7 @@ class VaspChargeDensity(QObject):
                         augs = []
                 elif line1.split() == ngr:
                     self.change_label.emit("Initializing matrices...")
-                    chgdiff = np.empty(ng)
+                    chgdiff = self.new_grid(filename, 'chgdiff', len(self.chgdiff), ng)
                     self.change_label.emit("reading spin density...")
                     self._read_chg(fd, chgdiff, atoms.get_volume(), spin=True, debug=DEBUG)
                     self.chgdiff.append(chgdiff)
@@ -508,50 +655,11 @@ class VaspChargeDensity(QObject):
     def _write_chg(self, fobj, chg, volume, format='chg'):
         """Write charge density
 
-        Utility function similar to _read_chg but for writing.
+        Utility function similar to _read_chg but for writing. The values
+        are formatted a block at a time and streamed by write_grid.
 
         """
-        # Make a 1D copy of chg, must take transpose to get ordering right
-        chgtmp = chg.T.ravel()
-        # Multiply by volume
-        chgtmp = chgtmp * volume
-        # Must be a tuple to pass to string conversion
-        chgtmp = tuple(chgtmp)
-        # CHG format - 10 columns
-        if format.lower() == 'chg':
-            # Write all but the last row
-            for ii in range((len(chgtmp) - 1) // 10):
-                fobj.write(' %#11.5G %#11.5G %#11.5G %#11.5G %#11.5G\
- %#11.5G %#11.5G %#11.5G %#11.5G %#11.5G\n' % chgtmp[ii * 10:(ii + 1) * 10])
-            # If the last row contains 10 values then write them without a
-            # newline
-            if len(chgtmp) % 10 == 0:
-                fobj.write(' %#11.5G %#11.5G %#11.5G %#11.5G %#11.5G'
-                           ' %#11.5G %#11.5G %#11.5G %#11.5G %#11.5G' %
-                           chgtmp[len(chgtmp) - 10:len(chgtmp)])
-            # Otherwise write fewer columns without a newline
-            else:
-                for ii in range(len(chgtmp) % 10):
-                    fobj.write((' %#11.5G') %
-                               chgtmp[len(chgtmp) - len(chgtmp) % 10 + ii])
-        # Other formats - 5 columns
-        else:
-            # Write all but the last row
-            for ii in range((len(chgtmp) - 1) // 5):
-                fobj.write(' %17.10E %17.10E %17.10E %17.10E %17.10E\n' %
-                           chgtmp[ii * 5:(ii + 1) * 5])
-            # If the last row contains 5 values then write them without a
-            # newline
-            if len(chgtmp) % 5 == 0:
-                fobj.write(' %17.10E %17.10E %17.10E %17.10E %17.10E' %
-                           chgtmp[len(chgtmp) - 5:len(chgtmp)])
-            # Otherwise write fewer columns without a newline
-            else:
-                for ii in range(len(chgtmp) % 5):
-                    fobj.write((' %17.10E') %
-                               chgtmp[len(chgtmp) - len(chgtmp) % 5 + ii])
-        # Write a newline whatever format it is
-        fobj.write('\n')
+        write_grid(fobj, chg, volume, 'chg' if format.lower() == 'chg' else 'chgcar')
 
     def write(self, filename, format=None):
         """Write VASP charge density in CHG format.
@@ -602,6 +710,62 @@ class VaspChargeDensity(QObject):
                     fd.write('\n')
 
 
+
+def cache_chgcar(filename, dtype=np.float64):
+    """
+    Parse ``filename`` into its cache files; run in a worker process by
+    CHGCARPoolLoader. Returns True if the cache was written.
+    """
+    chgcar = VaspChargeDensity(filename, initialize=False, dtype=dtype)
+    chgcar.run()
+    return load_cache(filename, VaspChargeDensity.cache_suffix(VaspChargeDensity.CACHE_SUFFIX, dtype)) is not None
+
+
+class CHGCARPoolLoader(QThread):
+    """
+    Reads several CHG files at once, each in its own process, since text
+    parsing in threads runs one file at a time. The workers leave the
+    parsed grids in the cache directory and the CHGCARParser objects in
+    ``parsers`` map them, so the grids are shared through the page cache
+    and never copied between processes. A file whose cache could not be
+    written is parsed in this thread.
+    """
+    progress = pyqtSignal(int)
+    change_label = pyqtSignal(str)
+
+    def __init__(self, filenames, workers=None, dtype=np.float64):
+        super().__init__()
+        self.filenames = list(filenames)
+        self.workers = workers
+        self.dtype = dtype
+        self.parsers = {}
+
+    def run(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        if len(self.filenames) == 0:
+            return
+        workers = self.workers or min(len(self.filenames), os.cpu_count() or 1)
+        self.change_label.emit(f"reading {len(self.filenames)} files...")
+        # workers are spawned, forking a process with running Qt threads is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(cache_chgcar, filename, self.dtype): filename for filename in self.filenames}
+            for done, future in enumerate(as_completed(futures), 1):
+                filename = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"could not read {filename} in a worker process: {e}")
+                try:
+                    parser = CHGCARParser(filename, 1, self.dtype)
+                    parser.run()
+                    self.parsers[filename] = parser
+                except Exception as e:
+                    print(f"could not read {filename}: {e}")
+                self.change_label.emit(f"read {done} of {len(futures)} files")
+                self.progress.emit(int(done / len(futures) * 100))
+
+
 if __name__ == '__main__':
     chgcar = CHGCARParser("/net/scratch/hscra/plgrid/plglnowakowski/3.LUMI/6.interface/1.precursors_and_clusters/5.larger_513/CHGCAR", 1)
     chgcar.run()
\ No newline at end of file
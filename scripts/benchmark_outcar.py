@@ -0,0 +1,51 @@
+"""
+Time OutcarParser against ParallelOutcarParser on one OUTCAR.
+
+usage: python scripts/benchmark_outcar.py DIRECTORY [WORKERS ...]
+
+DIRECTORY holds the OUTCAR and its POSCAR (or CONTCAR). The parsers run
+without the cache sidecar, so every run reads the whole file; WORKERS
+defaults to 1 2 4 8. The arrays of every parallel run are checked against
+the serial parse.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from VASPparser import OutcarParser, ParallelOutcarParser
+
+
+def timed(parser, directory, **kwargs):
+    start = time.perf_counter()
+    outcar = parser(directory, "OUTCAR", use_cache=False, **kwargs)
+    return time.perf_counter() - start, outcar
+
+
+def same_arrays(first, second):
+    return all(np.array_equal(np.asarray(getattr(first, name)), np.asarray(getattr(second, name)))
+               for name in ["positions", "forces", "energies", "magnetizations"])
+
+
+def main(directory, workers):
+    size = os.path.getsize(os.path.join(directory, "OUTCAR"))
+    serial_time, serial = timed(OutcarParser, directory)
+    print(f"OUTCAR: {size / 1024 ** 2:.1f} MiB, {len(serial.positions)} ionic steps, {serial.atom_count} atoms")
+    print(f"{'parser':<24}{'time [s]':>10}{'speedup':>10}")
+    print(f"{'OutcarParser':<24}{serial_time:>10.2f}{1:>10.2f}")
+    for count in workers:
+        parallel_time, parallel = timed(ParallelOutcarParser, directory, workers=count)
+        label = f"Parallel, {count} workers"
+        print(f"{label:<24}{parallel_time:>10.2f}{serial_time / parallel_time:>10.2f}")
+        if not same_arrays(serial, parallel):
+            print(f"arrays of {label} differ from OutcarParser")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], [int(count) for count in sys.argv[2:]] or [1, 2, 4, 8])
@@ -108,6 +108,8 @@ class StructureControlsWidget(QWidget):
         self.add_scatter_plot()
         self.update_scatter()
         self.update_geometry_status()
+        if self.follow_cb.isChecked():
+            self.toggle_follow(True)
 
     def initUI(self):
         self.vlayout = QVBoxLayout(self)
@@ -323,6 +325,21 @@ class StructureControlsWidget(QWidget):
         self.end_geometry_button.clicked.connect(self.end_geometry)
 
         self.geometry_frame_layout.addLayout(slider_layout)
+
+        # follow mode: pick up ionic steps appended by a running job
+        self.follow_cb = QtWidgets.QCheckBox()
+        self.follow_cb.setChecked(False)
+        self.follow_cb.setText("follow running job")
+        self.follow_cb.stateChanged.connect(self.toggle_follow)
+        self.geometry_frame_layout.addWidget(self.follow_cb)
+
+        self.follow_watcher = QtCore.QFileSystemWatcher(self)
+        self.follow_watcher.fileChanged.connect(self.follow_running_job)
+        # network filesystems do not always deliver change notifications
+        self.follow_timer = QtCore.QTimer(self)
+        self.follow_timer.setInterval(5000)
+        self.follow_timer.timeout.connect(self.follow_running_job)
+
         self.vlayout.addWidget(self.geometry_frame)
 
     def planes_layout(self):
@@ -405,6 +422,18 @@ class StructureControlsWidget(QWidget):
         y = self.structure_plot_widget.data.outcar_energies
         x = list(range(len(y)))
         self.line_plot = self.energy_plot_widget.plot(x, y)
+        self.set_energy_plot_title()
+
+    def set_energy_plot_title(self):
+        """when only some ionic steps are loaded, show the energy range of the whole run"""
+        data = self.structure_plot_widget.data
+        stats = getattr(data, "energy_statistics", None)
+        if getattr(data, "frames", None) is None or stats is None:
+            self.energy_plot_widget.setTitle("")
+            return
+        self.energy_plot_widget.setTitle(f"{len(data.outcar_energies)} of {stats['count']} steps | "
+                                         f"E min {stats['min']:.4f}, max {stats['max']:.4f}, "
+                                         f"mean {stats['mean']:.4f} eV")
 
     def add_scatter_plot(self):
         """
@@ -426,6 +455,48 @@ class StructureControlsWidget(QWidget):
         s1.addPoints(x, y)
         s1.sigClicked.connect(self.clicked_scatter_plot)
         self.energy_plot_widget.addItem(s1)
+        self.scatter_plot = s1
+
+    def extend_energy_plot(self):
+        """add energies of new ionic steps without rebuilding the plot items"""
+        y = self.structure_plot_widget.data.outcar_energies
+        self.line_plot.setData(np.arange(len(y)), y)
+        start = len(self.scatter_plot.data)
+        if start < len(y):
+            self.scatter_plot.addPoints(list(range(start, len(y))), list(y[start:]))
+        self.set_energy_plot_title()
+
+    def toggle_follow(self, flag):
+        watched = self.follow_watcher.files()
+        if watched:
+            self.follow_watcher.removePaths(watched)
+        if flag:
+            files = self.structure_plot_widget.data.followed_files()
+            if files:
+                self.follow_watcher.addPaths(files)
+            self.follow_timer.start()
+            self.follow_running_job()
+        else:
+            self.follow_timer.stop()
+
+    def follow_running_job(self, *args):
+        """append ionic steps written since the last check to the slider and the energy plot"""
+        data = self.structure_plot_widget.data
+        new_steps = data.refresh()
+        # a file replaced on disk is dropped from the watcher, so watch it again
+        for file in data.followed_files():
+            if file not in self.follow_watcher.files() and os.path.exists(file):
+                self.follow_watcher.addPath(file)
+        if new_steps == 0:
+            return
+
+        show_last = self.geometry_slider.value() == self.geometry_slider.maximum()
+        self.extend_energy_plot()
+        # energies and geometries of a step are written to different files, show only complete steps
+        self.geometry_slider.setMaximum(max(0, min(len(data.outcar_energies), len(data.outcar_coordinates)) - 1))
+        if show_last:
+            self.geometry_slider.setValue(self.geometry_slider.maximum())
+        self.update_geometry_status()
 
     def clicked_scatter_plot(self, plot, points):
         """
@@ -497,30 +568,18 @@ class StructureControlsWidget(QWidget):
         if total_magnetization is not None:
             return total_magnetization
 
-        magnetizations = self._value_at_index(getattr(outcar_data, "magnetizations", None), index)
+        magnetizations = self.structure_plot_widget.data.trajectory.step_magnetizations(index)
         if magnetizations is None:
             return None
-        try:
-            return np.sum(np.array(magnetizations, dtype=float))
-        except (TypeError, ValueError):
-            return None
+        return np.sum(magnetizations)
 
     def _current_max_force(self, index):
-        outcar_data = getattr(self.structure_plot_widget.data, "outcar_data", None)
-        if outcar_data is None:
+        if not hasattr(self.structure_plot_widget.data, "outcar_data") or index < 0:
             return None
 
-        forces = self._value_at_index(getattr(outcar_data, "forces", None), index)
-        if forces is None:
-            return None
-        try:
-            forces = np.array(forces, dtype=float)
-        except (TypeError, ValueError):
-            return None
-        if forces.size == 0:
+        forces = self.structure_plot_widget.data.trajectory.step_forces(index)
+        if forces is None or forces.size == 0:
             return None
-        if forces.ndim == 1:
-            return np.max(np.abs(forces))
         return np.max(np.linalg.norm(forces, axis=1))
 
     @staticmethod
@@ -595,7 +654,7 @@ class StructureControlsWidget(QWidget):
         for actor in self.structure_plot_widget.sphere_actors:
             self.plotter.renderer.RemoveActor(actor)
         self.structure_plot_widget.sphere_actors = []
-        coordinates = self.structure_plot_widget.data.outcar_coordinates[self.geometry_slider.value()]
+        coordinates = self.structure_plot_widget.data.trajectory.frame(self.geometry_slider.value())
         self.update_geometry_status()
         self.structure_plot_widget.assign_missing_colors()
         for idx, (coord, col) in enumerate(zip(coordinates, self.structure_plot_widget.atom_colors)):
@@ -674,7 +733,7 @@ class StructureControlsWidget(QWidget):
 
         bond_threshold = self.bond_threshold
         geometry_slider_value = self.geometry_slider.value()
-        coordinates = self.structure_plot_widget.data.outcar_coordinates[geometry_slider_value]
+        coordinates = self.structure_plot_widget.data.trajectory.frame(geometry_slider_value)
 
         if self.structure_plot_widget.bond_actors is not None:
             for actor in self.structure_plot_widget.bond_actors:
@@ -690,7 +749,7 @@ class StructureControlsWidget(QWidget):
         atom_color_indices = list(range(len(coordinates)))
         if not show_all:
             atom_color_indices = [i for i, v in enumerate(visibility_mask) if v == 1]
-            coordinates = [coordinates[i] for i in atom_color_indices]
+            coordinates = coordinates[atom_color_indices]
         if len(coordinates) < 2:
             self.structure_plot_widget.plotter.renderer.Render()
             return
@@ -834,7 +893,7 @@ class StructureControlsWidget(QWidget):
         """ switches on and off constrains visibility"""
         if self.constrains_all_cb.isChecked():
             self.structure_plot_widget.plotter.renderer.RemoveActor(self.structure_plot_widget.constrain_actor)
-            coords = np.array(self.structure_plot_widget.data.outcar_coordinates[self.geometry_slider.value()])
+            coords = self.structure_plot_widget.data.trajectory.frame(self.geometry_slider.value())
             constr = [constr[0] for constr in self.structure_plot_widget.data.all_constrains]
             self.structure_plot_widget.constrain_actor = self.plotter.add_point_labels(coords, constr, font_size=30,
                                                                                        show_points=False,
@@ -862,11 +921,8 @@ class StructureControlsWidget(QWidget):
             indices, coordinates = self.find_indices_between_planes()
             coords = []
             magnet = []
-            outcar_data = getattr(self.structure_plot_widget.data, "outcar_data", None)
-            slider_value = self.geometry_slider.value()
-            if outcar_data is not None and slider_value < len(outcar_data.magnetizations):
-                mag = outcar_data.magnetizations[slider_value]
-            else:
+            mag = self.structure_plot_widget.data.trajectory.step_magnetizations(self.geometry_slider.value())
+            if mag is None:
                 mag = ["N/A" for _ in self.structure_plot_widget.data.symbols]
             for i in range(len(indices)):
                 coords.append(list(coordinates[indices[i]]))
@@ -880,7 +936,7 @@ class StructureControlsWidget(QWidget):
         self.structure_plot_widget.plotter.renderer.RemoveActor(self.structure_plot_widget.symb_actor)
         if self.numbers_cb.isChecked():
             symbols = self.structure_plot_widget.data.atoms_symb_and_num
-            coords = np.array(self.structure_plot_widget.data.outcar_coordinates[self.geometry_slider.value()])
+            coords = self.structure_plot_widget.data.trajectory.frame(self.geometry_slider.value())
             self.structure_plot_widget.symb_actor = self.plotter.add_point_labels(coords, symbols, font_size=30,
                                                                                   show_points=False, always_visible=True,
                                                                                   shape=None)
@@ -891,7 +947,7 @@ class StructureControlsWidget(QWidget):
         height = slidervalue[0] / 100 * self.structure_plot_widget.data.z
         end = slidervalue[1] / 100 * self.structure_plot_widget.data.z
         indices = []
-        global_coordinates = np.array(self.structure_plot_widget.data.outcar_coordinates[self.geometry_slider.value()])
+        global_coordinates = self.structure_plot_widget.data.trajectory.frame(self.geometry_slider.value())
         if self.selected_actors != []:
             coordinates = []
             for actor in self.selected_actors:
@@ -899,7 +955,7 @@ class StructureControlsWidget(QWidget):
                 coordinates.append(list(center))
             coordinates = np.array(coordinates)
             for center in coordinates:
-                for index, coord in enumerate(np.array(self.structure_plot_widget.data.outcar_coordinates[self.geometry_slider.value()])):
+                for index, coord in enumerate(global_coordinates):
                     if (np.round(center, 2) == np.round(coord, 2)).all():
                         indices.append(index)
         else:
@@ -924,9 +980,9 @@ class StructureControlsWidget(QWidget):
     def add_symbol_and_number(self):
         """ renders an atom symbol and number"""
         self.structure_plot_widget.plotter.renderer.RemoveActor(self.structure_plot_widget.symb_actor)
-        coordinates = self.structure_plot_widget.data.outcar_coordinates[self.geometry_slider.value()]
+        coordinates = self.structure_plot_widget.data.trajectory.frame(self.geometry_slider.value())
         symb_num = self.structure_plot_widget.data.atoms_symb_and_num
-        coords = list(np.array(coordinates) + [0, -0.2, 0.5])
+        coords = coordinates + [0, -0.2, 0.5]
         self.structure_plot_widget.symb_actor = self.structure_plot_widget.plotter.add_point_labels(coords, symb_num,
                                     font_size=30, show_points=False, always_visible=False, shape=None)
         self.structure_plot_widget.symb_actor.SetVisibility(False)
@@ -1006,9 +1062,8 @@ class StructureControlsWidget(QWidget):
         const = self.structure_plot_widget.data.all_constrains
         magmoms = self.structure_plot_widget.data.magmoms
         suffixes = self.structure_plot_widget.data.suffixes
-        try:
-            mags = self.structure_plot_widget.data.outcar_data.magnetizations[self.geometry_slider.value()]
-        except:
+        mags = self.structure_plot_widget.data.trajectory.step_magnetizations(self.geometry_slider.value())
+        if mags is None:
             mags = ["N/A" for i in range(len(magmoms))]
         nums = self.structure_plot_widget.data.nums
         return symb, coord, const, magmoms, suffixes, mags, nums
@@ -1030,13 +1085,8 @@ class StructureControlsWidget(QWidget):
             value.pop(row)
             setattr(data, property, value)
         self.structure_plot_widget.atom_colors.pop(row)
-        if hasattr(self.structure_plot_widget.data, 'outcar_data'):
-            outcar_data = self.structure_plot_widget.data.outcar_data
-            for mag in outcar_data.magnetizations:
-                mag.pop(row)
-
-        for geo in self.structure_plot_widget.data.outcar_coordinates:
-            geo.pop(row) # delete atom from all geometries
+        # delete atom from all geometries
+        data.trajectory.delete_atom(row)
 
 
         for actor in self.structure_plot_widget.sphere_actors:
@@ -1093,9 +1143,10 @@ class StructureControlsWidget(QWidget):
             for actor in self.forces_actors:
                 self.plotter.renderer.RemoveActor(actor)
         current_iter = self.geometry_slider.value()
-        if hasattr(self.structure_plot_widget.data, "outcar_data"):
-            forces = self.structure_plot_widget.data.outcar_data.forces[current_iter]
-            coordinates = self.structure_plot_widget.data.outcar_data.find_coordinates()[current_iter]
+        trajectory = self.structure_plot_widget.data.trajectory
+        forces = trajectory.step_forces(current_iter)
+        if forces is not None:
+            coordinates = trajectory.frame(current_iter)
             self.forces_actors = []
             if self.forces_cb.isChecked():
                 for i, (center, force) in enumerate(zip(coordinates, forces)):
@@ -1111,22 +1162,18 @@ class StructureControlsWidget(QWidget):
                 actor.SetVisibility(flag)
 
     def max_force(self):
-        val = self.geometry_slider.value()
-        outcar_data = getattr(self.structure_plot_widget.data, "outcar_data", None)
-        if outcar_data is None or val >= len(outcar_data.forces):
+        f = self.structure_plot_widget.data.trajectory.step_forces(self.geometry_slider.value())
+        if f is None:
             print("No OUTCAR force data available.")
             return
-        f = np.array(outcar_data.forces[val])
         max = np.max(f)
         print(f"max force: {max}")
 
     def rmse_forces(self):
-        val = self.geometry_slider.value()
-        outcar_data = getattr(self.structure_plot_widget.data, "outcar_data", None)
-        if outcar_data is None or val >= len(outcar_data.forces):
+        f = self.structure_plot_widget.data.trajectory.step_forces(self.geometry_slider.value())
+        if f is None:
             print("No OUTCAR force data available.")
             return
-        f = np.array(outcar_data.forces[val])
         rmse = np.sqrt(np.mean(f**2))
         print(f"rmse forces: {rmse}")
 
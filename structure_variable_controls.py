@@ -117,9 +117,15 @@ class TableWidgetDragRows(QTableWidget):
         self.structure_control_widget.change_table_when_atom_added()
 
     def update_all_data(self, mapping=None, sort=False):
-
+        trajectory = self.plot.data.trajectory
+        step = self.control.geometry_slider.value()
         for column in range(self.columnCount()):
             text = self.horizontalHeaderItem(column).text()
+            if text in ['X', 'Y', 'Z']:
+                # lazily read steps are decoded first, so the edit is kept
+                trajectory.set_positions(step, [float(self.item(row, column).text()) for row in range(self.rowCount())],
+                                         (slice(self.rowCount()), column - 3))
+                continue
             for row in range(self.rowCount()):
                 if text == "MagMom":
                     self.plot.data.magmoms[row] = self.item(row, column).text()
@@ -127,15 +133,11 @@ class TableWidgetDragRows(QTableWidget):
                     self.plot.data.suffixes[row] = self.item(row, column).text()
                 if text == 'Atom':
                     self.plot.data.symbols[row] = self.item(row, column).text()
-                if text in ['X', 'Y', 'Z']:
-                    new_value = float(self.item(row, column).text())
-                    self.plot.data.outcar_coordinates[self.control.geometry_slider.value()][row][column - 3] = new_value
                 if text == "Number":
                     self.plot.data.nums[row] = self.item(row, column).text()
                 if text in ["Move X", "Move Y", "Move Z"]: # Move X, Move Y, Move Z columns (T or F)
                     new_value = self.item(row, column).text()
-                    self.plot.data.all_constrains[row][
-                            column - 6] = new_value.upper()
+                    trajectory.set_constrain(row, column - 6, new_value)
                 if text == "mags":
                     try:
                         self.plot.data.mags[self.control.geometry_slider.value()][row] = self.item(row, column).text()
@@ -146,20 +148,14 @@ class TableWidgetDragRows(QTableWidget):
                 keys = values = range(1, len(self.plot.data.nums) + 1)
                 mapping = dict(zip(keys, values))
 
-            simple = ['magmoms', 'suffixes', 'symbols', 'nums', 'all_constrains']
-            complex = ['outcar_coordinates']
+            simple = ['magmoms', 'suffixes', 'symbols', 'nums']
 
             for attr in simple:
                 lst = getattr(self.plot.data, attr)
                 new_list = self.sort_by_mapping(lst, mapping)
                 setattr(self.plot.data, attr, new_list)
-            for attr in complex:
-                all_lists = getattr(self.plot.data, attr)
-                new_all_lists = []
-                for list in all_lists:
-                    new_list = self.sort_by_mapping(list, mapping)
-                    new_all_lists.append(new_list)
-                setattr(self.plot.data, attr, new_all_lists)
+            # positions, forces, magnetizations and selective dynamics masks of all steps at once
+            trajectory.reorder(self.sort_by_mapping(range(len(mapping)), mapping))
         self.control.update_geometry_status()
 
     def sort_by_mapping(self, list, mapping):
@@ -452,16 +448,14 @@ class StructureVariableControls(QWidget):
             # number of column which were updated
             if header in ["X", "Y", "Z"]:
                 new_value = self.tableWidget.item(row, column).text()
-                self.structure_control_widget.structure_plot_widget.data.outcar_coordinates[self.structure_control_widget.geometry_slider.value()][row][column - 3] = float(new_value)
+                self.structure_control_widget.structure_plot_widget.data.trajectory.set_positions(
+                    self.structure_control_widget.geometry_slider.value(), float(new_value), (row, column - 3))
             if header in ["Move X", "Move Y", "Move Z"]:
                 new_value = self.tableWidget.item(row, column).text()
-                if new_value.upper() in ['T', 'F', 'N/A']:
-                    self.structure_control_widget.structure_plot_widget.data.all_constrains[row][
-                        column - 6] = new_value.upper()
-                else:
+                if new_value.upper() not in ['T', 'F', 'N/A']:
                     print("Movement constraint must be 'T' , 'F' or 'N/A'. Resetting to latter")
-                    self.structure_control_widget.structure_plot_widget.data.all_constrains[row][
-                        column - 6] = 'N/A'
+                    new_value = 'N/A'
+                self.structure_control_widget.structure_plot_widget.data.trajectory.set_constrain(row, column - 6, new_value)
             if header in ["MagMom"]:
                 pass
             if header in ["Atom"]:
@@ -656,16 +650,11 @@ class StructureVariableControls(QWidget):
             self.structure_control_widget.structure_plot_widget.data.atoms_symb_and_num.insert(pos + 1,
                                                                                                "".join([ name,
                                                                                                        str(pos+1)]))
-        for interation in self.structure_control_widget.structure_plot_widget.data.outcar_coordinates:
-            interation.insert(pos + 1, [float( x), float( y), float( z)])
-        self.structure_control_widget.structure_plot_widget.data.all_constrains.insert(pos + 1, [ x_constr,  y_constr,  z_constr])
+        data = self.structure_control_widget.structure_plot_widget.data
+        data.trajectory.insert_atom(pos + 1, [float( x), float( y), float( z)], [ x_constr,  y_constr,  z_constr], float(mag))
         self.structure_control_widget.structure_plot_widget.data.constrains.insert(pos + 1,  x_constr)
         self.structure_control_widget.structure_plot_widget.data.magmoms.insert(pos + 1, magmom)
         self.structure_control_widget.structure_plot_widget.data.suffixes.insert(pos + 1, suffix)
-        outcar_data = getattr(self.structure_control_widget.structure_plot_widget.data, "outcar_data", None)
-        if outcar_data is not None:
-            for magnetizations in outcar_data.magnetizations:
-                magnetizations.insert(pos+1, mag)
         self.structure_control_widget.structure_plot_widget.data.nums.insert(pos+1, len(self.structure_control_widget.structure_plot_widget.data.symbols)+1)
 
         self.change_table_when_atom_added()
@@ -733,8 +722,8 @@ class StructureVariableControls(QWidget):
         elif direction == 'out':
             translation_vector = move_distance * view_direction
 
-        coordinates = self.structure_control_widget.structure_plot_widget.data.outcar_coordinates[
-                self.structure_control_widget.geometry_slider.value()]
+        trajectory = self.structure_control_widget.structure_plot_widget.data.trajectory
+        step = self.structure_control_widget.geometry_slider.value()
 
         selected_rows = self.get_selected_rows()
 
@@ -747,9 +736,7 @@ class StructureVariableControls(QWidget):
                 points.SetPoint(i, new_points)
             points.Modified()
 
-            coordinates[row][0] = actor.GetCenter()[0]
-            coordinates[row][1] = actor.GetCenter()[1]
-            coordinates[row][2] = actor.GetCenter()[2]
+            trajectory.set_positions(step, actor.GetCenter()[:3], row)
 
         self.block_and_update_table()
         self.structure_control_widget.add_bonds()
@@ -819,13 +806,8 @@ class StructureVariableControls(QWidget):
                                        center=center)
 
                 rot_positions = rot_atoms.positions
-                coordinates = self.structure_control_widget.structure_plot_widget.data.outcar_coordinates[
-                    self.structure_control_widget.geometry_slider.value()]
-
-                for pos, row in zip(rot_positions, selected_rows):
-                    coordinates[row][0] = pos[0]
-                    coordinates[row][1] = pos[1]
-                    coordinates[row][2] = pos[2]
+                self.structure_control_widget.structure_plot_widget.data.trajectory.set_positions(
+                    self.structure_control_widget.geometry_slider.value(), rot_positions, selected_rows)
 
                 self.block_and_update_table()
                 self.structure_control_widget.add_sphere(initialize=False)
@@ -948,7 +930,8 @@ class StructureVariableControls(QWidget):
         for column in range(3,6):
             for row in range(self.tableWidget.rowCount()):
                 self.tableWidget.setItem(row, column, QTableWidgetItem(str(f"{new_coords[row][column-3]:.2f}")))
-        self.structure_control_widget.structure_plot_widget.data.outcar_coordinates[self.structure_control_widget.geometry_slider.value()] = new_coords
+        self.structure_control_widget.structure_plot_widget.data.trajectory.set_positions(
+            self.structure_control_widget.geometry_slider.value(), new_coords)
         mapping = self.sort_mapping()
         self.tableWidget.update_all_data(mapping=mapping, sort=True)
         self.tableWidget.blockSignals(False)
@@ -0,0 +1,105 @@
+"""Small synthetic VASP files for the tests."""
+import os
+
+import numpy as np
+
+
+def poscar_text(atoms=4):
+    lines = ["test", "1.0", "10 0 0", "0 10 0", "0 0 10", "Co O", f"{atoms // 2} {atoms - atoms // 2}",
+             "Selective dynamics", "Cartesian"]
+    rng = np.random.RandomState(0)
+    for position in rng.rand(atoms, 3) * 10:
+        lines.append("%12.6f %12.6f %12.6f T T F" % tuple(position))
+    return "\n".join(lines) + "\n"
+
+
+def outcar_text(atoms=4, steps=20, scf=3, ml=False, tail=True):
+    """OUTCAR of a relaxation with ``steps`` ionic steps; ``ml`` writes machine learned steps"""
+    rng = np.random.RandomState(1)
+    out = [" vasp.6.3.0 header\n", "   MAGMOM = %d*1.0 %d*0.5\n" % (atoms // 2, atoms - atoms // 2),
+           " position of ions in cartesian coordinates  (Angst):\n"]
+    out += ["   %10.5f %10.5f %10.5f\n" % tuple(p) for p in rng.rand(atoms, 3) * 10]
+    for step in range(1, steps + 1):
+        for iteration in range(1, scf + 1):
+            out.append("----------------------------------------- Iteration %6d(%4d)  "
+                       "---------------------------------------\n" % (step, iteration))
+            out.append("  free energy    TOTEN  =      %.8f eV\n" % (-100 - step - iteration * 0.01))
+        out.append(" number of electron     123.0000000 magnetization       %.7f\n" % (2.0 + step * 0.001))
+        out.append(" magnetization (x)\n\n # of ion       s       p       d       tot\n"
+                   "--------------------------------------\n")
+        out += ["    %d        0.001   0.002   0.300   %.3f\n" % (atom + 1, 0.3 + 0.001 * step + 0.01 * atom)
+                for atom in range(atoms)]
+        out.append("--------------------------------------\ntot          0.1   0.2   0.3   1.0\n\n")
+        out.append(" POSITION                                       TOTAL-FORCE (eV/Angst)%s\n" % (" (ML)" if ml else ""))
+        out.append(" " + "-" * 83 + "\n")
+        for position, force in zip(rng.rand(atoms, 3) * 10, rng.randn(atoms, 3)):
+            out.append("     %10.5f %10.5f %10.5f      %12.6f %12.6f %12.6f\n" % (tuple(position) + tuple(force)))
+        out.append(" " + "-" * 83 + "\n")
+        if ml:
+            out.append("  ML FREE ENERGIE OF THE ION-ELECTRON SYSTEM (eV)\n  " + "-" * 51 + "\n")
+            out.append("  free  energy ML TOTEN  =      %.8f eV\n\n" % (-100.0 - step))
+        else:
+            out.append("  FREE ENERGIE OF THE ION-ELECTRON SYSTEM (eV)\n  " + "-" * 51 + "\n")
+            out.append("  free  energy   TOTEN  =      %.8f eV\n\n" % (-100.0 - step))
+    if tail:
+        out.append(" magnetization (x)\n\n # of ion       s       p       d       tot\n"
+                   "--------------------------------------\n")
+        out += ["    %d        0.001   0.002   0.300   %.3f\n" % (atom + 1, 0.3) for atom in range(atoms)]
+        out.append("\n General timing and accounting informations for this job:\n"
+                   " Voluntary context switches:   100\n")
+    return "".join(out)
+
+
+def write_run(directory, atoms=4, steps=20, **kwargs):
+    """POSCAR and OUTCAR in ``directory``; returns the OUTCAR text"""
+    text = outcar_text(atoms, steps, **kwargs)
+    with open(os.path.join(directory, "POSCAR"), "w") as file:
+        file.write(poscar_text(atoms))
+    with open(os.path.join(directory, "OUTCAR"), "w", newline="") as file:
+        file.write(text)
+    return text
+
+
+def doscar_values(atoms=3, nedos=40, orbitals=9, spin=True):
+    """energies, total DOS columns and (atoms, NEDOS, columns) projections of a synthetic DOSCAR"""
+    rng = np.random.RandomState(2)
+    energies = np.linspace(-10, 5, nedos)
+    total = rng.rand(nedos, 4 if spin else 2).round(4)
+    projections = rng.rand(atoms, nedos, orbitals * (2 if spin else 1)).round(4)
+    return energies, total, projections
+
+
+def write_doscar(path, atoms=3, nedos=40, orbitals=9, spin=True):
+    """DOSCAR with the values of doscar_values; returns them"""
+    energies, total, projections = doscar_values(atoms, nedos, orbitals, spin)
+    info = "%12.8f %12.8f %d %12.8f 1.0\n" % (energies[-1], energies[0], nedos, 0.5)
+    out = ["%4d %4d 1 0\n" % (atoms, atoms), "  0.1 0.1 0.1 0.1 0.5e-15\n", "  1.0E-004\n", "  CAR\n", " test\n",
+           info]
+    out += [" %.3f" % energy + "".join(" %.4E" % value for value in row) + "\n" for energy, row in zip(energies, total)]
+    for atom in range(atoms):
+        out.append(info)
+        out += [" %.3f" % energy + "".join(" %.4E" % value for value in row) + "\n"
+                for energy, row in zip(energies, projections[atom])]
+    with open(path, "w") as file:
+        file.write("".join(out))
+    return energies, total, projections
+
+
+def chgcar_text(grid=(6, 5, 7), spin=True, seed=3):
+    """CHGCAR of a Co-O cell with augmentation occupancies; returns the text and the raw (total, diff) grids"""
+    rng = np.random.RandomState(seed)
+    header = ("Co O\n   1.00000000000000\n     4.000000    0.000000    0.000000\n"
+              "     0.000000    5.000000    0.000000\n     0.500000    0.000000    6.000000\n"
+              "   Co   O\n     1     1\nDirect\n  0.000000  0.000000  0.000000\n  0.500000  0.500000  0.500000\n")
+    grids = [rng.randn(*grid) * 10.0 ** rng.randint(-3, 4, size=grid) for _ in range(2 if spin else 1)]
+    out = [header, "\n"]
+    for index, values in enumerate(grids):
+        out.append("   %d   %d   %d\n" % grid)
+        flat = values.reshape(-1, order="F")
+        for start in range(0, len(flat), 5):
+            out.append("".join(" %17.11E" % value for value in flat[start:start + 5]) + "\n")
+        for atom in (1, 2):
+            out.append("augmentation occupancies   %d   7\n" % atom)
+            out.append("".join("  %.7E" % value for value in rng.randn(5)) + "\n")
+            out.append("  %.7E  %.7E\n" % tuple(rng.randn(2) * (index + 1)))
+    return "".join(out), grids
@@ -0,0 +1,78 @@
+import csv
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import band_moments
+from fixtures import poscar_text, write_doscar
+
+
+def integral(values, energies):
+    return np.sum(np.diff(energies) * (values[1:] + values[:-1]) / 2)
+
+
+def moments_by_hand(curve, energies, window):
+    inside = (energies >= window[0]) & (energies <= window[1])
+    curve, energies = curve[inside], energies[inside]
+    states = integral(curve, energies)
+    center = integral(energies * curve, energies) / states
+    variance = integral((energies - center) ** 2 * curve, energies) / states
+    skewness = integral((energies - center) ** 3 * curve, energies) / states / variance ** 1.5
+    kurtosis = integral((energies - center) ** 4 * curve, energies) / states / variance ** 2
+    filling = integral(curve * (energies <= 0), energies) / states
+    return states, center, np.sqrt(variance), skewness, kurtosis, filling
+
+
+def write_calculation(directory, spin=True):
+    os.makedirs(directory)
+    with open(os.path.join(directory, "POSCAR"), "w") as file:
+        file.write(poscar_text(4))
+    return write_doscar(os.path.join(directory, "DOSCAR"), atoms=4, orbitals=9, spin=spin)
+
+
+def test_moments_of_every_atom_channel_and_spin(tmp_path):
+    energies, total, projections = write_calculation(str(tmp_path / "run"))
+    rows = band_moments.run_moments(str(tmp_path / "run"), window=(-6, 3))
+    # 4 atoms, s/p/d, up/down/total
+    assert len(rows) == 4 * 3 * 3
+    assert [row[2] for row in rows[::9]] == ["Co", "Co", "O", "O"]
+    assert [row[3:5] for row in rows[:4]] == [("s", "up"), ("s", "down"), ("s", "total"), ("p", "up")]
+
+    # the DOSCAR energies are written with three decimals, the Fermi energy is 0.5
+    relative = np.round(energies, 3) - 0.5
+    channels = {"s": [0], "p": [1, 2, 3], "d": [4, 5, 6, 7, 8]}
+    for row in rows:
+        atom, channel, spin = row[1] - 1, row[3], row[4]
+        columns = projections[atom].reshape(len(energies), 9, 2)[:, channels[channel]].sum(axis=1)
+        curve = {"up": columns[:, 0], "down": columns[:, 1], "total": columns.sum(axis=1)}[spin]
+        np.testing.assert_allclose(row[5:], moments_by_hand(curve, relative, (-6, 3)), rtol=1e-9, err_msg=str(row[:5]))
+
+
+def test_main_writes_one_table_for_all_doscars(tmp_path):
+    write_calculation(str(tmp_path / "calculations" / "a"))
+    write_calculation(str(tmp_path / "calculations" / "b" / "c"), spin=False)
+    # sidecars of the cache directory are not calculations
+    os.makedirs(tmp_path / "calculations" / "a" / ".vaspui_cache")
+    with open(tmp_path / "calculations" / "a" / ".vaspui_cache" / "DOSCAR", "w") as file:
+        file.write("not a DOSCAR\n")
+    output = str(tmp_path / "moments.csv")
+    band_moments.main([str(tmp_path / "calculations"), "-o", output, "--window", "-6", "3", "--workers", "2"])
+
+    with open(output, newline="") as file:
+        table = list(csv.reader(file))
+    assert tuple(table[0]) == band_moments.HEADER
+    assert len(table) == 1 + 2 * 36
+    assert {row[0] for row in table[1:]} == {str(tmp_path / "calculations" / "a"),
+                                            str(tmp_path / "calculations" / "b" / "c")}
+    expected = band_moments.run_moments(str(tmp_path / "calculations" / "a"), window=(-6, 3))
+    written = [row for row in table[1:] if row[0] == str(tmp_path / "calculations" / "a")]
+    for row, expected_row in zip(written, expected):
+        assert row[:5] == [str(value) for value in expected_row[:5]]
+        np.testing.assert_allclose([float(value) for value in row[5:]], expected_row[5:])
+    # without spin polarization the spin-down curves are empty
+    down = [row for row in table[1:] if row[0].endswith("c") and row[4] == "down"]
+    assert len(down) == 12
+    assert all(row[5] == "0.0" and row[6] == "nan" for row in down)
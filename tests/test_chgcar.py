@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "third_party"))
+
+pytest.importorskip("PyQt5")
+
+from ase.calculators.vasp import VaspChargeDensity as AseChargeDensity
+from fixtures import chgcar_text
+from parser_cache import cache_path
+from process_CHGCAR import VaspChargeDensity
+
+
+def write_chgcar(directory, spin):
+    text, grids = chgcar_text(spin=spin)
+    path = str(directory / "CHGCAR")
+    with open(path, "w") as file:
+        file.write(text)
+    return path
+
+
+@pytest.mark.parametrize("spin", [True, False])
+@pytest.mark.parametrize("chunk", [None, 97])
+def test_read_matches_ase(tmp_path, monkeypatch, spin, chunk):
+    if chunk is not None:
+        # blocks read in many chunks, cut in the middle of lines
+        monkeypatch.setattr(VaspChargeDensity, "READ_CHUNK", chunk)
+    path = write_chgcar(tmp_path, spin)
+    reference = AseChargeDensity(path)
+    for _ in range(2):
+        # the second object is mapped from the cache
+        density = VaspChargeDensity(path)
+        assert len(density.chg) == 1
+        assert density.is_spin_polarized() == spin
+        np.testing.assert_array_equal(density.chg[0], reference.chg[0])
+        if spin:
+            np.testing.assert_array_equal(density.chgdiff[0], reference.chgdiff[0])
+        assert density.aug == reference.aug
+        assert density.augdiff == reference.augdiff
+        np.testing.assert_array_equal(density.atoms[0].get_positions(), reference.atoms[0].get_positions())
+        np.testing.assert_array_equal(density.atoms[0].cell, reference.atoms[0].cell)
+
+
+def test_float32_and_float64_caches_are_kept_apart(tmp_path):
+    path = write_chgcar(tmp_path, spin=True)
+    reference = AseChargeDensity(path)
+    for _ in range(2):
+        for dtype in (np.float32, np.float64):
+            density = VaspChargeDensity(path, dtype=dtype)
+            for grid, expected in ((density.chg[0], reference.chg[0]), (density.chgdiff[0], reference.chgdiff[0])):
+                assert grid.dtype == dtype
+                np.testing.assert_allclose(grid, expected.astype(dtype), rtol=0)
+    assert os.path.exists(cache_path(path, ".chg0.npy"))
+    assert os.path.exists(cache_path(path, ".float32.chg0.npy"))
+    assert os.path.exists(cache_path(path, ".chgcar.npz"))
+    assert os.path.exists(cache_path(path, ".float32.chgcar.npz"))
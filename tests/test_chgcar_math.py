@@ -0,0 +1,83 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "third_party"))
+
+import chgcar_math
+from chgcar_math import DensityStream, compile_expression, stream_math
+from fixtures import chgcar_text
+from grid_writer import write_grid
+
+
+@pytest.mark.parametrize("expression", [
+    "a.__class__",  # attribute access
+    "abs(a)",  # calls
+    "__import__('os').system('true')",
+    "x + a",  # names which are not operands
+    "__builtins__",
+    "a['b']",  # subscripts
+    "'a' * 2",  # strings
+    "(lambda: a)()",
+    "a if b else c",
+    "a < b",
+    "[a, b]",
+])
+def test_expressions_other_than_arithmetic_are_rejected(expression):
+    with pytest.raises((ValueError, SyntaxError)):
+        compile_expression(expression, ["a", "b", "c"])
+
+
+def test_arithmetic_expressions_are_compiled():
+    code = compile_expression("0.5 * (a + b) ** 2 - -c / 4", ["a", "b", "c"])
+    assert eval(code, {"__builtins__": {}}, {"a": 1.0, "b": 3.0, "c": 8.0}) == 10.0
+
+
+def write_chgcars(directory, spins):
+    paths = []
+    for seed, spin in enumerate(spins):
+        path = str(directory / f"CHGCAR{seed}")
+        with open(path, "w") as file:
+            file.write(chgcar_text(spin=spin, seed=seed)[0])
+        paths.append(path)
+    return paths
+
+
+def in_memory(expression, paths, names=("a", "b", "c")):
+    """``expression`` of the whole grids read by ASE, as the text stream_math writes"""
+    ase_auxiliary = pytest.importorskip("ase.calculators.vasp.vasp_auxiliary")
+    densities = [ase_auxiliary.VaspChargeDensity(path) for path in paths]
+    blocks = [density.chg + density.chgdiff for density in densities]
+    volume = densities[0].atoms[0].get_volume()
+    with open(paths[0]) as file:
+        lines = file.readlines()
+    grid_line = lines[11]
+    text = io.StringIO()
+    text.write("".join(lines[:12]))
+    for index in range(min(len(block) for block in blocks)):
+        if index:
+            text.write(grid_line)
+        result = eval(expression, {}, {name: block[index] for name, block in zip(names, blocks)}) * volume
+        write_grid(text, result, 1.0)
+    return text.getvalue()
+
+
+@pytest.mark.parametrize("spins", [(True, True, True), (False, False, False), (True, False, True)])
+def test_streamed_result_matches_in_memory_evaluation(tmp_path, monkeypatch, spins):
+    paths = write_chgcars(tmp_path, spins)
+    expression = "0.5 * (a - b) * c + a ** 2 / 3"
+    expected = in_memory(expression, paths)
+    # the magnetization density only if every file has one
+    assert expected.count("   6   5   7\n") == (2 if all(spins) else 1)
+
+    # blocks of whole lines which do not divide the grid, read in small chunks
+    monkeypatch.setattr(chgcar_math, "BLOCK_VALUES", 35)
+    monkeypatch.setattr(DensityStream, "READ_CHUNK", 101)
+    output = str(tmp_path / "CHGCAR_math")
+    stream_math(expression, paths, output)
+    with open(output) as file:
+        assert file.read() == expected
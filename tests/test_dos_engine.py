@@ -0,0 +1,93 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dos_engine import DosAggregator, DosBroadening
+from fixtures import write_doscar
+from VASPparser import DOSCARparser
+
+ELEMENTS = ["Co", "Co", "Co", "O", "O", "O", "O"]
+
+
+def test_smeared_curves_are_cached_per_width_and_grid():
+    broadening = DosBroadening(np.linspace(-10, 5, 301))
+    curves = np.random.RandomState(0).rand(2, 301)
+    calls = []
+
+    def read():
+        calls.append(1)
+        return curves
+
+    energies, smeared = broadening.smooth_cached("total", read, 0.2)
+    assert broadening.smooth_cached("total", read, 0.2)[1] is smeared
+    assert len(calls) == 1
+    np.testing.assert_allclose(smeared, broadening.smooth(curves, 0.2)[1])
+
+    grid_energies, on_grid = broadening.smooth_cached("total", read, 0.2, (-5, 0, 51))
+    assert len(calls) == 2
+    np.testing.assert_allclose(grid_energies, np.linspace(-5, 0, 51))
+    assert on_grid.shape == (2, 51)
+    broadening.smooth_cached("total", read, 0.3)
+    assert len(calls) == 3
+
+
+def test_result_cache_is_bounded():
+    broadening = DosBroadening(np.linspace(-10, 5, 301))
+    broadening.RESULT_BYTES = 3 * 2 * 301 * 8
+    curves = np.ones((2, 301))
+    for width in [0.1, 0.2, 0.3, 0.4, 0.5]:
+        broadening.smooth_cached("total", curves, width)
+    assert len(broadening.results) == 3
+    assert broadening.result_bytes == 3 * curves.nbytes
+    assert ("total", 0.1, None, "gaussian") not in broadening.results
+
+
+@pytest.mark.parametrize("spin", [True, False])
+def test_selection_sums_match_summing_per_atom_curves(tmp_path, spin):
+    write_doscar(tmp_path / "DOSCAR", atoms=len(ELEMENTS), orbitals=9, spin=spin)
+    doscar = DOSCARparser(str(tmp_path / "DOSCAR"), use_cache=False)
+    aggregator = DosAggregator(doscar.dos, ELEMENTS, doscar.orbital_types, doscar.orbitals)
+    curves = {atom: {orbital: (np.array(doscar.dataset_up[atom][index]), np.array(doscar.dataset_down[atom][index]))
+                     for index, orbital in enumerate(doscar.orbitals)} for atom in range(len(ELEMENTS))}
+
+    def by_hand(atoms, orbitals):
+        up, down = np.zeros(doscar.nedos), np.zeros(doscar.nedos)
+        for atom in atoms:
+            for orbital in orbitals:
+                up += curves[atom][doscar.orbitals[orbital]][0]
+                down += curves[atom][doscar.orbitals[orbital]][1]
+        return up, down
+
+    rng = np.random.RandomState(3)
+    selections = [
+        (range(7), range(9)),  # everything
+        ([0, 1, 2], [1, 2, 3]),  # one element, one channel
+        ([0, 1, 3, 4, 5], [0, 4, 5, 6, 7]),  # most of each element and of the d channel
+        ([6], [8]),
+        ([], [0]),
+    ]
+    selections += [(sorted(rng.choice(7, rng.randint(1, 8), replace=False)),
+                    sorted(rng.choice(9, rng.randint(1, 10), replace=False))) for _ in range(20)]
+    for atoms, orbitals in selections:
+        up, down = aggregator.sum(list(atoms), list(orbitals))
+        expected_up, expected_down = by_hand(atoms, orbitals)
+        np.testing.assert_allclose(up, expected_up, atol=1e-12)
+        np.testing.assert_allclose(down, expected_down, atol=1e-12)
+        if not spin:
+            assert not down.any()
+
+    channels = aggregator.channel_curves()
+    for atom in range(len(ELEMENTS)):
+        for channel, group in enumerate(doscar.orbital_types):
+            expected = by_hand([atom], [doscar.orbitals.index(orbital) for orbital in group])
+            np.testing.assert_allclose(channels[atom, channel], expected, atol=1e-12)
+    element_channel = aggregator.tables[("element", "channel")].reshape(2, 3, 2, doscar.nedos)
+    for element, name in enumerate(aggregator.element_names):
+        atoms = [atom for atom, symbol in enumerate(ELEMENTS) if symbol == name]
+        for channel, group in enumerate(doscar.orbital_types):
+            expected = by_hand(atoms, [doscar.orbitals.index(orbital) for orbital in group])
+            np.testing.assert_allclose(element_channel[element, channel], expected, atol=1e-12)
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import write_doscar
+from VASPparser import DOSCARparser
+
+
+def per_atom_curves(projections, orbitals, spin):
+    """{atom: {orbital: (up, down)}} read column by column as the list-based parser did"""
+    curves = {}
+    for atom, block in enumerate(projections):
+        curves[atom] = {}
+        for orbital_index, orbital in enumerate(orbitals):
+            if spin:
+                up, down = block[:, 2 * orbital_index], block[:, 2 * orbital_index + 1]
+            else:
+                up, down = block[:, orbital_index], np.zeros(len(block))
+            curves[atom][orbital] = (list(up), list(down))
+    return curves
+
+
+@pytest.mark.parametrize("spin", [True, False])
+@pytest.mark.parametrize("orbitals, block", [(1, "s"), (4, "p"), (9, "d"), (16, "f")])
+def test_dense_array_matches_the_columns_of_the_doscar(tmp_path, spin, orbitals, block):
+    energies, total, projections = write_doscar(tmp_path / "DOSCAR", atoms=3, orbitals=orbitals, spin=spin)
+    doscar = DOSCARparser(str(tmp_path / "DOSCAR"), use_cache=False)
+    assert doscar.element_block == block
+    assert doscar.dos.shape == (3, orbitals, 2, 40)
+    assert doscar.nedos == 40
+    np.testing.assert_allclose(doscar.total_dos_energy, energies, atol=1e-3)
+    np.testing.assert_allclose(doscar.total_dos_alfa, total[:, 0])
+    np.testing.assert_allclose(doscar.total_dos_beta, total[:, 1] if spin else np.zeros(40))
+
+    curves = per_atom_curves(projections, doscar.orbitals, spin)
+    for atom in range(3):
+        for orbital_index, orbital in enumerate(doscar.orbitals):
+            up, down = curves[atom][orbital]
+            np.testing.assert_allclose(doscar.dataset_up[atom][orbital_index], up)
+            np.testing.assert_allclose(doscar.dataset_down[atom][orbital_index], down)
+            assert doscar.dataset_up[atom][orbital_index].base is not None
+
+
+def test_cached_doscar_is_mapped_back_unchanged(tmp_path, capsys):
+    write_doscar(tmp_path / "DOSCAR", spin=False)
+    parsed = DOSCARparser(str(tmp_path / "DOSCAR"))
+    capsys.readouterr()
+    cached = DOSCARparser(str(tmp_path / "DOSCAR"))
+    assert "Reading DOSCAR from cache" in capsys.readouterr().out
+    np.testing.assert_array_equal(cached.dos, parsed.dos)
+    np.testing.assert_array_equal(cached.total_dos_beta, parsed.total_dos_beta)
+    assert cached.orbital_types == parsed.orbital_types
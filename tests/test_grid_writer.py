@@ -0,0 +1,74 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "third_party"))
+
+import grid_writer
+import volumetric_slabs
+from grid_writer import format_fields, vasp_field, write_grid
+
+# rounding ties and carries, signed zeros, the largest and smallest two digit
+# exponents and values which need three digits
+EDGE_VALUES = [0.0, -0.0, 1.0, -1.0, 0.5, 9.99999999995, 9.999999999949999, -9.99999999995, 1.00000000005,
+               1.00000000015, 2.5e-5, 123456789012.5, 1e-99, 9.9999999999e98, 9.99999999995e98, 1e99, -1e-100,
+               1e120, -3.4e-150, 5e-324, 1e300]
+
+
+def random_values(count, seed=0):
+    rng = np.random.RandomState(seed)
+    return rng.randn(count) * 10.0 ** rng.randint(-30, 30, size=count)
+
+
+@pytest.mark.parametrize("values", [EDGE_VALUES[:13], random_values(1000)])
+def test_fields_are_printf_fields(values):
+    fields = format_fields(values, 'chgcar')
+    assert fields.tobytes() == b"".join(b" %17.10E" % value for value in values)
+    fields = format_fields(values, 'vasp')
+    assert fields.tobytes().decode() == "".join(" " + vasp_field(value) for value in values)
+
+
+def test_fields_with_three_digit_exponents_are_left_to_printf():
+    assert format_fields(EDGE_VALUES, 'chgcar') is None
+    assert format_fields([1.0, np.nan], 'vasp') is None
+
+
+def test_vasp_fields():
+    assert vasp_field(1.0) == "0.10000000000E+01"
+    assert vasp_field(-0.000123456789012) == "-.12345678901E-03"
+    assert vasp_field(0.0) == "0.00000000000E+00"
+    assert vasp_field(9.9999999999e98) == "0.99999999999E+99"
+
+
+@pytest.mark.parametrize("format", ["chgcar", "chg"])
+@pytest.mark.parametrize("shape, special", [((7, 6, 9), False), ((5, 4, 3), True), ((10, 1, 1), False)])
+def test_write_grid_matches_ase(monkeypatch, format, shape, special):
+    ase_auxiliary = pytest.importorskip("ase.calculators.vasp.vasp_auxiliary")
+    # many slabs and blocks, cut in the middle of lines
+    monkeypatch.setattr(volumetric_slabs, "SLAB_BYTES", shape[0] * shape[1] * 8 * 2)
+    monkeypatch.setattr(grid_writer, "BLOCK_LINES", 3)
+    values = random_values(int(np.prod(shape)))
+    if special:
+        values[:len(EDGE_VALUES)] = EDGE_VALUES
+        values[-3:] = [np.inf, -np.inf, np.nan]
+    grid = np.asfortranarray(values.reshape(shape, order="F"))
+    volume = 123.456
+
+    expected = io.StringIO()
+    ase_auxiliary.VaspChargeDensity(None)._write_chg(expected, grid, volume, format)
+    written = io.StringIO()
+    write_grid(written, grid, volume, format)
+    assert written.getvalue() == expected.getvalue()
+
+    # float32 grids are scaled in double precision
+    with np.errstate(over="ignore"):
+        single = grid.astype(np.float32)
+    written = io.StringIO()
+    write_grid(written, single, volume, format)
+    expected = io.StringIO()
+    ase_auxiliary.VaspChargeDensity(None)._write_chg(expected, single.astype(float), volume, format)
+    assert written.getvalue() == expected.getvalue()
@@ -0,0 +1,197 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import write_run
+from parser_cache import file_signature, load_cache, save_cache
+from VASPparser import FinalStateOutcarParser, LazyOutcarParser, OutcarParser, ParallelOutcarParser
+
+ARRAYS = ["positions", "forces", "energies", "magnetizations", "total_magnetizations"]
+
+
+def reference_parse(text, atom_count):
+    """the line-based algorithm OutcarParser used before it was streamed"""
+    lines = text.splitlines(True)
+    result = {"positions": [], "forces": [], "energies": [], "magnetizations": [], "total_magnetizations": [],
+              "scf_energies": [], "magmoms": []}
+    geom_step, energies, total_mags, mlff = None, [], [], False
+    for i, raw in enumerate(lines):
+        line = raw.strip()
+        if line.startswith("POSITION") and (line.endswith("(ML)") or not mlff):
+            mlff = mlff or line.endswith("(ML)")
+            block = [[float(x) for x in row.split()] for row in lines[i + 2:i + 2 + atom_count]]
+            result["positions"].append([row[:3] for row in block])
+            result["forces"].append([row[3:] for row in block])
+        elif line.startswith("ML FREE ENERGIE"):
+            mlff = True
+            result["energies"].append(float(lines[i + 2].split()[5]))
+        elif line.startswith("FREE ENERGIE"):
+            if not mlff:
+                result["energies"].append(float(lines[i + 2].split()[4]))
+        elif line.startswith("magnetization (x)"):
+            result["magnetizations"].append([float(row.split()[-1]) for row in lines[i + 4:i + 4 + atom_count]])
+        elif line.startswith("number of electron  "):
+            total_mags.append(float(line.split()[-1]))
+        elif line.startswith("MAGMOM"):
+            for chunk in line.split("=")[1].split():
+                count, value = chunk.split("*") if "*" in chunk else (1, chunk)
+                result["magmoms"] += [float(value)] * int(count)
+        elif "Iteration" in line:
+            step = int(line.split()[2][:-1])
+            if geom_step is None:
+                geom_step = step
+            if step != geom_step:
+                result["scf_energies"].append(energies)
+                result["total_magnetizations"].append(total_mags[-1])
+                energies, total_mags, geom_step = [], [], step
+        elif "free energy    TOTEN" in line:
+            energies.append(float(line.split("=")[-1].split()[0]))
+        if line.startswith("Voluntary context switches:") and result["magnetizations"]:
+            result["magnetizations"].pop()
+    if energies:
+        result["scf_energies"].append(energies)
+    return result
+
+
+def write_truncated_run(directory, steps=8):
+    """a run whose last POSITION block is still being written"""
+    text = write_run(directory, steps=steps)
+    with open(os.path.join(directory, "OUTCAR"), "w", newline="") as file:
+        file.write(text[:text.rindex(" POSITION") + 300])
+
+
+def assert_same_arrays(outcar, reference, names=ARRAYS):
+    for name in names:
+        np.testing.assert_array_equal(np.asarray(list(getattr(outcar, name))),
+                                      np.asarray(list(getattr(reference, name))), err_msg=name)
+    assert outcar.scf_energies == reference.scf_energies
+
+
+def test_parallel_parser_matches_outcar_parser(tmp_path, monkeypatch):
+    write_run(tmp_path, atoms=6, steps=37)
+    # split the search and the decoding of this small file into chunks of the pool
+    monkeypatch.setattr(ParallelOutcarParser, "min_parallel_steps", 1)
+    monkeypatch.setattr(ParallelOutcarParser, "min_parallel_bytes", 0)
+    reference = OutcarParser(str(tmp_path), "OUTCAR", use_cache=False)
+    outcar = ParallelOutcarParser(str(tmp_path), "OUTCAR", use_cache=False, workers=3)
+    assert len(reference.positions) == 37
+    assert_same_arrays(outcar, reference)
+
+    window = ParallelOutcarParser(str(tmp_path), "OUTCAR", use_cache=False, workers=2, frames=slice(3, 30, 4))
+    np.testing.assert_array_equal(window.positions, reference.positions[3:30:4])
+    np.testing.assert_array_equal(window.forces, reference.forces[3:30:4])
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"ml": True}, {"tail": False}])
+def test_streaming_parser_matches_line_based_parser(tmp_path, kwargs):
+    text = write_run(tmp_path, atoms=5, steps=12, **kwargs)
+    reference = reference_parse(text, 5)
+    outcar = OutcarParser(str(tmp_path), "OUTCAR", use_cache=False)
+    for name in ARRAYS:
+        np.testing.assert_array_equal(np.asarray(getattr(outcar, name), dtype=float),
+                                      np.array(reference[name], dtype=float), err_msg=name)
+    assert outcar.scf_energies == reference["scf_energies"]
+    assert outcar.magmoms == reference["magmoms"]
+
+
+def test_cache_is_rejected_when_the_outcar_changes(tmp_path):
+    write_run(tmp_path, steps=6)
+    source = str(tmp_path / "OUTCAR")
+    save_cache(source, {"values": np.arange(3)})
+    assert load_cache(source)["values"].tolist() == [0, 1, 2]
+    stat = os.stat(source)
+
+    # same size and header, newer modification time
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_cache(source) is None
+
+    # same size and modification time, different header
+    save_cache(source, {"values": np.arange(3)})
+    signature = file_signature(source)
+    with open(source, "r+b") as file:
+        file.write(b"Y")
+    os.utime(source, ns=(stat.st_atime_ns, int(signature[2])))
+    assert file_signature(source)[1:3].tolist() == signature[1:3].tolist()
+    assert load_cache(source) is None
+
+    # appended data
+    save_cache(source, {"values": np.arange(3)})
+    with open(source, "a") as file:
+        file.write(" appended\n")
+    assert load_cache(source) is None
+
+
+def test_cached_outcar_is_read_back_unchanged(tmp_path, capsys):
+    write_run(tmp_path, steps=9)
+    parsed = OutcarParser(str(tmp_path), "OUTCAR")
+    capsys.readouterr()
+    cached = OutcarParser(str(tmp_path), "OUTCAR")
+    assert "Reading OUTCAR from cache" in capsys.readouterr().out
+    assert_same_arrays(cached, parsed)
+    assert cached.offset == parsed.offset == os.path.getsize(tmp_path / "OUTCAR")
+
+
+def test_update_reads_appended_steps_from_the_last_complete_block(tmp_path):
+    text = write_run(tmp_path, atoms=4, steps=10)
+    full = OutcarParser(str(tmp_path), "OUTCAR", use_cache=False)
+    # cut the file in the middle of a line of the 7th POSITION block
+    block = text.index(" POSITION", text.index(" POSITION") + 1)
+    for _ in range(5):
+        block = text.index(" POSITION", block + 1)
+    cut = text.index("\n", block + 200) - 10
+    with open(tmp_path / "OUTCAR", "w", newline="") as file:
+        file.write(text[:cut])
+
+    outcar = OutcarParser(str(tmp_path), "OUTCAR", use_cache=False)
+    assert len(outcar.positions) == 6
+    assert outcar.offset == block
+    with open(tmp_path / "OUTCAR", "a", newline="") as file:
+        file.write(text[cut:])
+    assert outcar.update() == 4
+    assert outcar.offset == len(text)
+    assert outcar.update() == 0
+    assert_same_arrays(outcar, full)
+
+
+@pytest.mark.parametrize("truncated", [False, True])
+def test_lazy_frames_match_the_full_parse(tmp_path, truncated):
+    if truncated:
+        write_truncated_run(tmp_path)
+    else:
+        write_run(tmp_path, steps=8)
+    full = OutcarParser(str(tmp_path), "OUTCAR", use_cache=False)
+    lazy = LazyOutcarParser(str(tmp_path), "OUTCAR", use_cache=False, frame_cache_size=2)
+    assert len(lazy.positions) == (7 if truncated else 8)
+    assert_same_arrays(lazy, full)
+    # random access, also to steps dropped from the frame cache
+    for step in [5, 0, len(full.positions) - 1, 2]:
+        np.testing.assert_array_equal(lazy.positions[step], full.positions[step])
+        np.testing.assert_array_equal(lazy.forces[step], full.forces[step])
+        np.testing.assert_array_equal(lazy.magnetizations[step], full.magnetizations[step])
+
+    window = LazyOutcarParser(str(tmp_path), "OUTCAR", use_cache=False, frames=slice(-4, None, 2))
+    np.testing.assert_array_equal(np.asarray(list(window.positions)), full.positions[-4::2])
+
+
+@pytest.mark.parametrize("truncated", [False, True])
+def test_final_state_matches_the_last_complete_step(tmp_path, truncated):
+    if truncated:
+        write_truncated_run(tmp_path)
+    else:
+        write_run(tmp_path, steps=8)
+    full = OutcarParser(str(tmp_path), "OUTCAR", use_cache=False)
+    final = FinalStateOutcarParser(str(tmp_path), "OUTCAR")
+    step = len(full.positions) - 1
+    np.testing.assert_array_equal(final.positions, full.positions[step:])
+    np.testing.assert_array_equal(final.forces, full.forces[step:])
+    np.testing.assert_array_equal(final.energies, full.energies[step:])
+    np.testing.assert_array_equal(final.magnetizations, full.magnetizations[step:step + 1])
+    assert final.scf_energies == full.scf_energies[step:step + 1]
+    assert final.magmoms == full.magmoms
+    if truncated:
+        # the total magnetization of a step is known once the next step starts
+        assert final.total_magnetizations == full.total_magnetizations[step:]
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from fixtures import write_run
+from trajectory import Trajectory
+from vasp_data import VaspData
+from VASPparser import FrameBuffer, LazyFrames, OutcarParser
+
+
+def test_edit_of_lazily_read_step_is_kept():
+    stored = np.arange(2 * 3 * 3, dtype=float).reshape(2, 3, 3)
+    offsets = FrameBuffer.from_array(np.arange(2, dtype=np.int64))
+    frames = LazyFrames(offsets, lambda offset: stored[offset].copy())
+    trajectory = Trajectory(frames, constrains=[["T", "F", "N/A"]] * 3)
+
+    trajectory.set_positions(1, [7.0, 8.0, 9.0], (slice(3), 0))
+    assert np.array_equal(trajectory.frame(1)[:, 0], [7.0, 8.0, 9.0])
+    assert np.array_equal(trajectory.frame(0), stored[0])
+    assert trajectory.constrain_flags()[0].tolist() == ["T", "F", "N/A"]
+
+
+
+def test_atom_edits_of_lazily_read_steps_decode_only_the_read_steps():
+    stored = np.arange(50 * 3 * 3, dtype=float).reshape(50, 3, 3)
+    decoded = []
+
+    def decode(offset):
+        decoded.append(offset)
+        return stored[offset].copy()
+
+    offsets = FrameBuffer.from_array(np.arange(50, dtype=np.int64))
+    trajectory = Trajectory(LazyFrames(offsets, decode), constrains=[["T", "T", "T"]] * 3)
+    trajectory.set_positions(7, [1.0, 2.0, 3.0], 1)
+    trajectory.insert_atom(1, [9.0, 9.0, 9.0], ("F", "F", "F"))
+    trajectory.reorder([3, 2, 1, 0])
+    trajectory.delete_atom(0)
+    assert len(set(decoded)) <= 2
+
+    # stored atoms 0, 1, 2 became 2, 1, inserted, 0 after the reorder, the first is deleted
+    expected = stored[20][[1, 0, 0]]
+    expected[1] = 9.0
+    assert np.array_equal(trajectory.frame(20), expected)
+    assert np.array_equal(trajectory.frame(7)[0], [1.0, 2.0, 3.0])
+    assert trajectory.constrain_flags()[1].tolist() == ["F", "F", "F"]
+    assert len(trajectory.positions) == 50
+
+
+def test_spilled_selection_is_not_reused_for_other_frames(tmp_path):
+    write_run(str(tmp_path), steps=20)
+    strided = VaspData(str(tmp_path), parse_doscar=False, trajectory_storage="mmap", frames=slice(None, None, 5))
+    assert len(strided.outcar_coordinates) == 4
+
+    full = VaspData(str(tmp_path), parse_doscar=False, trajectory_storage="mmap")
+    reference = OutcarParser(str(tmp_path), "OUTCAR", use_cache=False)
+    assert len(full.outcar_coordinates) == 20
+    assert np.allclose(full.outcar_coordinates, reference.positions, atol=1e-4)
+    assert np.allclose(strided.outcar_coordinates, reference.positions[::5], atol=1e-4)
+
+
+def test_mapped_frames_of_a_truncated_run_match_the_full_parse(tmp_path):
+    text = write_run(str(tmp_path), steps=9)
+    with open(tmp_path / "OUTCAR", "w", newline="") as file:
+        file.write(text[:text.rindex(" POSITION") + 300])
+    reference = OutcarParser(str(tmp_path), "OUTCAR", use_cache=False)
+    for _ in range(2):
+        # the second open maps the files written by the first one
+        data = VaspData(str(tmp_path), parse_doscar=False, trajectory_storage="mmap")
+        for name in ["positions", "forces", "magnetizations"]:
+            frames = getattr(data.trajectory, name)
+            assert isinstance(frames, np.memmap)
+            assert frames.dtype == np.float32
+            np.testing.assert_allclose(frames, getattr(reference, name), atol=1e-4, err_msg=name)
+    assert len(data.outcar_coordinates) == 8
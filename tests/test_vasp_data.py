@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from vasp_data import VaspData
+
+POSCAR = """test
+1.0
+10 0 0
+0 10 0
+0 0 10
+Co O
+1 2
+Selective dynamics
+Cartesian
+    1.0 1.0 1.0 T T F
+    2.0 2.0 2.0 T T T
+    3.0 3.0 3.0 F F F
+"""
+
+
+def test_directory_with_only_poscar_opens(tmp_path):
+    (tmp_path / "POSCAR").write_text(POSCAR)
+    data = VaspData(str(tmp_path))
+    assert data.number_of_atoms == 3
+    # no DOSCAR: the DOS sums and smearing work on the empty placeholder
+    summed = data.dos_sums.sum([0], [0])
+    assert summed.size == 0
+    energies, smeared = data.dos_broadening.smooth(summed, 0.1)
+    assert smeared.shape == summed.shape
+
+
+def xdatcar_configuration(step, shift):
+    return "Direct configuration=%6d\n" % step + "".join(
+        "  %.8f  %.8f  %.8f\n" % (0.1 * atom + shift, 0.2, 0.3) for atom in range(3))
+
+
+def test_follow_reads_configurations_appended_to_xdatcar(tmp_path):
+    (tmp_path / "POSCAR").write_text(POSCAR)
+    header = "".join(POSCAR.splitlines(keepends=True)[:7])
+    xdatcar = tmp_path / "XDATCAR"
+    xdatcar.write_text(header + xdatcar_configuration(1, 0.0) + xdatcar_configuration(2, 0.01))
+    (tmp_path / "OSZICAR").write_text("   1 F= -.10000000E+02 E0= -.10000000E+02  d E =-.1E+02\n"
+                                      "   2 F= -.11000000E+02 E0= -.11000000E+02  d E =-.1E+01\n")
+    data = VaspData(str(tmp_path), parse_doscar=False, trajectory_storage="mmap")
+    assert len(data.outcar_coordinates) == 2
+
+    # the job writes the geometry of step 3 before its energy
+    with open(xdatcar, "a") as file:
+        file.write(xdatcar_configuration(3, 0.02) + "Direct configuration=     4\n  0.1")
+    assert data.refresh() == 1
+    assert len(data.outcar_coordinates) == 3
+    assert abs(data.outcar_coordinates[2][0][0] - 0.2) < 1e-5
+    assert len(data.outcar_energies) == 2
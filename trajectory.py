@@ -0,0 +1,300 @@
+import os
+
+import numpy as np
+
+from parser_cache import cache_path, load_cache, save_cache
+
+# frame arrays and the number of values each atom has in a frame
+FRAME_COLUMNS = (("positions", 3), ("forces", 3), ("magnetizations", None))
+
+
+class Trajectory:
+    """
+    Per-step data of a run kept column-wise in contiguous arrays:
+
+    positions       (nsteps, natoms, 3) float64
+    forces          (nforce_steps, natoms, 3) float64
+    magnetizations  (nmag_steps, natoms) float64
+    movable         (natoms, 3) bool, selective dynamics flag of each direction
+    selective       (natoms, 3) bool, False where the flag is missing ("N/A")
+
+    Lazily decoded OUTCARs keep positions, forces and magnetizations as
+    LazyFrames. Editing the atoms of those (or of mapped frames) wraps them
+    in EditedFrames, which applies the edits to a step when it is read, so
+    the whole run is never decoded into memory. Indexing a step of an array
+    returns a view, so widgets never copy a frame.
+    """
+
+    def __init__(self, positions=None, forces=None, magnetizations=None, constrains=None):
+        # number of frames of each array written to memory-mapped files by spill()
+        self.spilled = None
+        self.spill_suffix = ""
+        self.set_frames(positions, forces, magnetizations)
+        if constrains is None:
+            constrains = [["N/A"] * 3] * self.frame_atom_count(self.positions)
+        self.set_constrains(constrains)
+
+    def set_frames(self, positions, forces=None, magnetizations=None):
+        """replace the per-step data, e.g. after new steps were appended to the file"""
+        self.positions = self.as_frames(positions, 3)
+        atom_count = self.frame_atom_count(self.positions)
+        self.forces = self.as_frames(forces, 3, atom_count)
+        self.magnetizations = self.as_frames(magnetizations, None, atom_count)
+
+    @staticmethod
+    def frame_atom_count(frames):
+        return len(frames[0]) if len(frames) > 0 else 0
+
+    @staticmethod
+    def as_frames(frames, columns, atom_count=0):
+        """stack ``frames`` into one float array unless they are decoded lazily"""
+        if frames is None or len(frames) == 0:
+            shape = (0, atom_count) if columns is None else (0, atom_count, columns)
+            return np.zeros(shape)
+        if isinstance(frames, (list, tuple)):
+            try:
+                return np.array(frames, dtype=float)
+            except ValueError:
+                # steps of a diff XDATCAR hold only the moved atoms and cannot be stacked
+                return list(frames)
+        # arrays are shared with the parser, LazyFrames stay lazy
+        return frames
+
+    def append_positions(self, positions):
+        """add the positions of new steps, e.g. configurations written by a running job"""
+        if isinstance(self.positions, (list, np.memmap)):
+            # frames of a mapped file stay views, spill() writes only the new ones
+            self.positions = list(self.positions) + list(positions)
+        else:
+            self.positions = np.concatenate([self.positions, np.asarray(positions, dtype=float)])
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def atom_count(self):
+        return len(self.movable)
+
+    def frame(self, step):
+        """positions of ``step`` as a (natoms, 3) view"""
+        return self.positions[step]
+
+    def set_positions(self, step, positions, index=slice(None)):
+        """
+        write ``positions`` to ``index`` of the (natoms, 3) frame of ``step``;
+        of lazily read frames only this step is decoded and kept, an edit of a
+        decoded copy would be lost
+        """
+        if isinstance(self.positions, (np.ndarray, list)):
+            # mapped frames are copy-on-write, frames of a diff XDATCAR are arrays in a list
+            self.positions[step][index] = positions
+        else:
+            self.editable("positions", 3).edit(step)[index] = positions
+
+    def step_forces(self, step):
+        """forces of ``step`` or None if the step has no forces"""
+        if not -len(self.forces) <= step < len(self.forces):
+            return None
+        return self.forces[step]
+
+    def step_magnetizations(self, step):
+        """magnetic moments of ``step`` or None if the step has none"""
+        if not -len(self.magnetizations) <= step < len(self.magnetizations):
+            return None
+        return self.magnetizations[step]
+
+    def set_constrains(self, constrains):
+        """build the boolean masks from "T"/"F"/"N/A" selective dynamics flags"""
+        flags = np.array([[str(flag).upper() for flag in atom] for atom in constrains], dtype=str).reshape(-1, 3)
+        self.movable = flags == "T"
+        self.selective = (flags == "T") | (flags == "F")
+
+    def set_constrain(self, atom, axis, flag):
+        flag = str(flag).upper()
+        self.movable[atom, axis] = flag == "T"
+        self.selective[atom, axis] = flag in ("T", "F")
+
+    def constrain_flags(self):
+        """selective dynamics flags as strings, as written to POSCAR"""
+        flags = np.where(self.movable, "T", "F").astype("<U3")
+        flags[~self.selective] = "N/A"
+        return flags
+
+    def editable(self, name, columns):
+        """
+        frames of ``name`` whose atoms can be changed: arrays in memory as they
+        are, lazily read or mapped frames wrapped in EditedFrames
+        """
+        frames = getattr(self, name)
+        if type(frames) is np.ndarray or isinstance(frames, (EditedFrames, list)):
+            return frames
+        frames = EditedFrames(frames, self.frame_atom_count(frames), columns)
+        setattr(self, name, frames)
+        return frames
+
+    def insert_atom(self, index, position, constrain=("N/A", "N/A", "N/A"), magnetization=0.0):
+        """insert an atom at ``index`` with the same position in every step"""
+        values = {"positions": np.asarray(position, dtype=float), "forces": 0.0, "magnetizations": float(magnetization)}
+        for name, columns in FRAME_COLUMNS:
+            frames = self.editable(name, columns)
+            if isinstance(frames, EditedFrames):
+                frames.insert_atom(index, values[name])
+            else:
+                setattr(self, name, np.insert(frames, index, values[name], axis=1))
+        self.movable = np.insert(self.movable, index, False, axis=0)
+        self.selective = np.insert(self.selective, index, False, axis=0)
+        for axis, flag in enumerate(constrain):
+            self.set_constrain(index, axis, flag)
+
+    def delete_atom(self, index):
+        for name, columns in FRAME_COLUMNS:
+            frames = self.editable(name, columns)
+            if isinstance(frames, EditedFrames):
+                frames.delete_atom(index)
+            else:
+                setattr(self, name, np.delete(frames, index, axis=1))
+        self.movable = np.delete(self.movable, index, axis=0)
+        self.selective = np.delete(self.selective, index, axis=0)
+
+    def reorder(self, order):
+        """put the atoms in ``order``, a sequence of old atom indices"""
+        order = np.asarray(order, dtype=int)
+        for name, columns in FRAME_COLUMNS:
+            frames = self.editable(name, columns)
+            if isinstance(frames, EditedFrames):
+                frames.reorder(order)
+            else:
+                setattr(self, name, frames[:, order])
+        self.movable = self.movable[order]
+        self.selective = self.selective[order]
+
+    def spill(self, source, positions=None, suffix=""):
+        """
+        Move the frames to float32 files in the cache directory of ``source``
+        and map them back with np.memmap, so memory use is bounded by the page
+        cache rather than by the length of the run. Edits of a mapped frame are
+        kept in memory (copy-on-write) and never reach the files.
+
+        ``positions`` may be an iterator over frames which were never held in
+        memory. Frames already written for the same file are reused, so
+        reopening a run or following a running job writes only the new steps.
+        ``suffix`` names the selection of steps (see OutcarParser.frames_suffix),
+        each selection has its own files.
+        """
+        if self.spilled is None or suffix != self.spill_suffix:
+            self.spill_suffix = suffix
+            stored = load_cache(source, f"{suffix}.trajectory.npz")
+            self.spilled = [0] * len(FRAME_COLUMNS) if stored is None else [int(n) for n in stored["counts"]]
+            self.spilled_atoms = 0 if stored is None else int(stored["atoms"])
+        counts = []
+        for i, (name, columns) in enumerate(FRAME_COLUMNS):
+            path = cache_path(source, f"{suffix}.{name}.f32")
+            frames = positions if name == "positions" and positions is not None else getattr(self, name)
+            if isinstance(frames, np.memmap):
+                counts.append(len(frames))
+                continue
+            start = self.spilled[i] if os.path.exists(path) else 0
+            if hasattr(frames, "__getitem__"):
+                if len(frames) > 0:
+                    self.spilled_atoms = self.frame_atom_count(frames)
+                if start > len(frames):
+                    # fewer frames than before, e.g. the repeated last magnetization was dropped
+                    start = 0
+                new_frames = (frames[step] for step in range(start, len(frames)))
+            else:
+                # an iterator is read only if none of its frames were written yet
+                new_frames = frames if start == 0 else ()
+            values = self.spilled_atoms * (columns or 1)
+            try:
+                count, values = self.write_frames(path, new_frames, start, values)
+            except OSError as e:
+                print(f"could not write trajectory {path}: {e}")
+                return
+            self.spilled_atoms = values // (columns or 1)
+            shape = (count, self.spilled_atoms) + (() if columns is None else (columns,))
+            setattr(self, name, np.memmap(path, dtype=np.float32, mode="c", shape=shape) if count
+                    else np.zeros(shape, dtype=np.float32))
+            counts.append(count)
+        self.spilled = counts
+        save_cache(source, {"counts": np.array(counts), "atoms": np.array(self.spilled_atoms)},
+                   f"{suffix}.trajectory.npz")
+
+    @staticmethod
+    def write_frames(path, frames, start, values):
+        """
+        Write ``frames`` as float32 after the first ``start`` frames of ``path``,
+        each frame holding ``values`` numbers. Returns the number of frames in the
+        file and the number of values per frame.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        count = start
+        with open(path, "r+b" if start else "wb") as file:
+            file.seek(start * values * 4)
+            for frame in frames:
+                frame = np.asarray(frame, dtype=np.float32)
+                values = frame.size
+                file.write(frame.tobytes())
+                count += 1
+            file.truncate()
+        return count, values
+
+
+class EditedFrames:
+    """
+    Frames which are read lazily (LazyFrames or a mapped file) seen through
+    edits of their atoms. ``atoms`` holds for each atom the atom of the stored
+    frame, or -1 for an inserted atom, whose value in every step is in
+    ``fill``. Steps whose values were changed are kept in ``edited``; every
+    other step is read and rearranged only when it is accessed.
+    """
+
+    def __init__(self, frames, atom_count, columns):
+        self.frames = frames
+        self.atoms = np.arange(atom_count)
+        self.fill = np.zeros((atom_count,) + (() if columns is None else (columns,)))
+        self.edited = {}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index in self.edited:
+            return self.edited[index]
+        frame = np.asarray(self.frames[index], dtype=float)[np.maximum(self.atoms, 0)]
+        inserted = self.atoms < 0
+        frame[inserted] = self.fill[inserted]
+        return frame
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def edit(self, index):
+        """step ``index`` as an array kept in memory, so changes of it persist"""
+        if index < 0:
+            index += len(self)
+        if index not in self.edited:
+            self.edited[index] = self[index]
+        return self.edited[index]
+
+    def insert_atom(self, index, value):
+        self.atoms = np.insert(self.atoms, index, -1)
+        self.fill = np.insert(self.fill, index, value, axis=0)
+        for step, frame in self.edited.items():
+            self.edited[step] = np.insert(frame, index, value, axis=0)
+
+    def delete_atom(self, index):
+        self.atoms = np.delete(self.atoms, index)
+        self.fill = np.delete(self.fill, index, axis=0)
+        for step, frame in self.edited.items():
+            self.edited[step] = np.delete(frame, index, axis=0)
+
+    def reorder(self, order):
+        self.atoms = self.atoms[order]
+        self.fill = self.fill[order]
+        for step, frame in self.edited.items():
+            self.edited[step] = frame[order]
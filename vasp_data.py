@@ -9,13 +9,40 @@ try:
 except:
     print("no ASE module")
 import os
+import numpy as np
 from VASPparser import *
 import json
 from exceptions import EmptyFile
+from trajectory import Trajectory
+from dos_engine import DosAggregator, DosBroadening
+
+
+# OUTCARs larger than this are decoded in a process pool
+PARALLEL_OUTCAR_SIZE = 256 * 1024 ** 2
+# OUTCARs larger than this are indexed and their frames are decoded on demand
+LAZY_OUTCAR_SIZE = 1024 ** 3
 
 
 class VaspData():
-    def __init__(self, dir, parse_doscar=True, parse_outcar=True):
+    def __init__(self, dir, parse_doscar=True, parse_outcar=True, outcar_mode="auto", trajectory_storage="memory",
+                 frames=None):
+        """
+        outcar_mode: "full" parses every ionic step, "parallel" does the same
+        with a process pool, "lazy" only indexes the OUTCAR and decodes
+        geometries when they are shown, "auto" picks one of them from the
+        size of the file and the number of CPUs. "final" reads only the last
+        complete ionic step from the end of OUTCAR (or XDATCAR and OSZICAR).
+        trajectory_storage: "memory" keeps the frames in RAM, "mmap" writes
+        them as float32 to the cache directory and maps them back; the OUTCAR
+        is then always read lazily and a plain XDATCAR frame by frame.
+        frames: slice of the OUTCAR ionic steps to load (stride, last K steps
+        or a window), see OutcarParser; energy_statistics covers all steps.
+        """
+        self.outcar_mode = outcar_mode
+        self.frames = frames
+        self.energy_statistics = None
+        self.trajectory_storage = trajectory_storage
+        self.trajectory = Trajectory()
         if parse_outcar:
             self.parse_outcar(dir)
         else:
@@ -27,25 +54,110 @@ class VaspData():
         self.process_poscar(poscar)
         if not parse_doscar:
             self.initialize_empty_dos_data()
+        self.dos_sums = DosAggregator(self.dos, self.symbols, self.orbital_types, self.orbitals)
+        self.dos_broadening = DosBroadening(self.doscar.total_dos_energy)
         self.nums = list(range(1, self.number_of_atoms+1))
 
+    @property
+    def outcar_coordinates(self):
+        """positions of every step, (nsteps, natoms, 3); indexing a step gives a view"""
+        return self.trajectory.positions
+
+    @outcar_coordinates.setter
+    def outcar_coordinates(self, positions):
+        self.trajectory.positions = Trajectory.as_frames(positions, 3)
+
+    @property
+    def all_constrains(self):
+        """selective dynamics flags of each atom, (natoms, 3) "T"/"F"/"N/A" read from the trajectory masks"""
+        return self.trajectory.constrain_flags()
 
 
     def parse_outcar(self, dir):
         if not os.path.exists(os.path.join(dir, 'OUTCAR')):
             print('no OUTCAR found! importing CONTCAR or POSCAR')
             self.outcar_file = False
-        elif  os.path.getsize(os.path.join(dir, 'OUTCAR'))/1024/1024/1024 > 1.5:
-            print('OUTCAR found but is too big. Supressing output')
-            self.outcar_file = False
         else:
             self.outcar_file = True
-            self.outcar_data = OutcarParser(dir, 'OUTCAR')
-            self.outcar_coordinates = self.outcar_data.find_coordinates()
+            mode = self.outcar_mode
+            if self.trajectory_storage == "mmap" and mode != "final":
+                mode = "lazy"
+            if mode == "auto":
+                size = os.path.getsize(os.path.join(dir, 'OUTCAR'))
+                if size > LAZY_OUTCAR_SIZE:
+                    mode = "lazy"
+                elif size > PARALLEL_OUTCAR_SIZE and (os.cpu_count() or 1) > 2:
+                    mode = "parallel"
+                else:
+                    mode = "full"
+            if mode == "final":
+                self.outcar_data = FinalStateOutcarParser(dir, 'OUTCAR')
+            elif mode == "lazy":
+                self.outcar_data = LazyOutcarParser(dir, 'OUTCAR', frames=self.frames)
+            elif mode == "parallel":
+                self.outcar_data = ParallelOutcarParser(dir, 'OUTCAR', frames=self.frames)
+            else:
+                self.outcar_data = OutcarParser(dir, 'OUTCAR', frames=self.frames)
+            self.trajectory.set_frames(self.outcar_data.find_coordinates(), self.outcar_data.find_forces(),
+                                       self.outcar_data.magnetizations)
+            if self.trajectory_storage == "mmap":
+                self.trajectory.spill(self.outcar_data.filename, suffix=self.outcar_data.frames_suffix())
             self.outcar_energies = self.outcar_data.find_energy()
+            self.energy_statistics = self.outcar_data.energy_statistics
             self.magmoms = self.outcar_data.magmoms
             self.scf_energies = self.outcar_data.find_scf_energies()
 
+    def followed_files(self):
+        """files which grow while the job in the directory is running"""
+        if self.outcar_file:
+            return [self.outcar_data.filename]
+        files = []
+        if getattr(self, "oszicar", None) is not None and self.oszicar.oszicar_file_exists:
+            files.append(self.oszicar.file)
+        if self.follows_xdatcar():
+            files.append(self.xdatcar.file)
+        return files
+
+    def follows_xdatcar(self):
+        """whether configurations appended to a plain XDATCAR are read, diff files are not followed"""
+        return bool(self.xdatcar_file) and self.outcar_mode != "final" and self.xdatcar.xdatcar_file_exists \
+            and not self.xdatcar.xdatcar_diff_exists
+
+    def refresh(self):
+        """
+        Read only the data appended to OUTCAR (or OSZICAR and XDATCAR for XDATCAR
+        runs) since the last read. Returns the number of new ionic steps.
+        """
+        if self.outcar_file:
+            new_steps = self.outcar_data.update()
+            if new_steps:
+                self.trajectory.set_frames(self.outcar_data.find_coordinates(), self.outcar_data.find_forces(),
+                                           self.outcar_data.magnetizations)
+                if self.trajectory_storage == "mmap":
+                    self.trajectory.spill(self.outcar_data.filename, suffix=self.outcar_data.frames_suffix())
+                self.outcar_energies = self.outcar_data.find_energy()
+                self.energy_statistics = self.outcar_data.energy_statistics
+                self.scf_energies = self.outcar_data.find_scf_energies()
+            return new_steps
+        new_steps = 0
+        if self.outcar_mode == "final":
+            return new_steps
+        if getattr(self, "oszicar", None) is not None and self.oszicar.oszicar_file_exists:
+            new_steps = self.oszicar.update()
+            if new_steps:
+                self.outcar_energies = self.oszicar.nrgs
+        if self.follows_xdatcar():
+            frames = self.xdatcar.read_appended(len(self.trajectory))
+            if frames:
+                self.trajectory.append_positions(frames)
+                if getattr(self, "oszicar", None) is None or not self.oszicar.oszicar_file_exists:
+                    # without OSZICAR the energy of every step is 0, as when the run was opened
+                    self.outcar_energies = list(self.outcar_energies) + [0] * len(frames)
+                if self.trajectory_storage == "mmap":
+                    self.trajectory.spill(self.xdatcar_file)
+                new_steps = max(new_steps, len(frames))
+        return new_steps
+
     def parse_poscar(self, dir):
         import glob
         poscar_path = os.path.join(dir, 'POSCAR')
@@ -108,20 +220,17 @@ class VaspData():
                     self.xdatcar_file = False
                     xdatcar_file_exists = False
                 if xdatcar_file_exists:
+                    if self.xdatcar.coordinates is None:
+                        self.trajectory.spill(self.xdatcar_file, self.xdatcar.iter_frames())
+                        self.xdatcar.coordinates = self.trajectory.positions
                     if os.path.getsize(self.xdatcar_file) > 0:
                         self.poscar = PoscarParser(self.xdatcar_file)
                         self.coordinates = self.xdatcar.coordinates[0]
-                        if hasattr(self, "outcar_coordinates"):
-                            if self.outcar_coordinates == []:
-                                self.outcar_coordinates = self.xdatcar.coordinates
-                                self.outcar_energies = [0 for step in self.outcar_coordinates]
-                                self.magmoms = [0 for atom in self.coordinates]
-                        else:
-                            self.outcar_coordinates = self.xdatcar.coordinates
-                            self.outcar_energies = [0 for step in self.outcar_coordinates]
-                            self.magmoms = [0 for atom in self.coordinates]
+                        self.outcar_coordinates = self.xdatcar.coordinates
+                        self.outcar_energies = [0 for step in range(len(self.outcar_coordinates))]
+                        self.magmoms = [0 for atom in self.coordinates]
                     if self.oszicar_file:
-                        self.oszicar = OSZICARParser(self.oszicar_file)
+                        self.oszicar = OSZICARParser(self.oszicar_file, final_only=self.outcar_mode == "final")
                         if self.oszicar.oszicar_file_exists:
                             self.outcar_energies = self.oszicar.nrgs
             else:
@@ -143,7 +252,7 @@ class VaspData():
                 else:
                     self.poscar = PoscarParser(self.poscar_file)
                     self.coordinates = self.poscar.coordinates()
-                    if not self.outcar_file or self.outcar_coordinates == []:
+                    if not self.outcar_file or len(self.outcar_coordinates) == 0:
                         self.outcar_coordinates = [self.poscar.coordinates()]
                         self.outcar_energies = [0]
                         self.magmoms = self.poscar.number_of_atoms() * [0]
@@ -168,6 +277,7 @@ class VaspData():
         pass
 
     def process_doscar(self, doscar):
+        self.dos = self.doscar.dos
         self.data_up = self.doscar.dataset_up
         self.data_down = self.doscar.dataset_down
         self.orbitals = self.doscar.orbitals
@@ -197,7 +307,7 @@ class VaspData():
         self.number_of_atoms = len(self.coordinates)
         self.symbols = self.poscar.list_atomic_symbols()
         self.constrains = self.poscar.constrains()
-        self.all_constrains = self.poscar.all_constrains()
+        self.trajectory.set_constrains(self.poscar.all_constrains())
         self.suffixes = ["" for _ in range(self.number_of_atoms)]
 
         self.partition_atoms(atoms_underline_number)
@@ -215,10 +325,10 @@ class VaspData():
 
         n_atoms = max(1, self.number_of_atoms)
         n_orbitals = len(self.orbitals)
-        zeros = [[[0.0] for _ in range(n_orbitals)] for _ in range(n_atoms)]
 
-        self.data_up = zeros
-        self.data_down = [[[0.0] for _ in range(n_orbitals)] for _ in range(n_atoms)]
+        self.dos = np.zeros((n_atoms, n_orbitals, 2, 1))
+        self.data_up = self.dos[:, :, 0]
+        self.data_down = self.dos[:, :, 1]
         self.total_alfa = [0.0]
         self.total_beta = [0.0]
         self.doscar = SimpleNamespace(total_dos_energy=[0.0])
@@ -240,5 +350,9 @@ class VaspData():
     def parse_xdatcar(self, dir, file):
         file = os.path.join(dir, file)
         if os.path.exists(file):
-            xdatcar = XDATCARParser(os.path.join(dir, file))
+            if self.outcar_mode == "final":
+                read_frames = "final"
+            else:
+                read_frames = self.trajectory_storage != "mmap"
+            xdatcar = XDATCARParser(os.path.join(dir, file), read_frames=read_frames)
             return xdatcar
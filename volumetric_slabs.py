@@ -0,0 +1,331 @@
+"""
+Slab-wise operations on volumetric grids which may not fit in memory.
+
+Grids are Fortran-ordered, x fastest and z slowest as VASP writes them, so
+a range of z-planes is one contiguous block of the array, and of the file
+when the grid is memory-mapped. Every function visits a grid one slab of
+z-planes at a time, so only about SLAB_BYTES of it is resident at once.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+SLAB_BYTES = 64 * 1024 ** 2
+
+
+def slabs(shape, itemsize=8, overlap=0):
+    """
+    (start, stop) ranges of z-planes of about SLAB_BYTES each; with
+    ``overlap`` every slab repeats the last planes of the previous one
+    """
+    nx, ny, nz = shape
+    planes = max(overlap + 1, SLAB_BYTES // max(nx * ny * itemsize, 1))
+    start = 0
+    while True:
+        stop = min(start + planes, nz)
+        yield start, stop
+        if stop >= nz:
+            return
+        start = stop - overlap
+
+
+def value_range(grid):
+    """smallest and largest value of ``grid``"""
+    low, high = np.inf, -np.inf
+    for start, stop in slabs(grid.shape, grid.itemsize):
+        slab = grid[:, :, start:stop]
+        low = min(low, slab.min())
+        high = max(high, slab.max())
+    return low, high
+
+
+def copy_grid(grid, out=None):
+    """contiguous Fortran-ordered copy of ``grid``, e.g. of a chopped view, written to ``out`` if given"""
+    if out is None:
+        out = np.empty(grid.shape, dtype=grid.dtype, order="F")
+    for start, stop in slabs(grid.shape, grid.itemsize):
+        out[:, :, start:stop] = grid[:, :, start:stop]
+    return out
+
+
+def apply_operation(target, other, op, out=None):
+    """
+    ``target`` add, subtract, multiply or divide ``other``, written to ``out``,
+    by default to ``target`` itself. Division by zero leaves the value of
+    ``target``.
+    """
+    if out is None:
+        out = target
+    for start, stop in slabs(target.shape, target.itemsize):
+        a = target[:, :, start:stop]
+        b = other[:, :, start:stop]
+        result = out[:, :, start:stop]
+        if op == "add":
+            np.add(a, b, out=result)
+        elif op == "subtract":
+            np.subtract(a, b, out=result)
+        elif op == "multiply":
+            np.multiply(a, b, out=result)
+        elif op == "divide":
+            if out is not target:
+                result[...] = a
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.divide(result, b, out=result, where=b != 0)
+        else:
+            raise ValueError(f"unknown operation {op}")
+    return out
+
+
+class SpinDensity:
+    """
+    Spin-up (total + spin) / 2 (``sign`` 1) or spin-down (total - spin) / 2
+    (``sign`` -1) density computed from the two grids for the part that is
+    read, so it takes no memory of its own. It is indexed like an array;
+    setting a part changes total and spin so that the other spin density
+    stays the same.
+    """
+
+    def __init__(self, total, spin, sign):
+        self.total = total
+        self.spin = spin
+        self.sign = sign
+        self.shape = total.shape
+        self.dtype = total.dtype
+        self.itemsize = total.itemsize
+        self.size = total.size
+        self.ndim = total.ndim
+
+    def __getitem__(self, key):
+        return (self.total[key] + self.sign * self.spin[key]) / 2
+
+    def __setitem__(self, key, value):
+        other = (self.total[key] - self.sign * self.spin[key]) / 2
+        self.total[key] = value + other
+        self.spin[key] = self.sign * (value - other)
+
+    def __array__(self, dtype=None, copy=None):
+        array = copy_grid(self)
+        return array if dtype is None else array.astype(dtype)
+
+
+def axis_average(grid, axis):
+    """mean of ``grid`` over the two axes other than ``axis``"""
+    nx, ny, nz = grid.shape
+    if axis == 2:
+        average = np.empty(nz)
+        for start, stop in slabs(grid.shape, grid.itemsize):
+            average[start:stop] = grid[:, :, start:stop].mean(axis=(0, 1))
+        return average
+    summed = np.zeros(grid.shape[axis])
+    for start, stop in slabs(grid.shape, grid.itemsize):
+        summed += grid[:, :, start:stop].sum(axis=(1 - axis, 2))
+    return summed / (grid.size // grid.shape[axis])
+
+
+def plane_average(grid, axis):
+    """mean of ``grid`` along ``axis``, a plane spanned by the other two axes"""
+    nx, ny, nz = grid.shape
+    if axis == 2:
+        summed = np.zeros((nx, ny))
+        for start, stop in slabs(grid.shape, grid.itemsize):
+            summed += grid[:, :, start:stop].sum(axis=2)
+        return summed / nz
+    plane = np.empty((ny if axis == 0 else nx, nz))
+    for start, stop in slabs(grid.shape, grid.itemsize):
+        plane[:, start:stop] = grid[:, :, start:stop].mean(axis=axis)
+    return plane
+
+
+def contour_slabs(grid, values, basis, cancelled=None):
+    """
+    Isosurfaces of ``grid`` at ``values`` as vtkPolyData in Cartesian
+    coordinates of the cell ``basis`` (rows are the lattice vectors), None
+    if ``cancelled()`` became true first.
+
+    Each slab is contoured on its own on the orthogonal grid of indices,
+    sharing one plane with the next so no cell of the grid is left out,
+    with vtkFlyingEdges3D, which runs on all cores. The pieces are merged
+    and only the mesh points are transformed into the cell, the grid itself
+    never is.
+    """
+    import vtk
+    from vtk.util import numpy_support
+
+    nx, ny, nz = grid.shape
+    append = vtk.vtkAppendPolyData()
+    pieces = 0
+    for start, stop in slabs(grid.shape, grid.itemsize, overlap=1):
+        if cancelled is not None and cancelled():
+            return None
+        # a copy only if the grid is a chopped (strided) view
+        slab = np.asfortranarray(grid[:, :, start:stop])
+        scalars = numpy_support.numpy_to_vtk(num_array=slab.ravel(order='F'), deep=False)
+        scalars.SetName("values")
+        image_data = vtk.vtkImageData()
+        image_data.SetDimensions(nx, ny, stop - start)
+        image_data.SetOrigin(0.0, 0.0, start)
+        image_data.GetPointData().SetScalars(scalars)
+
+        if hasattr(vtk, "vtkFlyingEdges3D"):
+            contour_filter = vtk.vtkFlyingEdges3D()
+            # the mapper colours the surfaces by their value
+            contour_filter.ComputeScalarsOn()
+        else:
+            contour_filter = vtk.vtkContourFilter()
+        contour_filter.SetInputData(image_data)
+        for i, value in enumerate(values):
+            contour_filter.SetValue(i, value)
+        contour_filter.Update()
+        piece = vtk.vtkPolyData()
+        piece.ShallowCopy(contour_filter.GetOutput())
+        append.AddInputData(piece)
+        pieces += 1
+    if cancelled is not None and cancelled():
+        return None
+    if pieces > 1:
+        # points on the shared planes were made by both neighbouring slabs
+        merge = vtk.vtkCleanPolyData()
+        merge.SetInputConnection(append.GetOutputPort())
+        output = merge
+    else:
+        output = append
+
+    # indices to fractional to Cartesian coordinates
+    matrix = np.asarray(basis).T / (np.array(grid.shape) - 1)
+    transform = vtk.vtkTransform()
+    transform.SetMatrix([
+        matrix[0, 0], matrix[0, 1], matrix[0, 2], 0,
+        matrix[1, 0], matrix[1, 1], matrix[1, 2], 0,
+        matrix[2, 0], matrix[2, 1], matrix[2, 2], 0,
+        0, 0, 0, 1
+    ])
+    transform_filter = vtk.vtkTransformPolyDataFilter()
+    transform_filter.SetTransform(transform)
+    transform_filter.SetInputConnection(output.GetOutputPort())
+    transform_filter.Update()
+    return transform_filter.GetOutput()
+
+
+def block_average(grid, factor=2, cancelled=None):
+    """
+    Grid ``factor`` times coarser than ``grid`` along each axis, every value
+    the mean of a block of factor**3 values; planes left over at the end of
+    a dimension are left out. None if ``cancelled()`` became true first.
+    """
+    nx, ny, nz = (n // factor for n in grid.shape)
+    coarse = np.empty((nx, ny, nz), dtype=grid.dtype, order="F")
+    # a coarse plane is made of ``factor`` fine planes of factor**2 the size
+    for start, stop in slabs(coarse.shape, factor ** 3 * grid.itemsize):
+        if cancelled is not None and cancelled():
+            return None
+        fine = grid[:factor * nx, :factor * ny, factor * start:factor * stop]
+        coarse[:, :, start:stop] = fine.reshape(nx, factor, ny, factor, stop - start, factor).mean(axis=(1, 3, 5))
+    return coarse
+
+
+class GridPyramid:
+    """
+    A grid and its block averages, each level half as fine as the one
+    before: level 0 is the grid itself, levels 1, 2 and 3 are 2, 4 and 8
+    times coarser. A level is built from the grid the first time it is
+    asked for, so only the levels which are contoured cost a pass over
+    the grid. A dimension is not halved below two points. The pyramid may
+    be used from worker threads.
+    """
+    LEVELS = 3
+
+    def __init__(self, grid, levels=LEVELS):
+        self.shapes = [grid.shape]
+        while len(self.shapes) <= levels and min(self.shapes[-1]) >= 4:
+            self.shapes.append(tuple(n // 2 for n in self.shapes[-1]))
+        self.levels = {0: grid}
+        self.extremes = None
+        self.lock = threading.Lock()
+
+    def level(self, level, cancelled=None):
+        """
+        grid of ``level``, the coarsest one if there are fewer levels; None
+        if ``cancelled()`` became true while it was built
+        """
+        level = min(level, len(self.shapes) - 1)
+        with self.lock:
+            if level not in self.levels:
+                coarse = block_average(self.levels[0], 2 ** level, cancelled)
+                if coarse is None:
+                    return None
+                self.levels[level] = coarse
+            return self.levels[level]
+
+    def value_range(self):
+        """smallest and largest value of the full grid, found once"""
+        with self.lock:
+            if self.extremes is None:
+                self.extremes = value_range(self.levels[0])
+            return self.extremes
+
+    def preview_level(self, points):
+        """the finest level with at most ``points`` grid points"""
+        for level, shape in enumerate(self.shapes):
+            if np.prod(shape) <= points:
+                return level
+        return len(self.shapes) - 1
+
+
+class ContourCache:
+    """
+    Isosurface meshes (vtkPolyData) keyed by (file, channel, eps, level).
+    The least recently used ones are dropped once all of them take more
+    than ``max_bytes``; the newest mesh is always kept.
+    """
+    MAX_BYTES = 512 * 1024 ** 2
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.meshes = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+
+    def get(self, key):
+        """the mesh stored for ``key`` or None"""
+        if key not in self.meshes:
+            return None
+        self.meshes.move_to_end(key)
+        return self.meshes[key]
+
+    def put(self, key, mesh):
+        self.remove(key)
+        self.meshes[key] = mesh
+        # GetActualMemorySize is in KiB
+        self.sizes[key] = mesh.GetActualMemorySize() * 1024
+        self.total_bytes += self.sizes[key]
+        while self.total_bytes > self.max_bytes and len(self.meshes) > 1:
+            self.remove(next(iter(self.meshes)))
+
+    def remove(self, key):
+        if key in self.meshes:
+            del self.meshes[key]
+            self.total_bytes -= self.sizes.pop(key)
+
+    def discard(self, path):
+        """drop every mesh of the file ``path``, e.g. after its grids were edited"""
+        for key in [key for key in self.meshes if key[0] == path]:
+            self.remove(key)
+
+
+def tile_grid(grid, reps, out=None):
+    """
+    ``grid`` repeated ``reps`` (x, y, z) times, like np.tile, but written
+    into one Fortran-ordered array (``out`` if given) a slab at a time
+    """
+    nx, ny, nz = grid.shape
+    rx, ry, rz = reps
+    if out is None:
+        out = np.empty((nx * rx, ny * ry, nz * rz), dtype=grid.dtype, order="F")
+    for start, stop in slabs(grid.shape, grid.itemsize):
+        slab = grid[:, :, start:stop]
+        for i in range(rx):
+            for j in range(ry):
+                for k in range(rz):
+                    out[i * nx:(i + 1) * nx, j * ny:(j + 1) * ny, k * nz + start:k * nz + stop] = slab
+    return out